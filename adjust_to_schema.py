@@ -1,92 +1,100 @@
 import pandas as pd
 import numpy as np
 
+from storage import load_table, save_table
+from instrumentation import span
+
 # Load cleaned data
-transactions = pd.read_csv('data/transactions_cleaned.csv')
-commission = pd.read_csv('data/commission_cleaned.csv')
-user_info = pd.read_csv('data/user_info_cleaned.csv')
+with span('load_cleaned') as s:
+    transactions = load_table('transactions_cleaned')
+    commission = load_table('commission_cleaned')
+    user_info = load_table('user_info_cleaned')
+    s.rows_out = len(transactions)
 
 
 # 1. Transactions Sheet
+with span('transactions_schema', rows_in=len(transactions)) as s:
+    # Rename columns to match schema exactly (case and underscores)
+    transactions = transactions.rename(columns={
+        'user_id': 'user_id',
+        'order_id': 'order_id',
+        'date': 'Date',
+        'amount': 'Amount',
+        'merchant_id': 'Merchant_id',
+        'purchase_status': 'Purchase_status'
+    })
+
+    # Keep only required columns, drop extras
+    transactions = transactions[['user_id', 'order_id', 'Date', 'Amount', 'Merchant_id', 'Purchase_status']]
+
+    # Data type adjustments
+    transactions['user_id'] = transactions['user_id'].astype(int)
+    transactions['order_id'] = transactions['order_id'].astype(int)
+    transactions['Date'] = pd.to_datetime(transactions['Date'], errors='coerce').dt.normalize()
+    transactions['Amount'] = (
+        transactions['Amount']
+        .astype(str)
+        .str.replace(',', '', regex=False)
+        .str.strip()
+    )
+    transactions['Amount'] = pd.to_numeric(transactions['Amount'], errors='coerce').astype('Int64')
+    transactions['Merchant_id'] = transactions['Merchant_id'].astype(int)
+
+    # Standardize 'Purchase_status' values
+    transactions['Purchase_status'] = transactions['Purchase_status'].astype(object).replace({
+        'Purchase on behalf of someone': 'Mua hộ',
+        'Mua ho': 'Mua hộ',
+        'mua ho': 'Mua hộ',
+        'mua hộ': 'Mua hộ',
+        '': np.nan,
+        np.nan: np.nan
+    })
+    s.rows_out = len(transactions)
 
-# Rename columns to match schema exactly (case and underscores)
-transactions = transactions.rename(columns={
-    'user_id': 'user_id',
-    'order_id': 'order_id',
-    'date': 'Date',
-    'amount': 'Amount',
-    'merchant_id': 'Merchant_id',
-    'purchase_status': 'Purchase_status'
-})
-
-# Keep only required columns, drop extras
-transactions = transactions[['user_id', 'order_id', 'Date', 'Amount', 'Merchant_id', 'Purchase_status']]
-
-# Data type adjustments
-transactions['user_id'] = transactions['user_id'].astype(int)
-transactions['order_id'] = transactions['order_id'].astype(int)
-transactions['Date'] = pd.to_datetime(transactions['Date'], errors='coerce').dt.strftime('%Y-%m-%d')
-transactions['Amount'] = (
-    transactions['Amount']
-    .astype(str)
-    .str.replace(',', '', regex=False)
-    .str.strip()
-)
-transactions['Amount'] = pd.to_numeric(transactions['Amount'], errors='coerce').astype('Int64')
-transactions['Merchant_id'] = transactions['Merchant_id'].astype(int)
-
-# Standardize 'Purchase_status' values
-transactions['Purchase_status'] = transactions['Purchase_status'].replace({
-    'Purchase on behalf of someone': 'Mua hộ',
-    'Mua ho': 'Mua hộ',
-    'mua ho': 'Mua hộ',
-    'mua hộ': 'Mua hộ',
-    '': np.nan,
-    np.nan: np.nan
-})
 
 # 2. Commission Sheet
+with span('commission_schema', rows_in=len(commission)):
+    commission = commission.rename(columns={
+        'merchant_name': 'Merchant_name',
+        'merchant_id': 'Merchant_id',
+        'rate_pct': 'Rate_pct'
+    })
+    commission = commission[['Merchant_name', 'Merchant_id', 'Rate_pct']]
+    commission['Merchant_id'] = commission['Merchant_id'].astype(int)
+    commission['Rate_pct'] = pd.to_numeric(commission['Rate_pct'], errors='coerce').astype('Int64')
 
 
-commission = commission.rename(columns={
-    'merchant_name': 'Merchant_name',
-    'merchant_id': 'Merchant_id',
-    'rate_pct': 'Rate_pct'
-})
-commission = commission[['Merchant_name', 'Merchant_id', 'Rate_pct']]
-commission['Merchant_id'] = commission['Merchant_id'].astype(int)
-commission['Rate_pct'] = pd.to_numeric(commission['Rate_pct'], errors='coerce').astype('Int64')
-
 # 3. User_Info Sheet
-
-user_info = user_info.rename(columns={
-    'user_id': 'User_id',
-    'first_tran_date': 'First_tran_date',
-    'location': 'Location',
-    'age': 'Age',
-    'gender': 'Gender'
-})
-user_info = user_info[['User_id', 'First_tran_date', 'Location', 'Age', 'Gender']]
-
-user_info['User_id'] = user_info['User_id'].astype(int)
-user_info['First_tran_date'] = pd.to_datetime(user_info['First_tran_date'], errors='coerce').dt.strftime('%Y-%m-%d')
-
-# Harmonize Gender (capitalize, map variants)
-user_info['Gender'] = user_info['Gender'].replace({
-    'male': 'Male', 'MALE': 'Male', 'M': 'Male', 'Male_': 'Male', 'male_': 'Male',
-    'female': 'Female', 'FEMALE': 'Female', 'F': 'Female', 'female_': 'Female', 'FeMale_': 'Female',
-    'f': 'Female', '': np.nan, np.nan: np.nan
-})
-
-#  Harmonize Location
-user_info['Location'] = user_info['Location'].replace({
-    'Ho Chi Minh City': 'HCMC', 'Other Cities': 'Other', '': np.nan, np.nan: np.nan
-})
+with span('user_info_schema', rows_in=len(user_info)):
+    user_info = user_info.rename(columns={
+        'user_id': 'User_id',
+        'first_tran_date': 'First_tran_date',
+        'location': 'Location',
+        'age': 'Age',
+        'gender': 'Gender'
+    })
+    user_info = user_info[['User_id', 'First_tran_date', 'Location', 'Age', 'Gender']]
+
+    user_info['User_id'] = user_info['User_id'].astype(int)
+    user_info['First_tran_date'] = pd.to_datetime(user_info['First_tran_date'], errors='coerce').dt.normalize()
+
+    # Harmonize Gender (capitalize, map variants)
+    user_info['Gender'] = user_info['Gender'].astype(object).replace({
+        'male': 'Male', 'MALE': 'Male', 'M': 'Male', 'Male_': 'Male', 'male_': 'Male',
+        'female': 'Female', 'FEMALE': 'Female', 'F': 'Female', 'female_': 'Female', 'FeMale_': 'Female',
+        'f': 'Female', '': np.nan, np.nan: np.nan
+    })
+
+    #  Harmonize Location
+    user_info['Location'] = user_info['Location'].astype(object).replace({
+        'Ho Chi Minh City': 'HCMC', 'Other Cities': 'Other', '': np.nan, np.nan: np.nan
+    })
 
 
 # 4. Save to Final Schema Files
-
-transactions.to_csv('data/transactions_final.csv', index=False)
-commission.to_csv('data/commission_final.csv', index=False)
-user_info.to_csv('data/user_info_final.csv', index=False)
-print(" All data adjusted and saved to 'data/*_final.csv' according to required schemas.")
\ No newline at end of file
+with span('save_final', rows_in=len(transactions)):
+    # Partitioned by month, so month questions and appends read only their months
+    save_table(transactions, 'transactions_final', csv_copy=True, partition_by='Date')
+    save_table(commission, 'commission_final', csv_copy=True)
+    save_table(user_info, 'user_info_final', csv_copy=True)
+    print(" All data adjusted and saved to 'data/transactions_final/' and 'data/*_final.parquet' (+ CSV copies) according to required schemas.")
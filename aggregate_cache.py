@@ -0,0 +1,97 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# Server-side memoisation for the dashboard callbacks.
+# Results are keyed by normalised filter state, so the same selection made in
+# a different order (or "everything" selected explicitly) hits the same entry.
+# The cache is bounded by the approximate bytes its values hold, with
+# least-recently-used eviction, and keeps hit/miss counters so it can be sized
+# from production traffic.
+
+
+def normalise_filters(month_range=None, all_months=None, **selections):
+    # month_range: (first, last) month strings; a range covering all_months is "no filter"
+    # selections: dimension -> list of selected values; empty/None is "no filter"
+    months = None
+    if month_range is not None:
+        first, last = month_range
+        if not all_months or (first, last) != (all_months[0], all_months[-1]):
+            months = (first, last)
+    dims = tuple(sorted(
+        (dim, tuple(sorted(set(values))))
+        for dim, values in selections.items()
+        if values
+    ))
+    return months, dims
+
+
+def sizeof(value):
+    # Approximate bytes held by a cached value: Arrow tables and numpy arrays
+    # report their buffers, pandas frames their deep memory usage, figure JSON
+    # and series payloads are summed over their containers
+    if hasattr(value, 'memory_usage'):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class AggregateCache:
+
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Compute outside the lock; a concurrent miss on the same key just computes twice
+        value = compute()
+        size = sizeof(value)
+        with self._lock:
+            self.bytes += size - self._sizes.get(key, 0)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            # A value larger than the whole budget is returned but not kept
+            while self.bytes > self.max_bytes and self._entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self.bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
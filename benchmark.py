@@ -0,0 +1,368 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from storage import DATA_DIR
+
+# Pipeline benchmark on synthetic data.
+# generate() writes a deterministic MoMo-shaped dataset (same sheets, columns,
+# merchant/amount/age/location skew and dirty values as the hackathon
+# workbook) of any size into a work directory; run_benchmark() then runs the
+# pipeline scripts there one by one, each in a fresh process, and records wall
+# time, CPU time, peak RSS and rows/sec per stage in data/benchmarks/history.json.
+# An Excel sheet holds at most 1,048,576 rows, so larger datasets are written
+# directly in the cleaned-table layout and the cleaning stage is not run.
+
+BENCH_DIR = os.path.join(DATA_DIR, 'benchmarks')
+HISTORY_PATH = os.path.join(BENCH_DIR, 'history.json')
+WORKBOOK = 'mini-Hackathon-question.xlsx'
+SIZES = {'1M': 1_000_000, '10M': 10_000_000, '50M': 50_000_000}
+XLSX_MAX_ROWS = 1_048_575
+CHUNK_ROWS = 1_000_000
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = [
+    ('clean', 'data_cleaning.py'),
+    ('adjust_to_schema', 'adjust_to_schema.py'),
+    ('merge_master', 'merge_master_dataset.py'),
+    ('partA', 'hackathon_partA_answers.py'),
+    ('rollup_cube', 'rollup_cube.py'),
+    ('cohort_retention', 'cohort_retention.py'),
+    ('dashboard_store', 'dashboard_store.py'),
+    ('partC', 'partC_analysis_business_insights.py'),
+    ('export_offline_charts', 'export_offline_charts.py'),
+]
+
+# Distributions measured on the hackathon sample
+COMMISSION = pd.DataFrame({
+    'Merchant_name': ['Viettel', 'Mobifone', 'Vinaphone', 'Vietnamobile', 'Gmobile'],
+    'Merchant_id': [12, 13, 14, 15, 16],
+    'Rate_pct': [2, 3, 4, 4, 4],
+})
+MERCHANT_SHARE = [0.5022, 0.2803, 0.1720, 0.0453, 0.0002]
+AMOUNTS = [10000, 20000, 30000, 40000, 50000, 60000, 100000, 200000, 300000, 400000, 500000, 1000000]
+AMOUNT_SHARE = [0.2405, 0.2488, 0.0615, 0.0023, 0.2301, 0.0006, 0.1651, 0.0347, 0.0082, 0.0002, 0.0074, 0.0004]
+LOCATIONS = ['Other Cities', 'HCMC', 'HN', 'Other', 'Unknown', 'Ho Chi Minh City']
+LOCATION_SHARE = [0.4485, 0.3062, 0.1070, 0.0769, 0.0567, 0.0047]
+AGES = ['23_to_27', '28_to_32', 'unknown', '33_to_37', '18_to_22', '>37']
+AGE_SHARE = [0.2548, 0.2082, 0.1877, 0.1300, 0.1262, 0.0931]
+GENDERS = ['MALE', 'FEMALE', 'Male_', 'FeMale_', 'female', 'M', 'male', 'f']
+GENDER_SHARE = [0.4678, 0.2537, 0.1020, 0.0929, 0.0672, 0.0069, 0.0053, 0.0042]
+ON_BEHALF_SHARE = 0.1656
+# Dirty values: day-first dates the cleaner cannot parse, first transaction
+# dates in the year 9920, blank or zero amounts, repeated rows and users
+DAY_FIRST_DATE_SHARE = 0.0167
+FAR_FUTURE_FIRST_DATE_SHARE = 0.0055
+BLANK_AMOUNT_SHARE = 0.0005
+ZERO_AMOUNT_SHARE = 0.0005
+DUPLICATE_ROW_SHARE = 0.001
+DUPLICATE_USER_SHARE = 0.003
+
+
+def parse_rows(value):
+    return SIZES[value] if value in SIZES else int(value)
+
+
+def _pick(rng, values, shares, n):
+    shares = np.asarray(shares) / np.sum(shares)
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=n, p=shares)]
+
+
+def _date_strings(days, day_first):
+    iso = pd.DatetimeIndex(days).strftime('%Y-%m-%d').to_numpy(dtype=object)
+    if day_first.any():
+        d = pd.DatetimeIndex(days[day_first])
+        iso[day_first] = [f'{x.day}/{x.month}/{x.year}' for x in d]
+    return iso
+
+
+def generate_users(n_users, seed):
+    rng = np.random.default_rng([seed, 0])
+    user_ids = 100_000 + 3 * np.arange(n_users, dtype='int64')
+    first = np.datetime64('2016-01-01') + rng.integers(0, 5 * 365, n_users).astype('timedelta64[D]')
+    first_dates = pd.DatetimeIndex(first).strftime('%Y-%m-%d').to_numpy(dtype=object)
+    far = rng.random(n_users) < FAR_FUTURE_FIRST_DATE_SHARE
+    first_dates[far] = ['9920' + s[4:] for s in first_dates[far]]
+    users = pd.DataFrame({
+        'User_id': user_ids,
+        'First_tran_date': first_dates,
+        'Location': _pick(rng, LOCATIONS, LOCATION_SHARE, n_users),
+        'Age': _pick(rng, AGES, AGE_SHARE, n_users),
+        'Gender': _pick(rng, GENDERS, GENDER_SHARE, n_users),
+    })
+    # A few users are listed twice with different profile values
+    repeated = users[rng.random(n_users) < DUPLICATE_USER_SHARE].copy()
+    repeated['Age'] = _pick(rng, AGES, AGE_SHARE, len(repeated))
+    repeated['Gender'] = _pick(rng, GENDERS, GENDER_SHARE, len(repeated))
+    return pd.concat([users, repeated], ignore_index=True)
+
+
+def generate_transactions(rows, n_users, seed, chunk_rows=CHUNK_ROWS):
+    # Yields the transactions sheet in chunks; chunk i only depends on (seed, i)
+    month_weight = np.linspace(1.0, 2.0, 12)
+    day_of_year = np.arange(366)
+    day_weight = month_weight[pd.DatetimeIndex(np.datetime64('2020-01-01') + day_of_year.astype('timedelta64[D]')).month - 1]
+    day_weight = day_weight / day_weight.sum()
+    for i, start in enumerate(range(0, rows, chunk_rows)):
+        n = min(chunk_rows, rows - start)
+        rng = np.random.default_rng([seed, 1, i])
+        days = np.datetime64('2020-01-01') + rng.choice(day_of_year, size=n, p=day_weight).astype('timedelta64[D]')
+        amounts = _pick(rng, AMOUNTS, AMOUNT_SHARE, n).astype('int64')
+        amount_text = np.array([f'{a:,}' for a in amounts], dtype=object)
+        amount_text[rng.random(n) < ZERO_AMOUNT_SHARE] = '0'
+        amount_text[rng.random(n) < BLANK_AMOUNT_SHARE] = None
+        status = np.where(rng.random(n) < ON_BEHALF_SHARE, 'Purchase on behalf of someone', None)
+        chunk = pd.DataFrame({
+            'user_id': 100_000 + 3 * rng.integers(0, n_users, n),
+            'order_id': 4_166_562_735 + 7 * (start + np.arange(n, dtype='int64')) + rng.integers(0, 7, n),
+            'Date': _date_strings(days, rng.random(n) < DAY_FIRST_DATE_SHARE),
+            'Amount': amount_text,
+            'Merchant_id': _pick(rng, COMMISSION['Merchant_id'], MERCHANT_SHARE, n).astype('int64'),
+            'Purchase_status': status,
+        })
+        # Repeated rows: an exact copy of an earlier row of the chunk
+        repeat = np.flatnonzero(rng.random(n) < DUPLICATE_ROW_SHARE)
+        repeat = repeat[repeat > 0]
+        if len(repeat):
+            chunk.iloc[repeat] = chunk.iloc[repeat - 1].to_numpy()
+        yield chunk
+
+
+def _write_workbook(path, rows, n_users, seed):
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        for sheet_name, frames in [
+            ('Data Transactions', generate_transactions(rows, n_users, seed)),
+            ('Data Commission', [COMMISSION]),
+            ('Data User_Info', [generate_users(n_users, seed)]),
+        ]:
+            worksheet = workbook.add_worksheet(sheet_name)
+            row = 0
+            for frame in frames:
+                if row == 0:
+                    worksheet.write_row(0, 0, list(frame.columns))
+                    row = 1
+                for values in frame.itertuples(index=False):
+                    worksheet.write_row(row, 0, [None if v is None or v != v else v for v in values])
+                    row += 1
+    finally:
+        workbook.close()
+
+
+def _write_cleaned(data_dir, rows, n_users, seed):
+    # The cleaned-table layout data_cleaning.py would produce, for sizes that do
+    # not fit in a worksheet; dimension values stay raw, as after cleaning
+    from data_cleaning import clean_columns, parse_amount, parse_date, harmonize_user_info
+
+    writer = None
+    path = os.path.join(data_dir, 'transactions_cleaned.parquet')
+    try:
+        for chunk in generate_transactions(rows, n_users, seed):
+            chunk = parse_date(parse_amount(clean_columns(chunk)))
+            chunk = chunk.dropna(subset=['user_id', 'order_id', 'date', 'amount'])
+            chunk = chunk[chunk['amount'] > 0].drop_duplicates()
+            table = pa.Table.from_pandas(chunk.astype({'purchase_status': 'string'}), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    users = harmonize_user_info(clean_columns(generate_users(n_users, seed)))
+    users.to_parquet(os.path.join(data_dir, 'user_info_cleaned.parquet'), index=False)
+    clean_columns(COMMISSION.copy()).to_parquet(os.path.join(data_dir, 'commission_cleaned.parquet'), index=False)
+
+
+def generate(rows, workdir, seed=0):
+    # Returns True when the raw workbook was written, False for the cleaned layout
+    os.makedirs(os.path.join(workdir, 'data'), exist_ok=True)
+    marker = os.path.join(workdir, 'generated.json')
+    spec = {'rows': rows, 'seed': seed, 'workbook': rows <= XLSX_MAX_ROWS}
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == spec:
+                return spec['workbook']
+    n_users = max(1, int(rows * 0.99))
+    if spec['workbook']:
+        _write_workbook(os.path.join(workdir, WORKBOOK), rows, n_users, seed)
+    else:
+        _write_cleaned(os.path.join(workdir, 'data'), rows, n_users, seed)
+    with open(marker, 'w') as f:
+        json.dump(spec, f)
+    return spec['workbook']
+
+
+# Runs one script in the benchmark process's child and reports its resource use
+STAGE_RUNNER = '''
+import json, resource, runpy, sys, time
+repo, script, out = sys.argv[1:4]
+sys.path.insert(0, repo)
+sys.argv = [script]
+status, wall, cpu = 0, time.perf_counter(), time.process_time()
+try:
+    runpy.run_path(script, run_name='__main__')
+except SystemExit as e:
+    status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+# ru_maxrss survives exec on Linux (it would report the parent's peak), so the
+# process's own high-water mark is read from /proc where available
+try:
+    with open('/proc/self/status') as f:
+        peak = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+except OSError:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+with open(out, 'w') as f:
+    json.dump({'status': status, 'seconds': wall, 'cpu_seconds': cpu, 'peak_rss_mb': peak / 1024}, f)
+'''
+
+
+def run_stage(script, workdir, log_path):
+    result_path = os.path.join(workdir, '.stage_result.json')
+    if os.path.exists(result_path):
+        os.remove(result_path)
+    with open(log_path, 'w') as log:
+        code = subprocess.call(
+            [sys.executable, '-c', STAGE_RUNNER, REPO_DIR, os.path.join(REPO_DIR, script), result_path],
+            cwd=workdir, stdout=log, stderr=subprocess.STDOUT,
+        )
+    if not os.path.exists(result_path):
+        return {'status': code or 1}
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(rows, seed=0, workdir=None, stages=None):
+    workdir = os.path.abspath(workdir or os.path.join(BENCH_DIR, f'work-{rows}'))
+    start = time.perf_counter()
+    has_workbook = generate(rows, workdir, seed)
+    run = {
+        'run_id': time.strftime('%Y%m%d-%H%M%S'),
+        'commit': git_commit(),
+        'rows': rows,
+        'seed': seed,
+        'generate_seconds': round(time.perf_counter() - start, 3),
+        'stages': {},
+    }
+    log_dir = os.path.join(workdir, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    for name, script in STAGES:
+        if stages and name not in stages:
+            continue
+        if name == 'clean' and not has_workbook:
+            run['stages'][name] = {'status': 'skipped', 'reason': f'more than {XLSX_MAX_ROWS} rows do not fit in a worksheet'}
+            continue
+        result = run_stage(script, workdir, os.path.join(log_dir, f'{name}.log'))
+        if result['status'] != 0:
+            run['stages'][name] = {'status': 'failed', 'log': os.path.join(log_dir, f'{name}.log')}
+            print(f" {name} failed; see {run['stages'][name]['log']}")
+            break
+        run['stages'][name] = {
+            'status': 'ran',
+            'seconds': round(result['seconds'], 3),
+            'cpu_seconds': round(result['cpu_seconds'], 3),
+            'peak_rss_mb': round(result['peak_rss_mb'], 1),
+            'rows_per_sec': round(rows / result['seconds']) if result['seconds'] > 0 else None,
+        }
+        print(f" {name:<24}{result['seconds']:>9.2f} s{result['peak_rss_mb']:>10.0f} MB")
+    return run
+
+
+def load_history():
+    if not os.path.exists(HISTORY_PATH):
+        return []
+    with open(HISTORY_PATH) as f:
+        return json.load(f)
+
+
+def save_run(run):
+    history = load_history() + [run]
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    with open(HISTORY_PATH, 'w') as f:
+        json.dump(history, f, indent=2)
+    return history
+
+
+def compare(old, new, threshold=0.10, min_seconds=1.0):
+    # Stage metrics of new that are worse than old by more than threshold;
+    # stages faster than min_seconds in both runs are too noisy to judge on time
+    rows = []
+    for name, after in new['stages'].items():
+        before = old['stages'].get(name, {})
+        if after.get('status') != 'ran' or before.get('status') != 'ran':
+            continue
+        for metric in ['seconds', 'peak_rss_mb']:
+            if metric == 'seconds' and max(before[metric], after[metric]) < min_seconds:
+                continue
+            change = after[metric] / before[metric] - 1 if before[metric] else 0.0
+            rows.append({
+                'stage': name, 'metric': metric, 'before': before[metric], 'after': after[metric],
+                'change': round(change, 3), 'regression': change > threshold,
+            })
+    return pd.DataFrame(rows, columns=['stage', 'metric', 'before', 'after', 'change', 'regression'])
+
+
+def find_run(history, ref):
+    # A run id, or a negative position in the history (-1 = latest)
+    if ref.lstrip('-').isdigit() and int(ref) < 0:
+        return history[int(ref)]
+    for run in history:
+        if run['run_id'] == ref:
+            return run
+    raise KeyError(f"No benchmark run '{ref}' in {HISTORY_PATH}")
+
+
+def print_comparison(old, new, table):
+    print(f"\n{old['run_id']} ({old.get('commit')}) -> {new['run_id']} ({new.get('commit')}), {new['rows']:,} rows")
+    if table.empty:
+        print(" nothing to compare")
+        return
+    print(table.to_string(index=False))
+    flagged = table[table['regression']]
+    print(f"\n {len(flagged)} regression(s)" if len(flagged) else "\n no regressions")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic MoMo data.')
+    parser.add_argument('--rows', default='1M', help=f"transactions to generate: a number or one of {', '.join(SIZES)}")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='where to generate the data (default: data/benchmarks/work-<rows>)')
+    parser.add_argument('--stages', nargs='+', choices=[name for name, _ in STAGES], help='run only these stages')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two recorded runs (run ids or -2 -1) instead of running')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown flagged as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        history = load_history()
+        old, new = (find_run(history, ref) for ref in args.compare)
+    else:
+        rows = parse_rows(args.rows)
+        new = run_benchmark(rows, args.seed, args.workdir, args.stages)
+        history = save_run(new)
+        print(f" Recorded run {new['run_id']} in {HISTORY_PATH}")
+        previous = [r for r in history[:-1] if r['rows'] == new['rows'] and r['seed'] == new['seed']]
+        if not previous:
+            sys.exit(0)
+        old = previous[-1]
+
+    table = compare(old, new, args.threshold)
+    print_comparison(old, new, table)
+    sys.exit(1 if table['regression'].any() else 0)
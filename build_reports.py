@@ -0,0 +1,17 @@
+import argparse
+
+from report_writer import build_workbooks
+from export_offline_charts import write_dashboard_workbook
+import partC_analysis_business_insights
+
+# Builds the independent Excel reports side by side, one worker process each
+# (the pipeline runner does the same through its partC and
+# export_offline_charts stages).
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the Part C and dashboard workbooks in parallel.')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per workbook)')
+    args = parser.parse_args()
+
+    paths = build_workbooks([partC_analysis_business_insights.main, write_dashboard_workbook], workers=args.workers)
+    print(" Reports written: " + ', '.join(paths))
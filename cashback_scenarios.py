@@ -0,0 +1,117 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from storage import load_table
+
+# Batch cashback scenario simulator.
+# A scenario is a per-merchant rate table, optionally tiered by transaction
+# amount and capped per transaction. Transactions are first reduced to a
+# (merchant, amount) -> count profile; every scenario is then evaluated
+# against that profile in one vectorised pass, so the cost grows with
+# scenarios x distinct amounts rather than with the number of transactions.
+#
+# Scenario table columns:
+#   scenario       name of the scenario
+#   Merchant_name  merchant the rate applies to
+#   rate_pct       cashback rate in percent of the transaction amount
+#   min_amount     (optional) lower bound of the tier, default 0
+#   cap            (optional) maximum cashback per transaction in VND
+
+TELCO_MERCHANTS = ['Viettel', 'Mobifone', 'Vinaphone', 'Vietnamobile', 'Gmobile']
+CURRENT_RATE_PCT = 1
+BASELINE = 'current'
+
+
+def amount_profile(df):
+    # Transactions per (merchant, amount) plus each merchant's revenue
+    df = df.dropna(subset=['Merchant_name', 'Amount'])
+    profile = df.groupby(['Merchant_name', 'Amount'], observed=True).size().rename('count').reset_index()
+    revenue = df.groupby('Merchant_name', observed=True)['Revenue'].sum()
+    return profile, revenue
+
+
+def flat_scenario(name, rates, cap=None):
+    # {merchant: rate_pct} -> scenario rows, e.g. the Part C proposal table
+    return pd.DataFrame({
+        'scenario': name,
+        'Merchant_name': list(rates),
+        'rate_pct': [float(r) for r in rates.values()],
+        'min_amount': 0.0,
+        'cap': np.inf if cap is None else float(cap),
+    })
+
+
+def current_scenario():
+    return flat_scenario(BASELINE, {m: CURRENT_RATE_PCT for m in TELCO_MERCHANTS})
+
+
+def normalise_scenarios(scenarios):
+    scenarios = scenarios.copy()
+    if 'min_amount' not in scenarios.columns:
+        scenarios['min_amount'] = 0.0
+    if 'cap' not in scenarios.columns:
+        scenarios['cap'] = np.inf
+    scenarios['min_amount'] = scenarios['min_amount'].fillna(0).astype(float)
+    scenarios['cap'] = scenarios['cap'].fillna(np.inf).astype(float)
+    scenarios['rate_pct'] = scenarios['rate_pct'].astype(float)
+    scenarios['Merchant_name'] = scenarios['Merchant_name'].astype(str)
+
+    # Each tier runs up to the next tier's lower bound for the same scenario and merchant
+    scenarios = scenarios.sort_values(['scenario', 'Merchant_name', 'min_amount'], ignore_index=True)
+    scenarios['max_amount'] = (
+        scenarios.groupby(['scenario', 'Merchant_name'])['min_amount'].shift(-1).fillna(np.inf)
+    )
+    return scenarios
+
+
+def cashback_totals(scenarios, profile):
+    # Total cashback per scenario over the whole amount profile
+    profile = profile.assign(Merchant_name=profile['Merchant_name'].astype(str))
+    cells = scenarios.merge(profile, on='Merchant_name', how='inner')
+    amount = cells['Amount'].to_numpy('float64')
+    in_tier = (amount >= cells['min_amount'].to_numpy()) & (amount < cells['max_amount'].to_numpy())
+    per_tx = np.minimum(amount * cells['rate_pct'].to_numpy() / 100, cells['cap'].to_numpy())
+    cells['cashback'] = np.where(in_tier, per_tx * cells['count'].to_numpy(), 0.0)
+    totals = cells.groupby('scenario')['cashback'].sum()
+    # Scenarios whose merchants never transact still get a row
+    return totals.reindex(scenarios['scenario'].unique(), fill_value=0.0)
+
+
+def simulate(scenarios, profile, revenue, telco_merchants=TELCO_MERCHANTS):
+    scenarios = normalise_scenarios(scenarios)
+    if BASELINE not in set(scenarios['scenario']):
+        scenarios = pd.concat([normalise_scenarios(current_scenario()), scenarios], ignore_index=True)
+
+    totals = cashback_totals(scenarios, profile)
+    telco_revenue = float(revenue[revenue.index.isin(telco_merchants)].sum())
+    result = pd.DataFrame({
+        'scenario': totals.index,
+        'total_cashback': totals.to_numpy(),
+    })
+    result['additional_cost'] = result['total_cashback'] - totals[BASELINE]
+    result['pct_of_telco_revenue'] = result['total_cashback'] / telco_revenue * 100 if telco_revenue else np.nan
+    result = result.sort_values(['additional_cost', 'scenario'], ignore_index=True)
+    result.insert(0, 'rank', np.arange(1, len(result) + 1))
+    return result, telco_revenue
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare many cashback rate tables in one pass.')
+    parser.add_argument('scenarios', help='CSV with scenario, Merchant_name, rate_pct[, min_amount, cap] columns')
+    parser.add_argument('--output', default='data/cashback_scenarios.csv')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = load_table('transactions_with_revenue_userinfo', columns=['Merchant_name', 'Amount', 'Revenue'])
+    profile, revenue = amount_profile(df)
+    scenarios = pd.read_csv(args.scenarios)
+    result, telco_revenue = simulate(scenarios, profile, revenue)
+    result.to_csv(args.output, index=False)
+
+    print(result.head(10).to_string(index=False))
+    print(f"\n {len(result)} scenarios over {int(profile['count'].sum())} transactions "
+          f"({len(profile)} merchant/amount cells) in {time.perf_counter() - start:.2f}s")
+    print(f" Ranked comparison saved to {args.output}")
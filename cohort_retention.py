@@ -0,0 +1,152 @@
+import argparse
+import hashlib
+
+import pandas as pd
+
+from storage import load_table, save_table, append_table
+
+# Cohort retention: users grouped by the month of their first transaction
+# (First_tran_date's month), followed over the months since then (Period).
+# Cells are computed for every breakdown in one grouped pass over the rows
+# and cached in long form. A cohort's cells for a finished month never change,
+# so a new month only adds the new diagonal (one cell per cohort) and months
+# already cached are recomputed only if their rows changed: each month's cells
+# are stored with a content hash of every input column they depend on, so a
+# relabelled user attribute or a corrected first_tran_date invalidates them.
+
+CELLS_TABLE = 'cohort_retention'
+SIZES_TABLE = 'cohort_sizes'
+HASHES_TABLE = 'cohort_month_hashes'
+BREAKDOWNS = ['Age', 'Gender', 'Location']
+ALL = 'All'
+MEASURES = ['Users', 'Transactions', 'Revenue']
+INPUT_COLUMNS = ['user_id', 'Revenue', 'First_tran_date'] + BREAKDOWNS
+
+
+def stack_breakdowns(frame):
+    # One copy of the rows per breakdown, tagged (dimension, value), plus the whole
+    parts = [frame.assign(dimension=ALL, value=ALL)]
+    for dim in BREAKDOWNS:
+        if dim in frame.columns:
+            parts.append(frame.assign(dimension=dim, value=frame[dim].astype(object)))
+    return pd.concat(parts, ignore_index=True).dropna(subset=['value']).drop(columns=BREAKDOWNS, errors='ignore')
+
+
+def first_month(df):
+    return df['First_tran_date'].dt.to_period('M')
+
+
+def cohort_cells(df):
+    cohort = first_month(df)
+    month = df['Month']
+    period = (month.dt.year - cohort.dt.year) * 12 + (month.dt.month - cohort.dt.month)
+    # Rows dated before the user's first transaction (bad first_tran_date) have no place in a cohort
+    known = (period >= 0).fillna(False).astype(bool)
+    frame = pd.DataFrame({
+        'user_id': df.loc[known, 'user_id'],
+        'Revenue': df.loc[known, 'Revenue'],
+        'Cohort': cohort[known].astype(str),
+        'Month': month[known].astype(str),
+        'Period': period[known],
+    })
+    for dim in BREAKDOWNS:
+        if dim in df.columns:
+            frame[dim] = df.loc[known, dim]
+
+    cells = stack_breakdowns(frame).groupby(['dimension', 'value', 'Cohort', 'Month', 'Period']).agg(
+        Users=('user_id', 'nunique'),
+        Transactions=('user_id', 'count'),
+        Revenue=('Revenue', 'sum'),
+    )
+    return cells.reset_index().astype({'Period': 'int64', 'Revenue': 'float64'})
+
+
+def cohort_sizes(user_info):
+    # Users per first-transaction month, overall and per breakdown
+    frame = user_info[['User_id'] + [d for d in BREAKDOWNS if d in user_info.columns]].copy()
+    frame['Cohort'] = pd.to_datetime(user_info['First_tran_date'], errors='coerce').dt.to_period('M')
+    frame = frame.dropna(subset=['Cohort']).drop_duplicates(subset=['User_id'])
+    frame['Cohort'] = frame['Cohort'].astype(str)
+    sizes = stack_breakdowns(frame).groupby(['dimension', 'value', 'Cohort'])['User_id'].nunique()
+    return sizes.rename('Cohort Size').reset_index()
+
+
+def month_hashes(df):
+    # Month -> sha256 over the month's rows of every column the cells read
+    columns = [col for col in INPUT_COLUMNS if col in df.columns]
+    rows = pd.util.hash_pandas_object(df[columns], index=False)
+    months = df['Month'].astype(str).to_numpy()
+    hashes = {month: hashlib.sha256(h.to_numpy().tobytes()).hexdigest() for month, h in rows.groupby(months)}
+    return pd.DataFrame({'Month': list(hashes), 'hash': list(hashes.values())})
+
+
+def update_cells(df):
+    # Cached cells are reused for months whose input rows hash the same
+    try:
+        cached = load_table(CELLS_TABLE)
+        previous = load_table(HASHES_TABLE).set_index('Month')['hash']
+    except FileNotFoundError:
+        cached, previous = None, pd.Series(dtype=object)
+
+    hashes = month_hashes(df)
+    current = hashes.set_index('Month')['hash']
+    same = previous.reindex(current.index) == current
+    stale = list(current.index[~same.to_numpy(bool)])
+
+    fresh = cohort_cells(df[df['Month'].astype(str).isin(stale).to_numpy()]) if stale else None
+    keep = None if cached is None else cached[cached['Month'].isin(current.index) & ~cached['Month'].isin(stale)]
+    cells = pd.concat([c for c in (keep, fresh) if c is not None], ignore_index=True)
+    cells = cells.sort_values(['dimension', 'value', 'Cohort', 'Period'], ignore_index=True)
+    if stale or cached is None or len(cells) != len(cached):
+        save_table(cells, CELLS_TABLE)
+        save_table(hashes, HASHES_TABLE)
+    return cells, stale
+
+
+def append_cells(df):
+    # Incremental month append: the new month is exactly the new diagonal.
+    # Raises FileNotFoundError when the cells have never been built.
+    load_table(CELLS_TABLE, columns=['Month'])
+    append_table(cohort_cells(df), CELLS_TABLE)
+    append_table(month_hashes(df), HASHES_TABLE)
+
+
+def retention_matrix(cells, measure='Users', dimension=ALL, value=ALL, sizes=None):
+    # Cohort x Period matrix; with sizes, Users become a share of the cohort in percent
+    segment = cells[(cells['dimension'] == dimension) & (cells['value'] == str(value))]
+    matrix = segment.pivot_table(index='Cohort', columns='Period', values=measure, aggfunc='sum')
+    if sizes is not None:
+        size = sizes[(sizes['dimension'] == dimension) & (sizes['value'] == str(value))]
+        matrix = matrix.div(size.set_index('Cohort')['Cohort Size'].reindex(matrix.index), axis=0) * 100
+    return matrix
+
+
+def load_cohorts():
+    # Cached cells and sizes, computed on the fly for runs that predate the stage
+    try:
+        return load_table(CELLS_TABLE), load_table(SIZES_TABLE)
+    except FileNotFoundError:
+        return (cohort_cells(load_table('transactions_with_revenue_userinfo')),
+                cohort_sizes(load_table('user_info_final')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Update the cached cohort retention cells.')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the cached cells')
+    args = parser.parse_args()
+
+    df = load_table('transactions_with_revenue_userinfo',
+                    columns=['user_id', 'Month', 'Revenue', 'First_tran_date'] + BREAKDOWNS)
+    if args.rebuild:
+        cells = cohort_cells(df)
+        stale = sorted(cells['Month'].unique())
+        save_table(cells, CELLS_TABLE)
+        save_table(month_hashes(df), HASHES_TABLE)
+    else:
+        cells, stale = update_cells(df)
+    sizes = cohort_sizes(load_table('user_info_final'))
+    save_table(sizes, SIZES_TABLE)
+
+    print(f" Cohort cells: {len(cells)} ({cells['Cohort'].nunique()} cohorts); recomputed months: {stale or 'none'}")
+    print("\nUser retention (% of cohort), most recent cohorts:")
+    print(retention_matrix(cells, sizes=sizes).iloc[-6:, :12].round(1).to_string())
@@ -1,95 +1,319 @@
-import pandas as pd
+import os
+from functools import lru_cache
+from importlib.util import find_spec
+
 import plotly.express as px
-from dash import Dash, dcc, html, Input, Output
-
-# Load preprocessed data
-df = pd.read_csv('data/transactions_with_revenue_userinfo.csv')
-df['Date'] = pd.to_datetime(df['Date'])
-df['Month'] = df['Date'].dt.to_period('M').astype(str)
-
-# Print columns for debug
-print("Columns in df:", df.columns.tolist())
-
-# Column name handling for merchant name
-merchant_col = None
-for name in ['Merchant_name', 'merchant_name', 'Merchant', 'merchant']:
-    if name in df.columns:
-        merchant_col = name
-        break
-
-if merchant_col is None:
-    print(" Merchant name column not found. Merchant revenue chart will be skipped.")
-
-# Aggregate data for visuals
-monthly_revenue = df.groupby('Month')['Revenue'].sum().reset_index()
-monthly_transactions = df.groupby('Month')['user_id'].count().reset_index(name='Transactions')
-monthly_active_users = df.groupby('Month')['user_id'].nunique().reset_index(name='Active Users')
-monthly_new_users = df[df['Type_user'] == 'New'].groupby('Month')['user_id'].nunique().reset_index(name='New Users')
-
-app = Dash(__name__)
-
-app.layout = html.Div([
-    html.H1("MoMo Service Performance Dashboard"),
-
-    dcc.Dropdown(
-        id='metric-dropdown',
-        options=[
-            {'label': 'Monthly Revenue', 'value': 'Revenue'},
-            {'label': 'Number of Transactions', 'value': 'Transactions'},
-            {'label': 'Active Users', 'value': 'Active Users'},
-            {'label': 'New Users', 'value': 'New Users'}
-        ],
-        value='Revenue'
-    ),
-    dcc.Graph(id='main-metric-graph'),
-
-    html.H2("Revenue by Merchant"),
-    dcc.Graph(
-        id='merchant-graph',
-        figure=(
-            px.bar(
-                df.groupby(['Month', merchant_col])['Revenue'].sum().reset_index(),
-                x='Month', y='Revenue', color=merchant_col, barmode='group',
-                title='Monthly Revenue by Merchant'
-            ) if merchant_col else {}
-        )
-    ),
+import plotly.io as pio
+from dash import Dash, dcc, html, Input, Output, State
+from flask import jsonify
+
+from dashboard_store import DashboardStore, MERCHANT_COL
+from rollup_cube import MEASURES, rollup, monthly_series
+from aggregate_cache import AggregateCache, normalise_filters
+from cohort_retention import ALL, BREAKDOWNS, retention_matrix
+from user_bitmaps import UserIndex
+import instrumentation
+from instrumentation import span
+
+# Callback spans would append a log line per request; they are only recorded
+# when DASHBOARD_SPANS=1
+if os.environ.get('DASHBOARD_SPANS') != '1':
+    instrumentation.disable()
+
+# Precomputed aggregates are memory-mapped from data/dashboard_store/ (built by
+# dashboard_store.py), so importing this module does no aggregation and every
+# gunicorn worker shares the same read-only pages.
+with span('open_store'):
+    store = DashboardStore()
+merchant_col = MERCHANT_COL
+
+# Filtered cubes (as Arrow tables) and figures, memoised per worker up to
+# DASHBOARD_CACHE_MB (see /cache-stats)
+cache = AggregateCache(max_bytes=int(float(os.environ.get('DASHBOARD_CACHE_MB', 64)) * (1 << 20)))
+NO_FILTER = normalise_filters()
+
+FILTERS = [
+    ('merchant-filter', merchant_col, 'All merchants'),
+    ('age-filter', 'Age', 'All age groups'),
+    ('gender-filter', 'Gender', 'All genders'),
+    ('location-filter', 'Location', 'All locations'),
+]
+
+MONTHLY_METRICS = ['Revenue', 'Transactions', 'Active Users', 'New Users']
+
+# Responses are gzip/brotli-compressed when flask-compress is installed
+COMPRESS = find_spec('flask_compress') is not None
+
+
+@lru_cache(maxsize=None)
+def all_months():
+    return store.table('monthly')['Month'].to_pylist()
+
+
+def check_store():
+    # incremental_update.py rebuilds the store in place; this worker then drops
+    # its mapped tables, month list and cached figures instead of serving them
+    # until a restart. Called on page loads and filter changes.
+    if store.refresh():
+        all_months.cache_clear()
+        cache.clear()
+
+
+def filter_key(month_range, merchants, ages, genders, locations):
+    check_store()
+    months = all_months()
+    selected = None if month_range is None else (months[month_range[0]], months[month_range[1]])
+    return normalise_filters(
+        selected, months,
+        **{merchant_col: merchants, 'Age': ages, 'Gender': genders, 'Location': locations}
+    )
+
 
-    html.H2("Revenue by Age Group"),
-    dcc.Graph(
-        figure=px.bar(
-            df.groupby(['Month', 'Age'])['Revenue'].sum().reset_index(),
+def filtered_cube(key, columns=None):
+    # The filtered cells stay in Arrow; only the columns a rollup needs are converted
+    months, dims = key
+    table = cache.get_or_compute(('cube', key), lambda: store.filtered_table('cube', months, dims))
+    return (table.select(columns) if columns else table).to_pandas()
+
+
+def user_index():
+    return cache.get_or_compute('user_index', lambda: UserIndex(store.frame('user_bitmaps')))
+
+
+def source_frame(name, key):
+    # Unfiltered views come straight from the precomputed frames
+    if key == NO_FILTER:
+        return store.frame(name)
+    months, dims = key
+    if name == 'weekday_revenue':
+        # The weekday cube is Month x weekday: it follows the month range only
+        weekday = store.filtered_frame('weekday_cube', months)
+        return rollup(weekday, ['weekday'], distinct_users=False)[['weekday', 'Avg Revenue']]
+    if name == 'monthly':
+        return monthly_series(filtered_cube(key), where=dict(dims), users=user_index())
+    if name == 'merchant_revenue':
+        cube = filtered_cube(key, ['Month', merchant_col] + MEASURES)
+        return rollup(cube, ['Month', merchant_col], distinct_users=False)[['Month', merchant_col, 'Revenue']]
+    if name == 'age_revenue':
+        cube = filtered_cube(key, ['Month', 'Age'] + MEASURES)
+        return rollup(cube, ['Month', 'Age'], distinct_users=False)[['Month', 'Age', 'Revenue']]
+    raise KeyError(name)
+
+
+def monthly_columns(key=NO_FILTER):
+    # The four monthly series as one columnar payload; the browser switches
+    # between them without a round trip (see the clientside callback below)
+    monthly = source_frame('monthly', key)
+    data = {'Month': [str(month) for month in monthly['Month']]}
+    for metric in MONTHLY_METRICS:
+        data[metric] = monthly[metric].astype('float64').round(2).tolist()
+    return data
+
+
+@lru_cache(maxsize=None)
+def figure_template():
+    # Sent once per page instead of inside every main-metric figure
+    return pio.templates[px.defaults.template or pio.templates.default].to_plotly_json()
+
+
+def breakdown_figure(name, key=NO_FILTER):
+    if name == 'merchant':
+        return px.bar(
+            source_frame('merchant_revenue', key),
+            x='Month', y='Revenue', color=merchant_col, barmode='group',
+            title='Monthly Revenue by Merchant'
+        )
+    if name == 'age':
+        return px.bar(
+            source_frame('age_revenue', key),
             x='Month', y='Revenue', color='Age', barmode='group',
             title='Monthly Revenue by Age Group'
         )
-    ),
-
-    html.H2("Revenue by Day of Week (All Time)"),
-    dcc.Graph(
-        figure=px.bar(
-            df.groupby(df['Date'].dt.day_name())['Revenue'].mean().reset_index(),
-            x='Date', y='Revenue',
-            title='Average Revenue by Weekday'
+    if name == 'weekday':
+        _, dims = key
+        return px.bar(
+            source_frame('weekday_revenue', key),
+            x='weekday', y='Avg Revenue',
+            title='Average Revenue by Weekday' + (' (all merchants and users)' if dims else '')
         )
-    ),
-])
+    raise KeyError(name)
+
+
+def breakdown_figures(key=NO_FILTER):
+    # Figure JSON is built once per filter state and reused by every session
+    return [
+        cache.get_or_compute((name, key), lambda name=name: breakdown_figure(name, key).to_plotly_json())
+        for name in ['merchant', 'age', 'weekday']
+    ]
+
+
+COHORT_MEASURES = {
+    'Retention': 'Active users (% of cohort)',
+    'Users': 'Active users',
+    'Transactions': 'Transactions',
+    'Revenue': 'Revenue',
+}
+
+
+def cohort_segments():
+    cells = store.frame('cohort_sizes')
+    options = [{'label': 'All users', 'value': f'{ALL}|{ALL}'}]
+    for dim in BREAKDOWNS:
+        for value in sorted(cells.loc[cells['dimension'] == dim, 'value'].unique()):
+            options.append({'label': f'{dim}: {value}', 'value': f'{dim}|{value}'})
+    return options
+
+
+def cohort_figure(measure, segment):
+    dimension, value = segment.split('|', 1)
+    cells = store.frame('cohort_cells')
+    if measure == 'Retention':
+        matrix = retention_matrix(cells, 'Users', dimension, value, sizes=store.frame('cohort_sizes'))
+    else:
+        matrix = retention_matrix(cells, measure, dimension, value)
+    return px.imshow(
+        matrix, aspect='auto', color_continuous_scale='Blues',
+        labels={'x': 'Months since first transaction', 'y': 'First-transaction month', 'color': COHORT_MEASURES[measure]},
+        title=f'Cohort {COHORT_MEASURES[measure]}'
+    )
+
+
+def cohort_figure_json(measure, segment):
+    return cache.get_or_compute(('cohort', measure, segment), lambda: cohort_figure(measure, segment).to_plotly_json())
+
+
+def serve_layout():
+    check_store()
+    months = all_months()
+    merchant, age, weekday = breakdown_figures()
+    return html.Div([
+        html.H1("MoMo Service Performance Dashboard"),
+
+        html.Div([
+            dcc.RangeSlider(
+                id='month-range', min=0, max=len(months) - 1, step=1,
+                value=[0, len(months) - 1],
+                marks={i: month for i, month in enumerate(months)}
+            ),
+        ] + [
+            dcc.Dropdown(
+                id=component_id, multi=True, placeholder=placeholder,
+                options=[{'label': v, 'value': v} for v in store.values('cube', col)]
+            )
+            for component_id, col, placeholder in FILTERS
+        ]),
+
+        dcc.Dropdown(
+            id='metric-dropdown',
+            options=[
+                {'label': 'Monthly Revenue', 'value': 'Revenue'},
+                {'label': 'Number of Transactions', 'value': 'Transactions'},
+                {'label': 'Active Users', 'value': 'Active Users'},
+                {'label': 'New Users', 'value': 'New Users'}
+            ],
+            value='Revenue'
+        ),
+        # Unfiltered series and figures ship with the page; callbacks only run on changes
+        dcc.Store(id='monthly-series', data=cache.get_or_compute(('monthly', NO_FILTER), monthly_columns)),
+        dcc.Store(id='figure-template', data=figure_template()),
+        dcc.Graph(id='main-metric-graph'),
+
+        html.H2("Revenue by Merchant"),
+        dcc.Graph(id='merchant-graph', figure=merchant),
+
+        html.H2("Revenue by Age Group"),
+        dcc.Graph(id='age-graph', figure=age),
+
+        html.H2("Revenue by Day of Week"),
+        dcc.Graph(id='weekday-graph', figure=weekday),
+
+        html.H2("Cohort Retention"),
+        dcc.Dropdown(
+            id='cohort-measure',
+            options=[{'label': label, 'value': value} for value, label in COHORT_MEASURES.items()],
+            value='Retention'
+        ),
+        dcc.Dropdown(id='cohort-segment', options=cohort_segments(), value=f'{ALL}|{ALL}'),
+        dcc.Graph(id='cohort-graph', figure=cohort_figure_json('Retention', f'{ALL}|{ALL}')),
+    ])
+
+
+app = Dash(__name__, compress=COMPRESS)
+# A function layout is evaluated per page load, not at import time
+app.layout = serve_layout
+
+FILTER_INPUTS = [Input('month-range', 'value')] + [Input(component_id, 'value') for component_id, _, _ in FILTERS]
+
 
 @app.callback(
+    Output('monthly-series', 'data'),
+    FILTER_INPUTS,
+    prevent_initial_call=True
+)
+def update_monthly_series(month_range, merchants, ages, genders, locations):
+    with span('update_monthly_series'):
+        key = filter_key(month_range, merchants, ages, genders, locations)
+        return cache.get_or_compute(('monthly', key), lambda: monthly_columns(key))
+
+
+# Metric switching runs in the browser on the stored series
+app.clientside_callback(
+    """
+    function (metric, series, template) {
+        if (!metric || !series) {
+            return window.dash_clientside.no_update;
+        }
+        var x = series.Month, y = series[metric];
+        if (metric === 'New Users') {
+            x = x.filter(function (_, i) { return y[i] > 0; });
+            y = y.filter(function (v) { return v > 0; });
+        }
+        return {
+            data: [{
+                type: 'bar', x: x, y: y, marker: {color: '#636efa'},
+                hovertemplate: 'Month=%{x}<br>' + metric + '=%{y}<extra></extra>'
+            }],
+            layout: {
+                template: template,
+                title: {text: 'Monthly ' + metric},
+                xaxis: {title: {text: 'Month'}},
+                yaxis: {title: {text: metric}}
+            }
+        };
+    }
+    """,
     Output('main-metric-graph', 'figure'),
-    [Input('metric-dropdown', 'value')]
+    [Input('metric-dropdown', 'value'), Input('monthly-series', 'data')],
+    State('figure-template', 'data')
 )
-def update_main_metric(metric):
-    if metric == 'Revenue':
-        fig = px.bar(monthly_revenue, x='Month', y='Revenue', title='Monthly Revenue')
-    elif metric == 'Transactions':
-        fig = px.bar(monthly_transactions, x='Month', y='Transactions', title='Monthly Transactions')
-    elif metric == 'Active Users':
-        fig = px.bar(monthly_active_users, x='Month', y='Active Users', title='Monthly Active Users')
-    elif metric == 'New Users':
-        fig = px.bar(monthly_new_users, x='Month', y='New Users', title='Monthly New Users')
-    else:
-        fig = {}
-    return fig
+
+
+@app.callback(
+    [Output('merchant-graph', 'figure'), Output('age-graph', 'figure'), Output('weekday-graph', 'figure')],
+    FILTER_INPUTS,
+    prevent_initial_call=True
+)
+def update_breakdowns(month_range, merchants, ages, genders, locations):
+    with span('update_breakdowns'):
+        key = filter_key(month_range, merchants, ages, genders, locations)
+        return breakdown_figures(key)
+
+
+@app.callback(
+    Output('cohort-graph', 'figure'),
+    [Input('cohort-measure', 'value'), Input('cohort-segment', 'value')],
+    prevent_initial_call=True
+)
+def update_cohorts(measure, segment):
+    with span('update_cohorts'):
+        check_store()
+        return cohort_figure_json(measure, segment)
+
+
+@app.server.route('/cache-stats')
+def cache_stats():
+    # Counters are per worker process
+    return jsonify(dict(cache.stats(), pid=os.getpid()))
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,155 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from storage import DATA_DIR, load_table
+from incremental_update import AGGREGATES_TABLE
+from rollup_cube import load_cube, load_weekday_cube, rollup, monthly_series
+from user_bitmaps import load_user_index
+from cohort_retention import load_cohorts
+
+# Precomputed dashboard data in uncompressed Arrow IPC files.
+# Opening them with a memory map is zero-copy: gunicorn workers share the same
+# page-cache pages read-only instead of each parsing and holding its own copy,
+# so worker boot time and RSS do not grow with the number of transactions.
+
+STORE_DIR = os.path.join(DATA_DIR, 'dashboard_store')
+MERCHANT_COL = 'Merchant_name'
+
+
+def store_path(name):
+    return os.path.join(STORE_DIR, f'{name}.arrow')
+
+
+def build_frames(cube):
+    users = load_user_index()
+    try:
+        monthly = load_table(AGGREGATES_TABLE)
+    except FileNotFoundError:
+        monthly = monthly_series(cube, users=users)
+    weekday = load_weekday_cube()
+    cohort_cells, cohort_sizes = load_cohorts()
+    return {
+        'monthly': monthly,
+        'merchant_revenue': rollup(cube, ['Month', MERCHANT_COL], distinct_users=False)[['Month', MERCHANT_COL, 'Revenue']],
+        'age_revenue': rollup(cube, ['Month', 'Age'], distinct_users=False)[['Month', 'Age', 'Revenue']],
+        'weekday_revenue': rollup(weekday, ['weekday'], distinct_users=False)[['weekday', 'Avg Revenue']],
+        'cube': cube,
+        'weekday_cube': weekday,
+        # Per-month user sets for exact distinct users under filters
+        'user_bitmaps': users.bitmaps,
+        'cohort_cells': cohort_cells,
+        'cohort_sizes': cohort_sizes,
+    }
+
+
+def build_store():
+    os.makedirs(STORE_DIR, exist_ok=True)
+    frames = build_frames(load_cube())
+    for name, df in frames.items():
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # Write to a temp file and rename so running workers never see a partial file
+        tmp = store_path(name) + '.tmp'
+        with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, store_path(name))
+    return frames
+
+
+class DashboardStore:
+    # Read-only view over the store; each table is mapped on first access
+
+    def __init__(self):
+        self._tables = {}
+        self._frames = {}
+        self._months = {}
+        self.fallback = None
+        if not os.path.exists(store_path('monthly')):
+            print(" Dashboard store not found, building aggregates in memory (run dashboard_store.py)")
+            self.fallback = build_frames(load_cube())
+        self._version = self.version()
+
+    def version(self):
+        # Changes whenever build_store (also run by incremental_update.py) replaces a table
+        if self.fallback is not None:
+            return None
+        return max(os.stat(os.path.join(STORE_DIR, f)).st_mtime_ns for f in os.listdir(STORE_DIR) if f.endswith('.arrow'))
+
+    def refresh(self):
+        # Remaps the tables if the store was rebuilt since they were opened; True when it was
+        version = self.version()
+        if version == self._version:
+            return False
+        self._tables = {}
+        self._frames = {}
+        self._months = {}
+        self._version = version
+        return True
+
+    def table(self, name):
+        if name not in self._tables:
+            if self.fallback is not None:
+                self._tables[name] = pa.Table.from_pandas(self.fallback[name], preserve_index=False)
+            else:
+                self._tables[name] = pa.ipc.open_file(pa.memory_map(store_path(name), 'r')).read_all()
+        return self._tables[name]
+
+    def frame(self, name):
+        # Whole small tables (monthly series, cohorts, user bitmaps) are
+        # converted once per mapping, not on every call
+        if name not in self._frames:
+            self._frames[name] = self.table(name).to_pandas()
+        return self._frames[name]
+
+    def month_runs(self, name):
+        # [(month, start, stop)] when the table is sorted by Month (build_cube
+        # writes it that way), None otherwise
+        if name not in self._months:
+            months = self.table(name)['Month']
+            runs = None
+            if len(months) < 2 or pc.all(pc.greater_equal(months[1:], months[:-1])).as_py():
+                counts = pc.value_counts(months)
+                stops = np.cumsum(counts.field('counts').to_numpy())
+                starts = stops - counts.field('counts').to_numpy()
+                runs = list(zip(counts.field('values').to_pylist(), starts.tolist(), stops.tolist()))
+            self._months[name] = runs
+        return self._months[name]
+
+    def filtered_table(self, name, months=None, dims=()):
+        # Filters the mapped table without converting it; months is a
+        # (first, last) pair, dims a sequence of (column, values). A month
+        # range on a Month-sorted table is a zero-copy slice.
+        table = self.table(name)
+        masks = []
+        if months:
+            runs = self.month_runs(name)
+            if runs is not None:
+                selected = [(start, stop) for month, start, stop in runs if months[0] <= month <= months[1]]
+                start = selected[0][0] if selected else 0
+                table = table.slice(start, selected[-1][1] - start if selected else 0)
+            else:
+                masks.append(pc.greater_equal(table['Month'], months[0]))
+                masks.append(pc.less_equal(table['Month'], months[1]))
+        for col, values in dims:
+            masks.append(pc.is_in(table[col], value_set=pa.array(list(values))))
+        if masks:
+            combined = masks[0]
+            for mask in masks[1:]:
+                combined = pc.and_(combined, mask)
+            table = table.filter(combined)
+        return table
+
+    def filtered_frame(self, name, months=None, dims=(), columns=None):
+        # Converts only the matching rows (and the given columns) to pandas
+        table = self.filtered_table(name, months, dims)
+        return (table.select(columns) if columns else table).to_pandas()
+
+    def values(self, name, col):
+        return sorted(v for v in self.table(name)[col].unique().to_pylist() if v is not None)
+
+
+if __name__ == '__main__':
+    frames = build_store()
+    print(f" Dashboard store written to {STORE_DIR}/: " + ', '.join(f"{k} ({len(v)} rows)" for k, v in frames.items()))
@@ -1,120 +1,159 @@
+import argparse
+import os
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import os
+from pandas.io.parsers import TextParser
+from openpyxl import load_workbook
+
+from storage import save_table, TableWriter
+from workbook_cache import read_sheets, cached_sheet
+from dimension_index import DimensionIndex
+import order_index
+import date_dimension
+from instrumentation import span, iter_spans
+
+FILE_PATH = 'mini-Hackathon-question.xlsx'
+QUARANTINE_PATH = 'data/transactions_quarantine.csv'
+MUST_HAVE = ['user_id', 'order_id', 'date', 'amount']
+SHEETS = ['Data Transactions', 'Data Commission', 'Data User_Info']
+
+# Reason codes written to the quarantine file in streaming mode
+REASON_NULL_CRITICAL = 'null_critical_field'
+REASON_BAD_AMOUNT = 'unparseable_amount'
+REASON_BAD_DATE = 'unparseable_date'
+REASON_NON_POSITIVE = 'non_positive_amount'
+REASON_DUPLICATE = 'duplicate_row'
 
-# --- 1. Load Data ---
-file_path = 'mini-Hackathon-question.xlsx'
-transactions = pd.read_excel(file_path, sheet_name='Data Transactions')
-commission = pd.read_excel(file_path, sheet_name='Data Commission')
-user_info = pd.read_excel(file_path, sheet_name='Data User_Info')
 
 # --- 2. Standardize Column Names ---
 def clean_columns(df):
     df.columns = df.columns.str.strip().str.lower()
     return df
 
-transactions = clean_columns(transactions)
-commission = clean_columns(commission)
-user_info = clean_columns(user_info)
-
-print("\nLoaded, initial transactions shape:", transactions.shape)
-print("First few rows:\n", transactions.head())
 
 # --- 3. Clean and Convert 'amount' to Numeric ---
-if 'amount' in transactions.columns:
-    transactions['amount'] = (
-        transactions['amount']
-        .astype(str)
-        .str.replace(',', '', regex=False)
-        .str.strip()
-    )
-    transactions['amount'] = pd.to_numeric(transactions['amount'], errors='coerce')
-    print("\nAfter amount to_numeric, nulls:", transactions['amount'].isna().sum())
+def parse_amount(transactions):
+    if 'amount' in transactions.columns:
+        transactions['amount'] = (
+            transactions['amount']
+            .astype(str)
+            .str.replace(',', '', regex=False)
+            .str.strip()
+        )
+        transactions['amount'] = pd.to_numeric(transactions['amount'], errors='coerce')
+    return transactions
+
 
 # --- 4. Convert 'date' to datetime ---
-if 'date' in transactions.columns:
-    transactions['date'] = pd.to_datetime(transactions['date'], errors='coerce')
-    print("After date to_datetime, nulls:", transactions['date'].isna().sum())
-
-# --- 5. Remove Duplicates ---
-transactions = transactions.drop_duplicates()
-commission = commission.drop_duplicates()
-user_info = user_info.drop_duplicates()
-print("\nAfter dropping duplicates, transactions shape:", transactions.shape)
-
-# --- 6. Basic Null Diagnostics ---
-print("\nNull counts BEFORE dropping rows:")
-print(transactions.isnull().sum())
-
-# --- 7. Drop Rows with Missing Truly Critical Fields ---
-must_have = ['user_id', 'order_id', 'date', 'amount']
-transactions = transactions.dropna(subset=[col for col in must_have if col in transactions.columns])
-print("\nAfter dropping rows with missing critical fields, shape:", transactions.shape)
-
-# --- 8. Remove Zero/Negative Amounts ---
-if 'amount' in transactions.columns:
-    before = transactions.shape[0]
-    transactions = transactions[transactions['amount'] > 0]
-    print(f"Removed {before - transactions.shape[0]} rows with amount <= 0")
+def to_datetime(values, date_format=None):
+    # Unparseable dates become NaT, and so do dates outside the nanosecond range
+    # (e.g. a mistyped year 9918): pandas before 3.0 could not represent them,
+    # and pandas 3 parses them at a coarser resolution instead of coercing
+    dates = pd.to_datetime(values, errors='coerce', format=date_format)
+    return dates.where(dates.between(pd.Timestamp.min, pd.Timestamp.max))
+
+
+def parse_date(transactions, date_format=None):
+    if 'date' in transactions.columns:
+        transactions['date'] = to_datetime(transactions['date'], date_format)
+    return transactions
+
+
+def guess_date_format(dates):
+    # The format pd.to_datetime infers for a whole column: that of its first
+    # non-null string (None while there is none)
+    strings = dates[dates.map(lambda value: isinstance(value, str))]
+    return pd.tseries.api.guess_datetime_format(strings.iloc[0]) if len(strings) else None
+
 
 # --- 9. Categorical Harmonization ---
-# Gender
-if 'gender' in user_info.columns:
-    user_info['gender'] = user_info['gender'].replace({
-        'male': 'Male', 'MALE': 'Male', 'M': 'Male', 'male_': 'Male',
-        'female': 'Female', 'FEMALE': 'Female', 'F': 'Female', 'female_': 'Female',
-        'unknown': 'Unknown', '': 'Unknown', np.nan: 'Unknown'
-    })
-# Location
-if 'location' in user_info.columns:
-    user_info['location'] = user_info['location'].replace({
-        'Ho Chi Minh City': 'HCMC', 'Other Cities': 'Other', '': 'Unknown', np.nan: 'Unknown'
-    })
-    user_info['location'] = user_info['location'].fillna('Unknown')
-
-# Age (optional: harmonize 'unknown')
-if 'age' in user_info.columns:
-    user_info['age'] = user_info['age'].replace({'': 'Unknown', np.nan: 'Unknown'})
+def harmonize_user_info(user_info):
+    # Gender
+    if 'gender' in user_info.columns:
+        user_info['gender'] = user_info['gender'].replace({
+            'male': 'Male', 'MALE': 'Male', 'M': 'Male', 'male_': 'Male',
+            'female': 'Female', 'FEMALE': 'Female', 'F': 'Female', 'female_': 'Female',
+            'unknown': 'Unknown', '': 'Unknown', np.nan: 'Unknown'
+        })
+    # Location
+    if 'location' in user_info.columns:
+        user_info['location'] = user_info['location'].replace({
+            'Ho Chi Minh City': 'HCMC', 'Other Cities': 'Other', '': 'Unknown', np.nan: 'Unknown'
+        })
+        user_info['location'] = user_info['location'].fillna('Unknown')
+
+    # Age (optional: harmonize 'unknown')
+    if 'age' in user_info.columns:
+        user_info['age'] = user_info['age'].replace({'': 'Unknown', np.nan: 'Unknown'})
+
+    if 'first_tran_date' in user_info.columns:
+        user_info['first_tran_date'] = to_datetime(user_info['first_tran_date'])
+    return user_info
+
 
 # --- 10. Commission Data Types ---
-if 'rate_pct' in commission.columns:
-    commission['rate_pct'] = pd.to_numeric(commission['rate_pct'], errors='coerce')
+def clean_commission(commission):
+    if 'rate_pct' in commission.columns:
+        commission['rate_pct'] = pd.to_numeric(commission['rate_pct'], errors='coerce')
+    return commission
+
 
 # --- 11. Feature Engineering ---
-if 'date' in transactions.columns:
-    transactions['month'] = transactions['date'].dt.month
-    transactions['year'] = transactions['date'].dt.year
-    transactions['week'] = transactions['date'].dt.isocalendar().week
-    transactions['weekday'] = transactions['date'].dt.day_name()
+def add_date_features(transactions):
+    if 'date' in transactions.columns:
+        # Looked up per distinct day from the date dimension, with the month
+        # period used as tran_month by step 12
+        transactions = date_dimension.attach(
+            transactions, 'date', ['month', 'year', 'week', 'weekday', 'Month'], rename={'Month': 'tran_month'}
+        )
+    return transactions
+
 
 # --- 12. Merge First Transaction Date, User Type, Tenure ---
-if 'first_tran_date' in user_info.columns:
-    user_info['first_tran_date'] = pd.to_datetime(user_info['first_tran_date'], errors='coerce')
-if 'user_id' in transactions.columns and 'first_tran_date' in user_info.columns:
-    transactions = transactions.merge(
-        user_info[['user_id', 'first_tran_date']], on='user_id', how='left'
-    )
-    transactions['tenure_days'] = (transactions['date'] - transactions['first_tran_date']).dt.days
-    transactions['first_tran_month'] = transactions['first_tran_date'].dt.to_period('M')
-    transactions['tran_month'] = transactions['date'].dt.to_period('M')
-    transactions['type_user'] = np.where(
-        transactions['first_tran_month'] == transactions['tran_month'], 'New', 'Current'
-    )
-
-# --- 13. Transactions per User ---
-if 'user_id' in transactions.columns and 'order_id' in transactions.columns:
-    user_tx_count = transactions.groupby('user_id')['order_id'].count().rename('total_tx')
-    transactions = transactions.merge(user_tx_count, on='user_id', how='left')
+def user_index(user_info):
+    # Dense lookup when user_info lists every user once. A user listed more than
+    # once keeps the left-merge semantics: each of their transactions is matched
+    # once per listing, so the frame itself is returned for add_user_tenure to merge
+    if 'user_id' in user_info.columns and 'first_tran_date' in user_info.columns:
+        repeated = user_info['user_id'].duplicated()
+        if not repeated.any():
+            return DimensionIndex.from_frame(user_info, 'user_id', ['first_tran_date'])
+        print(f"{repeated.sum()} user_info rows repeat a user_id "
+              f"({user_info.loc[repeated, 'user_id'].nunique()} users); their transactions are matched once per row")
+        return user_info[['user_id', 'first_tran_date']]
+    return None
+
+
+def add_user_tenure(transactions, users):
+    if 'user_id' in transactions.columns and users is not None:
+        if isinstance(users, DimensionIndex):
+            transactions = users.enrich(transactions, on='user_id')
+        else:
+            transactions = transactions.merge(users, on='user_id', how='left')
+        transactions['tenure_days'] = (transactions['date'] - transactions['first_tran_date']).dt.days
+        transactions = date_dimension.attach(transactions, 'first_tran_date', ['Month'], rename={'Month': 'first_tran_month'})
+        transactions['type_user'] = np.where(
+            transactions['first_tran_month'] == transactions['tran_month'], 'New', 'Current'
+        )
+    return transactions
+
 
 # --- 14. Commission Mapping  ---
-if 'merchant_id' in transactions.columns and 'merchant_id' in commission.columns:
-    transactions = transactions.merge(
-        commission[['merchant_id', 'rate_pct']],
-        on='merchant_id', how='left'
-    )
-    if 'rate_pct' in transactions.columns:
-        transactions['revenue'] = transactions['amount'] * transactions['rate_pct'] / 100
+def merchant_index(commission):
+    if 'merchant_id' in commission.columns:
+        return DimensionIndex.from_frame(commission, 'merchant_id', ['rate_pct'])
+    return None
+
+
+def add_commission(transactions, merchants):
+    if 'merchant_id' in transactions.columns and merchants is not None:
+        transactions = merchants.enrich(transactions, on='merchant_id')
+        if 'rate_pct' in transactions.columns:
+            transactions['revenue'] = transactions['amount'] * transactions['rate_pct'] / 100
+    return transactions
+
 
 # --- 15. Data Dictionary Output ---
 def data_dictionary(df, name):
@@ -122,47 +161,336 @@ def data_dictionary(df, name):
     for col in df.columns:
         print(f"{col}: {df[col].dtype}, unique: {df[col].nunique()}, sample: {df[col].unique()[:5]}")
 
-print("\nFinal transactions shape:", transactions.shape)
-data_dictionary(transactions, 'transactions')
-data_dictionary(user_info, 'user_info')
-data_dictionary(commission, 'commission')
-
-# --- 16. Ensure 'data' directory exists before saving ---
-os.makedirs('data', exist_ok=True)
-
-# --- 17. Save Cleaned Data ---
-transactions.to_csv('data/transactions_cleaned.csv', index=False)
-commission.to_csv('data/commission_cleaned.csv', index=False)
-user_info.to_csv('data/user_info_cleaned.csv', index=False)
-print("\n Cleaned data saved to 'data/'")
 
 # --- 18. Visual Data Audit - Save Plots  ---
-if 'amount' in transactions.columns and not transactions['amount'].dropna().empty:
+def save_amount_hist(counts, edges):
     plt.figure(figsize=(8,4))
-    transactions['amount'].hist(bins=50)
+    plt.stairs(counts, edges, fill=True)
     plt.title('Transaction Amount Distribution')
     plt.xlabel('Amount (VND)')
     plt.ylabel('Count')
     plt.savefig('data/amount_hist.png')
     plt.close()
     print("Saved amount histogram.")
-else:
-    print("No data to plot for 'amount' distribution.")
-
-if 'weekday' in transactions.columns and not transactions['weekday'].dropna().empty:
-    weekday_counts = transactions['weekday'].value_counts().sort_index()
-    if not weekday_counts.empty:
-        plt.figure(figsize=(8,4))
-        weekday_counts.plot(kind='bar')
-        plt.title('Transactions by Weekday')
-        plt.xlabel('Weekday')
-        plt.ylabel('Number of Transactions')
-        plt.savefig('data/weekday_bar.png')
-        plt.close()
-        print("Saved weekday bar plot.")
-    else:
-        print("No transactions by weekday to plot.")
-else:
-    print("No data to plot for 'weekday' bar chart.")
-
-print("\n Data cleaning and feature engineering completed successfully!")
\ No newline at end of file
+
+
+def save_weekday_bar(weekday_counts):
+    plt.figure(figsize=(8,4))
+    weekday_counts.plot(kind='bar')
+    plt.title('Transactions by Weekday')
+    plt.xlabel('Weekday')
+    plt.ylabel('Number of Transactions')
+    plt.savefig('data/weekday_bar.png')
+    plt.close()
+    print("Saved weekday bar plot.")
+
+
+def run_batch(file_path, use_cache=True):
+    # --- 1. Load Data ---
+    # Parsed once per workbook version (see workbook_cache.py)
+    with span('01_load_data') as s:
+        transactions, commission, user_info = read_sheets(file_path, SHEETS, use_cache=use_cache).values()
+        s.rows_out = len(transactions)
+
+    # --- 2. Standardize Column Names ---
+    with span('02_standardize_columns'):
+        transactions = clean_columns(transactions)
+        commission = clean_columns(commission)
+        user_info = clean_columns(user_info)
+
+    print("\nLoaded, initial transactions shape:", transactions.shape)
+    print("First few rows:\n", transactions.head())
+
+    # --- 3. Clean and Convert 'amount' to Numeric ---
+    with span('03_parse_amount', rows_in=len(transactions)):
+        transactions = parse_amount(transactions)
+    if 'amount' in transactions.columns:
+        print("\nAfter amount to_numeric, nulls:", transactions['amount'].isna().sum())
+
+    # --- 4. Convert 'date' to datetime ---
+    with span('04_parse_date', rows_in=len(transactions)):
+        transactions = parse_date(transactions)
+    if 'date' in transactions.columns:
+        print("After date to_datetime, nulls:", transactions['date'].isna().sum())
+
+    # --- 5. Remove Duplicates ---
+    with span('05_drop_duplicates', rows_in=len(transactions)) as s:
+        transactions = transactions.drop_duplicates()
+        commission = commission.drop_duplicates()
+        user_info = user_info.drop_duplicates()
+        s.rows_out = len(transactions)
+    print("\nAfter dropping duplicates, transactions shape:", transactions.shape)
+
+    # --- 6. Basic Null Diagnostics ---
+    with span('06_null_diagnostics', rows_in=len(transactions)):
+        print("\nNull counts BEFORE dropping rows:")
+        print(transactions.isnull().sum())
+
+    # --- 7. Drop Rows with Missing Truly Critical Fields ---
+    with span('07_drop_missing_critical', rows_in=len(transactions)) as s:
+        transactions = transactions.dropna(subset=[col for col in MUST_HAVE if col in transactions.columns])
+        s.rows_out = len(transactions)
+    print("\nAfter dropping rows with missing critical fields, shape:", transactions.shape)
+
+    # --- 8. Remove Zero/Negative Amounts ---
+    with span('08_drop_non_positive', rows_in=len(transactions)) as s:
+        if 'amount' in transactions.columns:
+            before = transactions.shape[0]
+            transactions = transactions[transactions['amount'] > 0]
+            print(f"Removed {before - transactions.shape[0]} rows with amount <= 0")
+        s.rows_out = len(transactions)
+
+    # --- 9. Categorical Harmonization ---
+    with span('09_harmonize_user_info', rows_in=len(user_info)):
+        user_info = harmonize_user_info(user_info)
+
+    # --- 10. Commission Data Types ---
+    with span('10_commission_types'):
+        commission = clean_commission(commission)
+
+    # --- 11. Feature Engineering ---
+    with span('11_date_features', rows_in=len(transactions)):
+        transactions = add_date_features(transactions)
+
+    # --- 12. Merge First Transaction Date, User Type, Tenure ---
+    with span('12_user_tenure', rows_in=len(transactions)) as s:
+        transactions = add_user_tenure(transactions, user_index(user_info))
+        s.rows_out = len(transactions)
+
+    # --- 13. Transactions per User ---
+    with span('13_transactions_per_user', rows_in=len(transactions)):
+        if 'user_id' in transactions.columns and 'order_id' in transactions.columns:
+            user_tx_count = transactions.groupby('user_id')['order_id'].count().rename('total_tx').reset_index()
+            transactions = DimensionIndex.from_frame(user_tx_count, 'user_id').enrich(transactions, on='user_id')
+
+    # --- 14. Commission Mapping  ---
+    with span('14_commission_mapping', rows_in=len(transactions)) as s:
+        transactions = add_commission(transactions, merchant_index(commission))
+        s.rows_out = len(transactions)
+
+    # --- 15. Data Dictionary Output ---
+    with span('15_data_dictionary'):
+        print("\nFinal transactions shape:", transactions.shape)
+        data_dictionary(transactions, 'transactions')
+        data_dictionary(user_info, 'user_info')
+        data_dictionary(commission, 'commission')
+
+    # --- 16. Ensure 'data' directory exists before saving ---
+    with span('16_ensure_data_dir'):
+        os.makedirs('data', exist_ok=True)
+
+    # --- 17. Save Cleaned Data ---
+    with span('17_save_cleaned', rows_in=len(transactions)):
+        save_table(transactions, 'transactions_cleaned')
+        save_table(commission, 'commission_cleaned')
+        save_table(user_info, 'user_info_cleaned')
+        # A full load resets the set of loaded orders that incremental appends check against
+        if 'order_id' in transactions.columns:
+            order_index.save_index(transactions['order_id'])
+    print("\n Cleaned data saved to 'data/'")
+
+    # --- 18. Visual Data Audit - Save Plots  ---
+    with span('18_plots'):
+        if 'amount' in transactions.columns and not transactions['amount'].dropna().empty:
+            counts, edges = np.histogram(transactions['amount'].dropna(), bins=50)
+            save_amount_hist(counts, edges)
+        else:
+            print("No data to plot for 'amount' distribution.")
+
+        if 'weekday' in transactions.columns and not transactions['weekday'].dropna().empty:
+            weekday_counts = transactions['weekday'].value_counts().sort_index()
+            if not weekday_counts.empty:
+                save_weekday_bar(weekday_counts)
+            else:
+                print("No transactions by weekday to plot.")
+        else:
+            print("No data to plot for 'weekday' bar chart.")
+
+
+# ---------------- Streaming mode ----------------
+# Steps 3-14 run over fixed-size row chunks of the transactions sheet. Only
+# the small dimension sheets (commission, user_info) are held in memory; the
+# cross-chunk state is a sorted uint64 array of row hashes (dedup), the sorted
+# order_ids kept so far (for the order index) and a per-user transaction counter.
+
+def iter_sheet_chunks(file_path, sheet_name, chunksize, use_cache=True):
+    # An unchanged workbook whose sheet is already cached is served from the
+    # cached parse (see workbook_cache.py) instead of re-reading the xlsx
+    sheet = cached_sheet(file_path, sheet_name) if use_cache else None
+    if sheet is not None:
+        for start in range(0, len(sheet), chunksize):
+            yield sheet.iloc[start:start + chunksize].reset_index(drop=True)
+        return
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = list(next(rows))
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunksize:
+                # TextParser applies the same type inference as pd.read_excel
+                yield TextParser([header] + batch, header=0).read()
+                batch = []
+        if batch:
+            yield TextParser([header] + batch, header=0).read()
+    finally:
+        workbook.close()
+
+
+def split_rejects(chunk, date_format=None):
+    # Returns (valid rows, reason code per rejected row) for one parsed chunk
+    raw = chunk.copy()
+    chunk = parse_amount(chunk)
+    chunk = parse_date(chunk, date_format)
+    # Pin the types chunk by chunk: a chunk where a text column is entirely
+    # blank would otherwise be inferred as float and hash/write differently
+    for col in ['user_id', 'order_id', 'merchant_id']:
+        if col in chunk.columns:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+    if 'amount' in chunk.columns:
+        chunk['amount'] = chunk['amount'].astype('float64')
+    for col in chunk.columns:
+        if col == 'purchase_status' or pd.api.types.is_string_dtype(chunk[col]):
+            chunk[col] = chunk[col].astype('string')
+
+    reason = pd.Series(None, index=chunk.index, dtype=object)
+    critical = [col for col in MUST_HAVE if col in chunk.columns]
+    reason[chunk[critical].isna().any(axis=1)] = REASON_NULL_CRITICAL
+    if 'amount' in chunk.columns:
+        reason[chunk['amount'].isna() & raw['amount'].notna()] = REASON_BAD_AMOUNT
+        reason[reason.isna() & (chunk['amount'] <= 0)] = REASON_NON_POSITIVE
+    if 'date' in chunk.columns:
+        reason[chunk['date'].isna() & raw['date'].notna()] = REASON_BAD_DATE
+
+    rejected = raw[reason.notna()].assign(reject_reason=reason[reason.notna()])
+    chunk = chunk[reason.isna()]
+    return chunk.astype({col: 'int64' for col in ['user_id', 'order_id', 'merchant_id'] if col in chunk.columns}), rejected
+
+
+def write_quarantine(rejected, first):
+    rejected.to_csv(QUARANTINE_PATH, mode='w' if first else 'a', header=first, index=False)
+
+
+def run_stream(file_path, chunksize, use_cache=True):
+    # --- 1./2. Load the dimension sheets; transactions are read chunk by chunk ---
+    with span('01_load_dimensions'):
+        commission, user_info = read_sheets(file_path, SHEETS[1:], use_cache=use_cache).values()
+        commission = clean_columns(commission).drop_duplicates()
+        user_info = clean_columns(user_info).drop_duplicates()
+    # --- 9./10. Dimension cleaning ---
+    with span('09_10_dimension_cleaning', rows_in=len(user_info)):
+        user_info = harmonize_user_info(user_info)
+        commission = clean_commission(commission)
+        users, merchants = user_index(user_info), merchant_index(commission)
+
+    os.makedirs('data', exist_ok=True)
+    writer = TableWriter('transactions_cleaned')
+    seen_hashes = np.empty(0, dtype=np.uint64)
+    seen_orders = np.empty(0, dtype='int64')
+    user_tx = pd.Series(dtype='int64')
+    weekday_counts = pd.Series(dtype='int64')
+    amount_min, amount_max = np.inf, -np.inf
+    rows_in = 0
+    rejected_counts = {}
+    # Dates are parsed with the format inferred from the first chunk, as the
+    # batch path infers one format for the whole column
+    date_format = None
+
+    chunks = iter_spans(iter_sheet_chunks(file_path, SHEETS[0], chunksize, use_cache), '01_read_chunk')
+    for i, chunk in enumerate(chunks):
+        rows_in += len(chunk)
+        chunk = clean_columns(chunk)
+
+        # --- 3./4./7./8. Parse amount and date, reject invalid rows ---
+        with span('03_08_parse_and_reject', rows_in=len(chunk)) as s:
+            if date_format is None and 'date' in chunk.columns:
+                date_format = guess_date_format(chunk['date'].dropna())
+            chunk, rejected = split_rejects(chunk, date_format)
+            s.rows_out = len(chunk)
+
+        # --- 5. Remove duplicates against every earlier chunk ---
+        with span('05_drop_duplicates', rows_in=len(chunk)) as s:
+            hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+            pos = np.searchsorted(seen_hashes, hashes).clip(max=max(len(seen_hashes) - 1, 0))
+            duplicate = pd.Series(hashes, index=chunk.index).duplicated().to_numpy().copy()
+            if len(seen_hashes):
+                duplicate |= seen_hashes[pos] == hashes
+            rejected = pd.concat([rejected, chunk[duplicate].assign(reject_reason=REASON_DUPLICATE)])
+            chunk = chunk[~duplicate]
+            seen_hashes = np.union1d(seen_hashes, hashes[~duplicate])
+            # Like the batch path, a repeated order_id is kept (it is a
+            # validation warning); the ids only feed the persisted order index
+            if 'order_id' in chunk.columns:
+                seen_orders = order_index.add(seen_orders, chunk['order_id'])
+            s.rows_out = len(chunk)
+
+        with span('quarantine', rows_in=len(rejected)):
+            write_quarantine(rejected, first=(i == 0))
+            for reason, n in rejected['reject_reason'].value_counts().items():
+                rejected_counts[reason] = rejected_counts.get(reason, 0) + n
+
+        # --- 11./12./14. Feature engineering and dimension lookups ---
+        with span('11_12_14_features_and_lookups', rows_in=len(chunk)):
+            chunk = add_date_features(chunk)
+            chunk = add_user_tenure(chunk, users)
+            chunk = add_commission(chunk, merchants)
+
+        # --- 13. Per-user counts accumulate across chunks, attached on close ---
+        with span('13_accumulate_counts', rows_in=len(chunk)):
+            if 'user_id' in chunk.columns and 'order_id' in chunk.columns:
+                user_tx = user_tx.add(chunk.groupby('user_id')['order_id'].count(), fill_value=0).astype('int64')
+            if 'weekday' in chunk.columns:
+                weekday_counts = weekday_counts.add(chunk['weekday'].value_counts(), fill_value=0).astype('int64')
+            if 'amount' in chunk.columns and len(chunk):
+                amount_min = min(amount_min, chunk['amount'].min())
+                amount_max = max(amount_max, chunk['amount'].max())
+
+        with span('17_spool_chunk', rows_in=len(chunk)):
+            writer.write(chunk)
+        print(f"Chunk {i}: {len(chunk)} clean rows, {len(rejected)} quarantined")
+
+    # --- 17. Save cleaned data: second pass attaches total_tx and builds the histogram ---
+    hist_edges = np.linspace(amount_min, amount_max, 51) if np.isfinite(amount_min) else None
+    hist_counts = np.zeros(50, dtype='int64')
+
+    def finish_chunk(df):
+        if 'user_id' in df.columns and 'order_id' in df.columns:
+            df['total_tx'] = df['user_id'].map(user_tx)
+        if hist_edges is not None:
+            hist_counts[:] += np.histogram(df['amount'].dropna(), bins=hist_edges)[0]
+        return df
+
+    with span('17_save_cleaned', rows_in=writer.rows):
+        writer.close(transform=finish_chunk)
+        save_table(commission, 'commission_cleaned')
+        save_table(user_info, 'user_info_cleaned')
+        order_index.save_index(seen_orders)
+
+    print(f"\nRows read: {rows_in}, clean rows written: {writer.rows}")
+    print("Quarantined rows by reason:", rejected_counts or 'none')
+    print(f" Cleaned data saved to 'data/', rejected rows to {QUARANTINE_PATH}")
+
+    # --- 18. Visual Data Audit - Save Plots  ---
+    with span('18_plots'):
+        if hist_edges is not None:
+            save_amount_hist(hist_counts, hist_edges)
+        if not weekday_counts.empty:
+            save_weekday_bar(weekday_counts.sort_index())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Clean the MoMo hackathon workbook into data/*_cleaned tables.')
+    parser.add_argument('--input', default=FILE_PATH)
+    parser.add_argument('--stream', action='store_true',
+                        help='process the transactions sheet in fixed-size chunks with bounded memory')
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--no-cache', action='store_true', help='parse the workbook even if its sheets are cached')
+    args = parser.parse_args()
+
+    with span('data_cleaning'):
+        if args.stream:
+            run_stream(args.input, args.chunksize, use_cache=not args.no_cache)
+        else:
+            run_batch(args.input, use_cache=not args.no_cache)
+    print("\n Data cleaning and feature engineering completed successfully!")
@@ -1,61 +1,66 @@
+import argparse
+import sys
+
 import pandas as pd
 
-# Load cleaned data
-transactions = pd.read_csv('data/transactions_cleaned.csv')
-user_info = pd.read_csv('data/user_info_cleaned.csv')
-commission = pd.read_csv('data/commission_cleaned.csv')
-
-print("\n========== VALIDATION CHECK: TRANSACTIONS ==========\n")
-print(transactions.info())
-print(transactions.describe(include='all'))
-
-for col in transactions.select_dtypes(include='datetime').columns:
-    print(f"{col} min: {transactions[col].min()}, max: {transactions[col].max()}")
-print("Sample rows:\n", transactions.head())
-
-print("Nulls per column:\n", transactions.isnull().sum())
-print("Any negative or zero amounts?", (transactions['amount'] <= 0).sum())
-print("Unique purchase_status:", transactions['purchase_status'].unique() if 'purchase_status' in transactions.columns else "N/A")
-print("Outlier amounts (99.9th percentile):", transactions['amount'].quantile(0.999))
-
-# Check for invalid dates (future or NaT)
-if 'date' in transactions.columns:
-    print("Any future dates?", (pd.to_datetime(transactions['date'], errors='coerce') > pd.Timestamp.today()).sum())
-    print("Any invalid dates?", pd.to_datetime(transactions['date'], errors='coerce').isnull().sum())
-
-# User IDs in transactions vs user_info
-print("\n========== VALIDATION CHECK: USERS ==========\n")
-print(user_info.info())
-print(user_info.describe(include='all'))
-print("Sample rows:\n", user_info.head())
-print("Nulls per column:\n", user_info.isnull().sum())
-print("User IDs in transactions not in user_info:", set(transactions['user_id']) - set(user_info['user_id']))
-
-# Merchant IDs in transactions vs commission
-print("\n========== VALIDATION CHECK: COMMISSION ==========\n")
-print(commission.info())
-print(commission.describe(include='all'))
-print("Sample rows:\n", commission.head())
-print("Nulls per column:\n", commission.isnull().sum())
-print("Merchant IDs in transactions not in commission:", set(transactions['merchant_id']) - set(commission['merchant_id']))
-
-# Categorical sanity checks
-print("\n========== VALIDATION CHECK: CATEGORICALS ==========\n")
-if 'gender' in user_info.columns:
-    print("Gender values:", user_info['gender'].unique())
-if 'location' in user_info.columns:
-    print("Location sample:", user_info['location'].unique()[:10])
-
-# Logical checks
-if 'first_tran_date' in user_info.columns and 'date' in transactions.columns:
-    transactions['date'] = pd.to_datetime(transactions['date'], errors='coerce')
-    user_info['first_tran_date'] = pd.to_datetime(user_info['first_tran_date'], errors='coerce')
-    merged = pd.merge(
-        transactions[['user_id', 'date']],
-        user_info[['user_id', 'first_tran_date']],
-        on='user_id', how='left'
-    )
-    invalid = (merged['date'] < merged['first_tran_date']).sum()
-    print(f"Transactions before user's first transaction date: {invalid}")
-
-print("\n========== VALIDATION CHECK COMPLETE ==========\n")
\ No newline at end of file
+from validation import (
+    validate, write_report, print_report,
+    not_null, in_range, allowed_values, unique, foreign_key, date_not_before,
+)
+
+# Rules for the cleaned tables written by data_cleaning.py.
+# Known quirks of the source workbook that later stages resolve (duplicate
+# ids, raw gender spellings, implausible first-transaction dates) are warnings;
+# anything that would break the downstream merges is an error.
+
+RAW_PURCHASE_STATUS = ['Purchase on behalf of someone', 'Mua hộ', 'Mua ho', 'mua ho', 'mua hộ']
+RAW_GENDERS = ['Male', 'Female', 'male', 'female', 'MALE', 'FEMALE', 'M', 'F', 'f', 'Male_', 'male_', 'female_', 'FeMale_']
+LOCATIONS = ['HCMC', 'HN', 'Other', 'Unknown']
+AGES = ['18_to_22', '23_to_27', '28_to_32', '33_to_37', '>37', 'unknown']
+
+RULES = {
+    'transactions_cleaned': [
+        not_null('user_id'),
+        not_null('order_id'),
+        not_null('date'),
+        not_null('amount'),
+        not_null('merchant_id'),
+        unique('order_id', severity='warning'),
+        in_range('amount', min=1),
+        in_range('date', max=pd.Timestamp.today()),
+        allowed_values('purchase_status', RAW_PURCHASE_STATUS, severity='warning'),
+        foreign_key('user_id', 'user_info_cleaned', 'user_id'),
+        foreign_key('merchant_id', 'commission_cleaned', 'merchant_id'),
+        date_not_before('date', 'first_tran_date', key='user_id',
+                        ref_table='user_info_cleaned', ref_key='user_id', severity='warning'),
+    ],
+    'user_info_cleaned': [
+        not_null('user_id'),
+        unique('user_id', severity='warning'),
+        allowed_values('gender', RAW_GENDERS),
+        allowed_values('location', LOCATIONS),
+        allowed_values('age', AGES),
+        in_range('first_tran_date', max=pd.Timestamp.today(), severity='warning'),
+    ],
+    'commission_cleaned': [
+        not_null('merchant_id'),
+        not_null('rate_pct'),
+        unique('merchant_id'),
+        in_range('rate_pct', min=0, max=100),
+    ],
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Validate the cleaned tables.')
+    parser.add_argument('--chunksize', type=int, default=None, help='validate in chunks of this many rows')
+    args = parser.parse_args()
+
+    results = {table: validate(table, rules, chunksize=args.chunksize) for table, rules in RULES.items()}
+    report, ok = write_report('cleaned', results)
+    print_report(report)
+    empty = [table for table, v in results.items() if v.rows == 0]
+    if empty:
+        print(f" Empty tables: {empty}")
+    print(f"\n Validation {'passed' if ok and not empty else 'FAILED'}; report in data/validation/cleaned.json")
+    sys.exit(0 if ok and not empty else 1)
@@ -0,0 +1,121 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from storage import load_table, save_table
+from dimension_index import DimensionIndex
+
+# Calendar attributes per day.
+# A transaction's calendar fields (month, ISO week, weekday, holidays) depend
+# only on its day, and a dataset spans a few hundred distinct days, so the
+# fields are computed once per distinct day and attached to the rows through a
+# day key (days since 1970-01-01, int32) with a DimensionIndex lookup.
+# Part A stores the table covering the transactions as `date_dimension`.
+
+DATE_TABLE = 'date_dimension'
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Vietnamese public holidays on fixed solar dates
+FIXED_HOLIDAYS = {
+    (1, 1): "New Year's Day",
+    (4, 30): 'Reunification Day',
+    (5, 1): 'Labour Day',
+    (9, 2): 'National Day',
+}
+# Lunar holidays by year: first day of Tet (Lunar New Year) and Hung Kings'
+# Commemoration Day. Years outside these tables get no lunar holiday flags.
+TET = {
+    2018: '2018-02-16', 2019: '2019-02-05', 2020: '2020-01-25', 2021: '2021-02-12', 2022: '2022-02-01',
+    2023: '2023-01-22', 2024: '2024-02-10', 2025: '2025-01-29', 2026: '2026-02-17',
+}
+HUNG_KINGS = {
+    2018: '2018-04-25', 2019: '2019-04-14', 2020: '2020-04-02', 2021: '2021-04-21', 2022: '2022-04-10',
+    2023: '2023-04-29', 2024: '2024-04-18', 2025: '2025-04-07', 2026: '2026-04-26',
+}
+# The Tet holiday runs from New Year's Eve to the fourth day of the new year
+TET_DAYS = range(-1, 4)
+
+
+def day_keys(dates):
+    # int32 day key per date, -1 for missing dates
+    dates = pd.to_datetime(pd.Series(dates), errors='coerce')
+    keys = dates.to_numpy(dtype='datetime64[D]').astype('int64')
+    return np.where(dates.isna().to_numpy(), -1, keys).astype('int32')
+
+
+def holidays():
+    # Date -> holiday name for the years covered by the lunar tables
+    names = {}
+    for year in TET:
+        for (month, day), name in FIXED_HOLIDAYS.items():
+            names[pd.Timestamp(year, month, day)] = name
+        names[pd.Timestamp(HUNG_KINGS[year])] = "Hung Kings' Commemoration Day"
+        for offset in TET_DAYS:
+            names[pd.Timestamp(TET[year]) + pd.Timedelta(days=offset)] = 'Tet'
+    return pd.Series(names, dtype=object)
+
+
+def build_dates(keys):
+    # One row per distinct day key
+    keys = np.unique(np.asarray(keys, dtype='int64'))
+    keys = keys[keys >= 0]
+    days = pd.DatetimeIndex(keys.astype('datetime64[D]')).as_unit('us')
+    iso = days.isocalendar()
+    holiday = holidays().reindex(days)
+    return pd.DataFrame({
+        'day_key': keys.astype('int32'),
+        'date': days,
+        'Month': days.to_period('M'),
+        'year': days.year.astype('int32'),
+        'month': days.month.astype('int32'),
+        'iso_year': iso['year'].array,
+        'week': iso['week'].array,
+        'weekday': np.array(WEEKDAYS, dtype=object)[days.weekday],
+        'weekday_order': days.weekday.astype('int8'),
+        'is_weekend': days.weekday >= 5,
+        'is_holiday': holiday.notna().to_numpy(),
+        'is_tet': (holiday == 'Tet').to_numpy(),
+        'holiday': holiday.to_numpy(),
+    })
+
+
+def date_index(keys):
+    return DimensionIndex.from_frame(build_dates(keys), 'day_key')
+
+
+def attach(df, date_column, columns, rename=None, key_column=None):
+    # Adds the calendar columns for df[date_column] (as rename[column] when
+    # given), and the day key itself as key_column
+    keys = day_keys(df[date_column])
+    index = date_index(keys)
+    codes = index.codes(pd.Series(keys))
+    if key_column:
+        df[key_column] = keys
+    for col in columns:
+        df[(rename or {}).get(col, col)] = index.take(col, codes)
+    return df
+
+
+def save_dates(dates):
+    # Stores the calendar of every day from the first to the last date
+    keys = day_keys(dates)
+    keys = keys[keys >= 0]
+    table = build_dates(np.arange(keys.min(), keys.max() + 1)) if len(keys) else build_dates(keys)
+    save_table(table, DATE_TABLE)
+    return table
+
+
+def load_dates():
+    return load_table(DATE_TABLE)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show the stored date dimension.')
+    parser.add_argument('--holidays', action='store_true', help='only list holidays')
+    args = parser.parse_args()
+
+    table = load_dates()
+    if args.holidays:
+        table = table[table['is_holiday']]
+    print(table.to_string(index=False))
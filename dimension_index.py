@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+# Dense-code lookups for dimension tables (users, merchants).
+# A DimensionIndex maps each key of a dimension to its row position (a dense
+# code 0..n-1) and keeps the dimension's attributes as arrays aligned with
+# those codes. Attaching attributes to a fact table is then one key -> code
+# lookup plus one array take per column, instead of a hash merge that builds
+# a new frame. Integer keys over a compact range are looked up through a
+# direct position table; other keys go through a hash index built once.
+# Keys must be unique, which is the many-to-one guarantee of
+# pd.merge(..., validate='many_to_one'): an enrichment never adds rows.
+
+# Largest key span, relative to the number of keys, served by a direct table
+DENSE_SPAN_FACTOR = 8
+DENSE_SPAN_MIN = 1 << 16
+
+
+class DimensionIndex:
+
+    def __init__(self, keys, attributes, name='key'):
+        # keys: array of unique keys; attributes: {column: array aligned with keys}
+        self.name = name
+        self.keys = pd.Index(keys)
+        if not self.keys.is_unique:
+            dupes = self.keys[self.keys.duplicated()].unique()
+            raise ValueError(
+                f"{name} is not unique in the dimension ({len(dupes)} duplicated, e.g. {list(dupes[:5])}); "
+                "not a many-to-one lookup"
+            )
+        self.attributes = attributes
+        self._table = None
+        if pd.api.types.is_integer_dtype(self.keys) and len(self.keys) and not self.keys.hasnans:
+            lo, hi = int(self.keys.min()), int(self.keys.max())
+            if hi - lo < max(DENSE_SPAN_FACTOR * len(self.keys), DENSE_SPAN_MIN):
+                self._offset = lo
+                self._table = np.full(hi - lo + 1, -1, dtype='int64')
+                self._table[self.keys.to_numpy(dtype='int64') - lo] = np.arange(len(self.keys))
+
+    @classmethod
+    def from_frame(cls, df, key, columns=None):
+        columns = [c for c in df.columns if c != key] if columns is None else list(columns)
+        attributes = {col: df[col].array for col in columns}
+        return cls(df[key].to_numpy(), attributes, name=key)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def codes(self, keys):
+        # Dense code per key, -1 where the key is missing or not in the dimension
+        keys = pd.Series(keys) if not isinstance(keys, pd.Series) else keys
+        if self._table is None or not pd.api.types.is_integer_dtype(keys):
+            return self.keys.get_indexer(keys)
+        present = keys.notna().to_numpy()
+        pos = keys.to_numpy(dtype='int64', na_value=self._offset) - self._offset
+        inside = present & (pos >= 0) & (pos < len(self._table))
+        codes = np.full(len(keys), -1, dtype='int64')
+        codes[inside] = self._table[pos[inside]]
+        return codes
+
+    def take(self, column, codes):
+        # Attribute values for the given codes, missing where the code is -1
+        return pd.api.extensions.take(self.attributes[column], codes, allow_fill=True)
+
+    def enrich(self, fact, on, columns=None, codes=None):
+        # Adds the dimension's columns to fact in place (left-join semantics)
+        codes = self.codes(fact[on]) if codes is None else codes
+        for col in (self.attributes if columns is None else columns):
+            fact[col] = self.take(col, codes)
+        return fact
@@ -1,116 +1,138 @@
 import pandas as pd
 
-# ----------- STEP 1: Load Data -----------
-transactions = pd.read_csv('data/transactions_final.csv')
-commission = pd.read_csv('data/commission_final.csv')
-user_info = pd.read_csv('data/user_info_final.csv')
-
-print("\n--- Loaded files ---")
-print(f"transactions: {transactions.shape}")
-print(f"commission: {commission.shape}")
-print(f"user_info: {user_info.shape}")
-
-# Remove duplicates on keys
-commission = commission.drop_duplicates(subset=['Merchant_id'])
-user_info = user_info.drop_duplicates(subset=['User_id'])
-
-# Ensure numeric columns
-transactions['Amount'] = pd.to_numeric(transactions['Amount'], errors='coerce')
-commission['Rate_pct'] = pd.to_numeric(commission['Rate_pct'], errors='coerce')
-
-# Merge commission into transactions
-merged = pd.merge(
-    transactions,
-    commission[['Merchant_id', 'Rate_pct', 'Merchant_name']],
-    how='left',
-    left_on='Merchant_id',
-    right_on='Merchant_id'
-)
-
-print(f"\n--- After merge: merged shape = {merged.shape} ---")
-print("Sample merged rows:")
-print(merged.head(3))
-
-# ----------- STEP 2: Add Revenue column -----------
-merged['Revenue'] = merged['Amount'] * (merged['Rate_pct'] / 100)
-
-# Check for missing or NaN values in key columns
-print("\nMissing values after merge:")
-print(merged[['Amount', 'Rate_pct', 'Revenue']].isnull().sum())
-
-# Parse dates
-merged['Date'] = pd.to_datetime(merged['Date'], errors='coerce')
-
-# Check for parsing errors in Date
-print("\nDate parsing check:")
-print(merged['Date'].isnull().sum(), "rows have invalid Date after parsing.")
+from storage import load_table, drop_table, replace_partitions
+from incremental_update import ENRICHED_TABLE, build_state, enrich_month, first_month_state, monthly_aggregates
+import date_dimension
+import parallel_aggregate
+from instrumentation import span
+
+workers = parallel_aggregate.configured_workers()
+
+# ----------- STEP 1: Load the dimensions -----------
+# Transactions are never loaded whole: they are enriched one month partition
+# of transactions_final at a time below
+with span('01_load') as s:
+    commission = load_table('commission_final')
+    user_info = load_table('user_info_final')
+
+    print("\n--- Loaded files ---")
+    print(f"commission: {commission.shape}")
+    print(f"user_info: {user_info.shape}")
+
+    # Remove duplicates on keys
+    commission = commission.drop_duplicates(subset=['Merchant_id'])
+    user_info = user_info.drop_duplicates(subset=['User_id'])
+
+    # Ensure numeric columns
+    commission['Rate_pct'] = pd.to_numeric(commission['Rate_pct'], errors='coerce')
+    # Type_user compares each transaction's month with the user's first-transaction month
+    first_month = first_month_state(user_info)
+    s.rows_out = len(user_info)
+
+
+# ----------- STEP 2: Enrich month by month -----------
+# Each month gets its commission (Revenue), calendar and user columns through
+# the same enrich_month an incremental append uses, and is written as its
+# partition of the enriched table. Only the months Q1 and Q4 ask about are kept.
+with span('02_enrich_months') as s:
+    drop_table(ENRICHED_TABLE)
+    aggregates, bounds, rows, missing, invalid_dates = [], [], 0, 0, 0
+    jan2020 = dec2020 = None
+    for task in parallel_aggregate.month_tasks('transactions_final'):
+        month = parallel_aggregate.load_task('transactions_final', task)
+        month['Amount'] = pd.to_numeric(month['Amount'], errors='coerce')
+        enriched = enrich_month(month, commission, user_info, first_month)
+        replace_partitions(enriched, ENRICHED_TABLE, 'Date')
+
+        aggregates.append(monthly_aggregates(enriched))
+        bounds += [enriched['Date'].min(), enriched['Date'].max()]
+        missing += enriched[['Amount', 'Rate_pct', 'Revenue']].isnull().sum()
+        invalid_dates += enriched['Date'].isnull().sum()
+        if task is not None and task[0] == pd.Timestamp('2020-01-01'):
+            jan2020 = enriched
+        if task is not None and task[0] == pd.Timestamp('2020-12-01'):
+            dec2020 = enriched
+        rows += len(month)
+    s.rows_in = s.rows_out = rows
+
+    print(f"\n--- Enriched {rows} transactions in {len(aggregates)} month partitions ---")
+    print("\nMissing values after merge:")
+    print(missing)
+    print("\nDate parsing check:")
+    print(invalid_dates, "rows have invalid Date after parsing.")
+
+    # Calendar of every day the transactions cover (see date_dimension.py)
+    date_dimension.save_dates(pd.Series(bounds))
+
 
 # ----------- Q1: MoMo's total revenue in January 2020 -----------
-jan2020 = merged[merged['Date'].dt.to_period('M') == pd.Period('2020-01')]
+with span('Q1_revenue_jan2020') as s:
+    jan2020 = jan2020 if jan2020 is not None else enriched.iloc[:0]
+    s.rows_in = len(jan2020)
+
+    print("\n--- January 2020 rows ---")
+    print("Number of rows in Jan 2020:", len(jan2020))
+    print("Sample Jan 2020 rows:")
+    print(jan2020[['Date', 'Amount', 'Rate_pct', 'Revenue']].head(10))
+
+    # Check for missing Revenue in Jan 2020
+    print("Missing Revenue in Jan 2020:", jan2020['Revenue'].isnull().sum())
+
+    # Check for possible duplicate orders
+    jan2020_duplicates = jan2020.duplicated(subset=['order_id'])
+    print("Duplicate order_ids in Jan 2020:", jan2020_duplicates.sum())
+
+    total_revenue_jan2020 = jan2020['Revenue'].sum(min_count=1)
+    print(f"\n1. MoMo's total revenue in January 2020: {total_revenue_jan2020:,.0f} VND")
 
-print("\n--- January 2020 rows ---")
-print("Number of rows in Jan 2020:", len(jan2020))
-print("Sample Jan 2020 rows:")
-print(jan2020[['Date', 'Amount', 'Rate_pct', 'Revenue']].head(10))
 
-# Check for missing Revenue in Jan 2020
-print("Missing Revenue in Jan 2020:", jan2020['Revenue'].isnull().sum())
+# ----------- Q4: New users in Dec 2020 -----------
+with span('Q4_new_users') as s:
+    dec2020 = dec2020 if dec2020 is not None else enriched.iloc[:0]
+    s.rows_in = len(dec2020)
 
-# Check for possible duplicate orders
-jan2020_duplicates = jan2020.duplicated(subset=['order_id'])
-print("Duplicate order_ids in Jan 2020:", jan2020_duplicates.sum())
+    # Total number of new users in Dec 2020: the month's users whose first
+    # transaction falls in the same month
+    dec2020_new_users = dec2020.loc[
+        dec2020['First_tran_date'].dt.to_period('M') == pd.Period('2020-12'), 'user_id'
+    ].nunique()
+    print(f"\n4. Total number of new users in December 2020: {dec2020_new_users}")
+
+
+# ----------- Save results -----------
+with span('04_save'):
+    print("\nDetailed transactions with revenue and user info saved as data/transactions_with_revenue_userinfo/")
+
+    # Persist the monthly aggregates and first-transaction state for incremental month appends
+    build_state(pd.concat(aggregates, ignore_index=True), user_info)
+    print("Monthly aggregates and user first-transaction state saved for incremental updates")
 
-total_revenue_jan2020 = jan2020['Revenue'].sum(min_count=1)
-print(f"\n1. MoMo's total revenue in January 2020: {total_revenue_jan2020:,.0f} VND")
 
 # ----------- Q2: Most profitable month -----------
-merged['Month'] = merged['Date'].dt.to_period('M')
-revenue_by_month = merged.groupby('Month')['Revenue'].sum()
-most_profitable_month = revenue_by_month.idxmax()
-most_profitable_month_value = revenue_by_month.max()
-print(f"\n2. Most profitable month: {most_profitable_month} (Revenue: {most_profitable_month_value:,.0f} VND)")
+# Q2 and Q3 run month by month over the stored enriched table (see
+# parallel_aggregate.py), with $PIPELINE_WORKERS worker processes
+with span('Q2_profitable_month'):
+    revenue_by_month = parallel_aggregate.aggregate(
+        ENRICHED_TABLE, 'Month', {'Revenue': ('Revenue', 'sum')}, workers=workers
+    )['Revenue']
+    most_profitable_month = revenue_by_month.idxmax()
+    most_profitable_month_value = revenue_by_month.max()
+    print(f"\n2. Most profitable month: {most_profitable_month} (Revenue: {most_profitable_month_value:,.0f} VND)")
+
 
 # ----------- Q3: Day of week with most/least average revenue -----------
-merged['weekday'] = merged['Date'].dt.day_name()
-avg_revenue_by_weekday = merged.groupby('weekday')['Revenue'].mean()
-# Order weekdays for display
-weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-avg_revenue_by_weekday = avg_revenue_by_weekday.reindex(weekday_order)
-most_profitable_day = avg_revenue_by_weekday.idxmax()
-least_profitable_day = avg_revenue_by_weekday.idxmin()
-print("\n3. Average revenue by weekday:")
-print(avg_revenue_by_weekday)
-print(f"   Most profitable day: {most_profitable_day} ({avg_revenue_by_weekday.max():,.0f} VND)")
-print(f"   Least profitable day: {least_profitable_day} ({avg_revenue_by_weekday.min():,.0f} VND)")
-
-# ----------- Q4: Add user info & calculate new users in Dec 2020 -----------
-# Merge user info
-merged = pd.merge(
-    merged,
-    user_info[['User_id', 'Age', 'Gender', 'Location', 'First_tran_date']],
-    how='left',
-    left_on='user_id',
-    right_on='User_id'
-)
-
-# Add Type_user column
-merged['First_tran_date'] = pd.to_datetime(merged['First_tran_date'], errors='coerce')
-merged['tran_month'] = merged['Date'].dt.to_period('M')
-merged['first_tran_month'] = merged['First_tran_date'].dt.to_period('M')
-merged['Type_user'] = merged.apply(lambda row:
-                                   'New' if row['tran_month'] == row['first_tran_month'] else 'Current',
-                                   axis=1)
-
-# Calculate total number of new users in Dec 2020
-dec2020_new_users = merged[
-    (merged['tran_month'] == pd.Period('2020-12')) &
-    (merged['Type_user'] == 'New')
-]['user_id'].nunique()
-print(f"\n4. Total number of new users in December 2020: {dec2020_new_users}")
-
-# Save the fully processed transactions for reference
-merged.to_csv('data/transactions_with_revenue_userinfo.csv', index=False)
-print("\nDetailed transactions with revenue and user info saved as data/transactions_with_revenue_userinfo.csv")
+with span('Q3_weekday_revenue'):
+    avg_revenue_by_weekday = parallel_aggregate.aggregate(
+        ENRICHED_TABLE, 'weekday', {'Revenue': ('Revenue', 'mean')}, workers=workers
+    )['Revenue']
+    # Order weekdays for display
+    avg_revenue_by_weekday = avg_revenue_by_weekday.reindex(date_dimension.WEEKDAYS)
+    most_profitable_day = avg_revenue_by_weekday.idxmax()
+    least_profitable_day = avg_revenue_by_weekday.idxmin()
+    print("\n3. Average revenue by weekday:")
+    print(avg_revenue_by_weekday)
+    print(f"   Most profitable day: {most_profitable_day} ({avg_revenue_by_weekday.max():,.0f} VND)")
+    print(f"   Least profitable day: {least_profitable_day} ({avg_revenue_by_weekday.min():,.0f} VND)")
 
 
 summary_data = {
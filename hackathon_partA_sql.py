@@ -0,0 +1,154 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+from sql_backend import connect, register_tables, explain
+from date_dimension import WEEKDAYS
+from instrumentation import span
+
+# The Part A questions as SQL over the stored *_final tables (see sql_backend.py).
+# Each question reads only the columns it needs, and the month questions filter
+# on Date before the commission/user lookups, so the joined transaction table
+# is never materialised in Python; only the per-month / per-weekday results
+# come back to pandas. The answers are formatted exactly as
+# hackathon_partA_answers.py writes them to data/summary_results.csv, and
+# `--check` compares the two.
+
+SUMMARY_PATH = 'data/summary_results.csv'
+CHECK_PATH = 'data/validation/partA_sql.csv'
+TABLES = ['transactions_final', 'commission_final', 'user_info_final']
+
+# Same de-duplication as the pandas path: the first stored row per key wins
+REVENUE = """
+WITH commission AS (
+    SELECT Merchant_id, Rate_pct
+    FROM commission_final
+    QUALIFY row_number() OVER (PARTITION BY Merchant_id ORDER BY filename, file_row_number) = 1
+),
+revenue AS (
+    SELECT t.user_id, t.Date, t.Amount * (c.Rate_pct / 100) AS Revenue
+    FROM transactions_final t
+    LEFT JOIN commission c ON t.Merchant_id = c.Merchant_id
+)
+"""
+
+QUERIES = {
+    # Q1: revenue in January 2020 (NULL when no row has a revenue, like sum(min_count=1))
+    'jan2020_revenue': REVENUE + """
+SELECT sum(Revenue) AS revenue
+FROM revenue
+WHERE Date >= TIMESTAMP '2020-01-01' AND Date < TIMESTAMP '2020-02-01'
+""",
+    # Q2: revenue per month
+    'revenue_by_month': REVENUE + """
+SELECT strftime(Date, '%Y-%m') AS Month, coalesce(sum(Revenue), 0) AS revenue
+FROM revenue
+WHERE Date IS NOT NULL
+GROUP BY Month
+ORDER BY Month
+""",
+    # Q3: average revenue per weekday
+    'revenue_by_weekday': REVENUE + """
+SELECT dayname(Date) AS weekday, avg(Revenue) AS revenue
+FROM revenue
+WHERE Date IS NOT NULL
+GROUP BY weekday
+""",
+    # Q4: users whose first transaction month is December 2020 and who transacted then
+    'dec2020_new_users': """
+WITH users AS (
+    SELECT User_id, First_tran_date
+    FROM user_info_final
+    QUALIFY row_number() OVER (PARTITION BY User_id ORDER BY filename, file_row_number) = 1
+)
+SELECT count(DISTINCT t.user_id) AS users
+FROM transactions_final t
+JOIN users u ON t.user_id = u.User_id
+WHERE t.Date >= TIMESTAMP '2020-12-01' AND t.Date < TIMESTAMP '2021-01-01'
+  AND u.First_tran_date >= TIMESTAMP '2020-12-01' AND u.First_tran_date < TIMESTAMP '2021-01-01'
+""",
+}
+
+
+def answers(con):
+    with span('Q1_revenue_jan2020'):
+        jan2020 = con.execute(QUERIES['jan2020_revenue']).fetchone()[0]
+        total_revenue_jan2020 = float('nan') if jan2020 is None else jan2020
+
+    with span('Q2_profitable_month'):
+        revenue_by_month = con.execute(QUERIES['revenue_by_month']).df().set_index('Month')['revenue']
+        most_profitable_month = revenue_by_month.idxmax()
+        most_profitable_month_value = revenue_by_month.max()
+
+    # idxmax/idxmin over the Monday..Sunday order, as in the pandas path
+    with span('Q3_weekday_revenue'):
+        by_weekday = con.execute(QUERIES['revenue_by_weekday']).df().set_index('weekday')['revenue']
+        avg_revenue_by_weekday = by_weekday.astype('float64').reindex(WEEKDAYS)
+
+    with span('Q4_new_users'):
+        dec2020_new_users = con.execute(QUERIES['dec2020_new_users']).fetchone()[0]
+
+    return pd.DataFrame({
+        "Question": [
+            "MoMo's total revenue in January 2020",
+            "Most profitable month",
+            "Most profitable weekday (average revenue)",
+            "Least profitable weekday (average revenue)",
+            "Total number of new users in December 2020"
+        ],
+        "Answer": [
+            f"{total_revenue_jan2020:,.0f} VND",
+            f"{most_profitable_month} (Revenue: {most_profitable_month_value:,.0f} VND)",
+            f"{avg_revenue_by_weekday.idxmax()} ({avg_revenue_by_weekday.max():,.0f} VND)",
+            f"{avg_revenue_by_weekday.idxmin()} ({avg_revenue_by_weekday.min():,.0f} VND)",
+            dec2020_new_users
+        ]
+    })
+
+
+def compare(summary, path=SUMMARY_PATH):
+    # Answers side by side with the summary written by the pandas path, as the CSV text
+    expected = pd.read_csv(path, dtype=str, encoding='utf-8-sig')
+    actual = summary.astype(str)
+    diff = expected.merge(actual, on='Question', how='outer', suffixes=('_pandas', '_sql'), indicator=True)
+    diff['Match'] = (diff['_merge'] == 'both') & (diff['Answer_pandas'] == diff['Answer_sql'])
+    return diff.drop(columns='_merge')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Answer the Part A questions with SQL over the stored Parquet tables.')
+    parser.add_argument('--output', default=SUMMARY_PATH, help=f'summary CSV to write (default: {SUMMARY_PATH})')
+    parser.add_argument('--check', action='store_true',
+                        help=f'compare with the pandas answers in {SUMMARY_PATH} (report: {CHECK_PATH}) instead of writing')
+    parser.add_argument('--threads', type=int, default=None, help='DuckDB worker threads (default: all cores)')
+    parser.add_argument('--explain', action='store_true', help='print the query plans')
+    args = parser.parse_args()
+
+    with span('connect'):
+        con = register_tables(connect(args.threads), TABLES)
+    if args.explain:
+        for name, sql in QUERIES.items():
+            print(f"\n--- {name} ---\n{explain(con, sql)}")
+
+    summary = answers(con)
+    print(summary.to_string(index=False))
+
+    if args.check:
+        if not os.path.exists(SUMMARY_PATH):
+            print(f" No pandas summary at {SUMMARY_PATH}; run hackathon_partA_answers.py first")
+            sys.exit(1)
+        diff = compare(summary)
+        # Kept as the output of the pipeline's partA_sql_check stage
+        os.makedirs(os.path.dirname(CHECK_PATH), exist_ok=True)
+        diff.to_csv(CHECK_PATH, index=False, encoding='utf-8-sig')
+        mismatches = diff[~diff['Match']]
+        if len(mismatches):
+            print("\n SQL and pandas answers differ:")
+            print(mismatches[['Question', 'Answer_pandas', 'Answer_sql']].to_string(index=False))
+            sys.exit(1)
+        print(f"\n SQL answers match {SUMMARY_PATH}")
+    else:
+        summary.to_csv(args.output, index=False, encoding='utf-8-sig')
+        print(f"\n Summary results saved as: {args.output}")
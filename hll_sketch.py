@@ -0,0 +1,103 @@
+import math
+
+import numpy as np
+
+# HyperLogLog sketches for approximate distinct user counts.
+# A sketch is 2**precision one-byte registers; two sketches of the same
+# precision merge with an element-wise max, so distinct counts over any union
+# of months or segments come from the stored cells without the raw rows.
+# The relative standard error is about 1.04 / sqrt(2**precision).
+
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+
+def precision_for_error(error):
+    # Smallest precision whose standard error is within `error`
+    precision = math.ceil(math.log2((1.04 / error) ** 2))
+    return min(max(precision, MIN_PRECISION), MAX_PRECISION)
+
+
+def standard_error(precision):
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def hash_ids(ids):
+    # splitmix64 finaliser: spreads consecutive integer ids over all 64 bits
+    with np.errstate(over='ignore'):
+        h = np.asarray(ids).astype('int64').view('uint64') + np.uint64(0x9E3779B97F4A7C15)
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def leading_zeros(x):
+    # Vectorised count of leading zero bits of uint64 values (64 for zero)
+    n = np.zeros(len(x), dtype='uint8')
+    x = x.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = x < np.uint64(1 << (64 - shift))
+        n[high] += shift
+        x[high] <<= np.uint64(shift)
+    n[x == 0] = 64
+    return n
+
+
+def build_sketches(ids, groups, n_groups, precision):
+    # One sketch per group: ids[i] is added to the sketch of groups[i]
+    ids = np.asarray(ids)
+    groups = np.asarray(groups)
+    keep = ~np.isnan(ids) if ids.dtype.kind == 'f' else np.ones(len(ids), dtype=bool)
+    h = hash_ids(ids[keep])
+    m = 1 << precision
+    register = (h >> np.uint64(64 - precision)).astype('int64')
+    # Rank of the first set bit in the remaining bits, capped for all-zero tails
+    rank = np.minimum(leading_zeros(h << np.uint64(precision)) + 1, 64 - precision + 1).astype('uint8')
+    sketches = np.zeros(n_groups * m, dtype='uint8')
+    np.maximum.at(sketches, groups[keep].astype('int64') * m + register, rank)
+    return sketches.reshape(n_groups, m)
+
+
+def merge(sketches, groups=None):
+    # Register-wise maximum of the sketches, or per group: one row per distinct
+    # value of groups, in sorted order
+    sketches = np.asarray(sketches)
+    if groups is None:
+        return np.maximum.reduce(sketches, axis=0)
+    groups = np.asarray(groups)
+    order = np.argsort(groups, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(groups[order]) != 0])
+    return np.maximum.reduceat(sketches[order], starts, axis=0)
+
+
+def estimate(sketches):
+    # Cardinality estimate per row of a (n, 2**precision) register array
+    sketches = np.atleast_2d(sketches)
+    m = sketches.shape[1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.exp2(-sketches.astype('float64')).sum(axis=1)
+    zeros = (sketches == 0).sum(axis=1)
+    # Linear counting is more accurate while many registers are still empty
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / zeros)
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+def to_bytes(sketches):
+    return [row.tobytes() for row in sketches]
+
+
+def from_bytes(values):
+    # Inverse of to_bytes; all sketches must share one precision
+    values = list(values)
+    if not values:
+        return np.zeros((0, 1 << MIN_PRECISION), dtype='uint8')
+    m = len(values[0])
+    return np.frombuffer(b''.join(values), dtype='uint8').reshape(len(values), m)
+
+
+def sketch_precision(values):
+    # Precision of serialised sketches, None when there are none
+    for value in values:
+        return int(math.log2(len(value)))
+    return None
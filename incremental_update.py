@@ -0,0 +1,156 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from storage import DATA_DIR, load_table, save_table, append_table
+from schema import REDUNDANT_COLUMNS
+from rollup_cube import CUBE_TABLE, WEEKDAY_TABLE, build_cubes, cube_layout
+from user_bitmaps import append_index
+from dimension_index import DimensionIndex
+import order_index
+import date_dimension
+import cohort_retention
+from merge_master_dataset import merge_master
+
+# Incremental month-append mode.
+# A full Part A run persists the per-month aggregates and every user's first
+# transaction month. A newly delivered month is then enriched on its own,
+# appended to transactions_final, master_merged, the enriched transactions and
+# the rollup cube and folded into the aggregates, so the cost depends on the
+# size of the new month rather than on the whole history.
+# (A full pipeline run rebuilds everything from the workbook again.)
+
+AGGREGATES_TABLE = 'monthly_aggregates'
+FIRST_MONTH_TABLE = 'user_first_month'
+ENRICHED_TABLE = 'transactions_with_revenue_userinfo'
+
+
+def monthly_aggregates(df):
+    month = df['Month'].astype(str)
+    new_rows = df['Type_user'] == 'New'
+    aggregates = pd.DataFrame({
+        'Revenue': df.groupby(month)['Revenue'].sum(),
+        'Transactions': df.groupby(month)['user_id'].count(),
+        'Active Users': df.groupby(month)['user_id'].nunique(),
+        'New Users': df[new_rows].groupby(month[new_rows])['user_id'].nunique(),
+    })
+    aggregates['New Users'] = aggregates['New Users'].fillna(0).astype('int64')
+    return aggregates.reset_index()
+
+
+def first_month_state(user_info):
+    return pd.DataFrame({
+        'user_id': user_info['User_id'],
+        'first_tran_month': pd.to_datetime(user_info['First_tran_date'], errors='coerce').dt.to_period('M'),
+    }).drop_duplicates(subset=['user_id'])
+
+
+def build_state(aggregates, user_info):
+    # Called at the end of a full Part A run with the monthly_aggregates of every month
+    save_table(aggregates, AGGREGATES_TABLE)
+    save_table(first_month_state(user_info), FIRST_MONTH_TABLE)
+
+
+def read_month_file(path):
+    # New months arrive in the transactions_final schema (CSV or Parquet)
+    df = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce').dt.normalize()
+    df['Amount'] = pd.to_numeric(
+        df['Amount'].astype(str).str.replace(',', '', regex=False).str.strip(), errors='coerce'
+    ).astype('Int64')
+    return df
+
+
+def enrich_month(transactions, commission, user_info, first_month):
+    # Same columns and lookup semantics as hackathon_partA_answers.py
+    merged = DimensionIndex.from_frame(commission, 'Merchant_id', ['Rate_pct', 'Merchant_name']).enrich(
+        transactions, on='Merchant_id'
+    )
+    merged['Revenue'] = merged['Amount'] * (merged['Rate_pct'] / 100)
+    merged = date_dimension.attach(merged, 'Date', ['Month', 'weekday'], key_column='day_key')
+    DimensionIndex.from_frame(user_info, 'User_id', ['Age', 'Gender', 'Location', 'First_tran_date']).enrich(
+        merged, on='user_id'
+    )
+    merged['tran_month'] = merged['Month']
+    # Type_user comes from the persisted first-transaction state
+    DimensionIndex.from_frame(first_month, 'user_id', ['first_tran_month']).enrich(merged, on='user_id')
+    merged['Type_user'] = np.where(merged['tran_month'] == merged['first_tran_month'], 'New', 'Current')
+    return merged.drop(columns=REDUNDANT_COLUMNS, errors='ignore')
+
+
+def append_month(path):
+    new = read_month_file(path)
+    months = new['Date'].dt.to_period('M').dropna().unique()
+    if len(months) != 1:
+        raise ValueError(f"{path} must contain exactly one month of transactions, found {len(months)}")
+    month = str(months[0])
+
+    aggregates = load_table(AGGREGATES_TABLE)
+    if month in aggregates['Month'].values:
+        raise ValueError(f"Month {month} is already loaded; run the full pipeline to restate it")
+
+    commission = load_table('commission_final').drop_duplicates(subset=['Merchant_id'])
+    user_info = load_table('user_info_final').drop_duplicates(subset=['User_id'])
+    first_month = load_table(FIRST_MONTH_TABLE)
+
+    # Users delivered with a newer user_info extend the first-transaction state
+    missing = ~user_info['User_id'].isin(first_month['user_id'])
+    if missing.any():
+        first_month = pd.concat([first_month, first_month_state(user_info[missing])], ignore_index=True)
+        save_table(first_month, FIRST_MONTH_TABLE)
+
+    # Orders already loaded (a re-delivered or overlapping file) are quarantined,
+    # checked against the persisted order_id index rather than the stored months
+    seen = order_index.load_index(table=ENRICHED_TABLE)
+    new, repeated = order_index.split_duplicates(new, seen)
+    if len(repeated):
+        quarantine_path = os.path.join(DATA_DIR, f'transactions_quarantine_{month}.csv')
+        repeated.to_csv(quarantine_path, index=False)
+        print(f" {len(repeated)} rows repeat an already loaded order_id; quarantined to {quarantine_path}")
+    if new.empty:
+        raise ValueError(f"Every order in {path} is already loaded")
+
+    # The month joins the tables the full pipeline derives the enriched table
+    # from, so the runner sees their inputs change and a later full run (or a
+    # re-run of any stage reading them) includes it
+    append_table(new, 'transactions_final', csv_copy=True)
+    append_table(merge_master(new.copy(), commission, user_info), 'master_merged', csv_copy=True)
+
+    enriched = enrich_month(new, commission, user_info, first_month)
+    append_table(enriched, ENRICHED_TABLE)
+    # Cube cells are keyed by month, so the new month's cells are simply appended,
+    # built with the same sketch precision as the stored cells
+    cube, weekday = build_cubes(enriched, **cube_layout(load_table(CUBE_TABLE)))
+    append_table(cube, CUBE_TABLE)
+    append_table(weekday, WEEKDAY_TABLE)
+    # The month's user bitmaps too, when the index has been built
+    try:
+        append_index(enriched)
+    except FileNotFoundError:
+        pass
+    # and the new diagonal of the cohort matrices
+    try:
+        cohort_retention.append_cells(enriched)
+        save_table(cohort_retention.cohort_sizes(user_info), cohort_retention.SIZES_TABLE)
+    except FileNotFoundError:
+        pass
+
+    aggregates = pd.concat([aggregates, monthly_aggregates(enriched)], ignore_index=True)
+    save_table(aggregates.sort_values('Month', ignore_index=True), AGGREGATES_TABLE)
+    order_index.save_index(order_index.add(seen, enriched['order_id']))
+    return month, len(enriched)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append one new month of transactions and update the monthly aggregates.')
+    parser.add_argument('path', help='CSV or Parquet file in the transactions_final schema')
+    args = parser.parse_args()
+
+    month, rows = append_month(args.path)
+    print(f" Appended {rows} transactions for {month} to {ENRICHED_TABLE} and updated {AGGREGATES_TABLE}")
+
+    # Refresh the memory-mapped dashboard data from the updated cube
+    from dashboard_store import build_store
+    build_store()
@@ -0,0 +1,254 @@
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Step-level instrumentation for the pipeline scripts.
+#   with span('load', rows_in=len(df)) as s:
+#       ...
+#       s.rows_out = len(df)
+# Each span appends one JSON line to data/logs/spans.jsonl with its wall and
+# CPU seconds, the peak memory it reached, rows in/out, the script, the
+# enclosing span and a run id (shared by every stage of a run_pipeline.py run).
+# Setting PIPELINE_PROFILE / PIPELINE_TRACEMALLOC / PIPELINE_PEAK_MEMORY to a
+# comma-separated list of span names also captures a cProfile report / the top
+# tracemalloc allocation sites / an exact peak for those spans: the process's
+# RSS high-water mark is only reset for such a capture, so other spans report
+# how far they raised the high-water mark (0 when they stayed below an earlier
+# peak). PIPELINE_SPANS=0 (or disable()) turns spans into no-ops that record
+# nothing. `python instrumentation.py` prints the hot spots of the latest run.
+
+SPANS_PATH = os.path.join('data', 'logs', 'spans.jsonl')
+PROFILE_DIR = os.path.join('data', 'logs', 'profiles')
+RUN_ID_ENV = 'PIPELINE_RUN_ID'
+SPANS_ENV = 'PIPELINE_SPANS'
+PROFILE_TOP = 25
+
+_stack = []
+_run_id = os.environ.get(RUN_ID_ENV) or time.strftime('%Y%m%d-%H%M%S') + f'-{os.getpid()}'
+_enabled = os.environ.get(SPANS_ENV, '1') != '0'
+
+
+def disable():
+    # For long-running processes (the dashboard) where per-call records aren't wanted
+    global _enabled
+    _enabled = False
+
+
+def new_run_id():
+    # Called once by a runner; child processes inherit it through the environment
+    global _run_id
+    _run_id = os.environ[RUN_ID_ENV] = time.strftime('%Y%m%d-%H%M%S')
+    return _run_id
+
+
+def _selected(env):
+    return {name.strip() for name in os.environ.get(env, '').split(',') if name.strip()}
+
+
+def _status_kb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak():
+    # Linux lets a process reset its RSS high-water mark; elsewhere the
+    # lifetime peak (ru_maxrss) is used and the delta only shows new peaks
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _rss_mb():
+    rss = _status_kb('VmRSS:')
+    return rss / 1024 if rss is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _peak_mb():
+    peak = _status_kb('VmHWM:')
+    return peak / 1024 if peak is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Span:
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.extra = {}
+        self.peak_mb = 0.0
+
+    def set(self, **fields):
+        # rows_in / rows_out or any other field to record
+        for key, value in fields.items():
+            if key in ('rows_in', 'rows_out'):
+                setattr(self, key, value)
+            else:
+                self.extra[key] = value
+
+
+def _propagate_peak():
+    # The high-water mark is about to be reset or read: every open span keeps
+    # the highest value seen while it was open
+    peak = _peak_mb()
+    for open_span in _stack:
+        open_span.peak_mb = max(open_span.peak_mb, peak)
+
+
+def _write(record):
+    os.makedirs(os.path.dirname(SPANS_PATH), exist_ok=True)
+    with open(SPANS_PATH, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+
+@contextmanager
+def span(name, rows_in=None):
+    s = Span(name, rows_in)
+    if not _enabled:
+        yield s
+        return
+    script = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None
+    parent = _stack[-1].name if _stack else None
+    profile = name in _selected('PIPELINE_PROFILE')
+    trace = name in _selected('PIPELINE_TRACEMALLOC') and not tracemalloc.is_tracing()
+    reset = profile or trace or name in _selected('PIPELINE_PEAK_MEMORY')
+
+    if reset:
+        _propagate_peak()
+        _reset_peak()
+        base = _rss_mb()
+    else:
+        base = _peak_mb()
+    s.peak_mb = base
+    _stack.append(s)
+    profiler = cProfile.Profile() if profile else None
+    if trace:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    wall, cpu = time.perf_counter(), time.process_time()
+    error = None
+    try:
+        yield s
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        if profiler:
+            profiler.disable()
+        _propagate_peak()
+        _stack.pop()
+        record = {
+            'run_id': _run_id,
+            'script': script,
+            'span': name,
+            'parent': parent,
+            'start': time.time() - wall,
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'peak_mem_delta_mb': round(max(s.peak_mb - base, 0.0), 3),
+            'rows_in': s.rows_in,
+            'rows_out': s.rows_out,
+            **s.extra,
+        }
+        if error:
+            record['error'] = error
+        if trace:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            record['tracemalloc_top'] = [
+                {'where': str(stat.traceback[0]), 'size_mb': round(stat.size / 1e6, 3), 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:10]
+            ]
+        if profiler:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{_run_id}-{script or 'python'}-{name}.prof".replace(' ', '_'))
+            profiler.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            record['profile'] = path
+            with open(path[:-5] + '.txt', 'w') as f:
+                f.write(out.getvalue())
+        _write(record)
+
+
+def iter_spans(iterable, name):
+    # Times each item pulled from iterable (e.g. a chunk reader) as one span
+    iterator = iter(iterable)
+    while True:
+        with span(name) as s:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            s.rows_out = len(item) if hasattr(item, '__len__') else None
+        yield item
+
+
+def load_spans(path=SPANS_PATH):
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    return pd.read_json(path, lines=True)
+
+
+def summary(spans, run_id=None, top=15):
+    # Hot spots of one run (the latest by default): the leaf-most spans ranked
+    # by wall time, with their share of the run
+    if spans.empty:
+        return spans
+    run_id = run_id or spans['run_id'].iloc[-1]
+    run = spans[spans['run_id'] == run_id]
+    nested = run[run['parent'].notna()]
+    parents = set(zip(nested['script'], nested['parent']))
+    leaves = run[[(s, n) not in parents for s, n in zip(run['script'], run['span'])]]
+    table = leaves.groupby(['script', 'span'], sort=False).agg(
+        calls=('wall_s', 'size'),
+        wall_s=('wall_s', 'sum'),
+        cpu_s=('cpu_s', 'sum'),
+        peak_mem_delta_mb=('peak_mem_delta_mb', 'max'),
+        rows_in=('rows_in', 'max'),
+        rows_out=('rows_out', 'max'),
+    )
+    table['share'] = (table['wall_s'] / table['wall_s'].sum()).round(3)
+    return table.sort_values('wall_s', ascending=False).head(top).reset_index()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the hot spots recorded in data/logs/spans.jsonl.')
+    parser.add_argument('--run', help='run id (default: the latest run)')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--runs', action='store_true', help='list the recorded runs')
+    args = parser.parse_args()
+
+    spans = load_spans()
+    if spans.empty:
+        print(f" No spans recorded in {SPANS_PATH}")
+        sys.exit(0)
+    if args.runs:
+        # Wall time of the top-level spans only, nested spans are already inside them
+        top_level = spans['wall_s'].where(spans['parent'].isna(), 0.0)
+        runs = spans.assign(wall_s=top_level).groupby('run_id', sort=False).agg(
+            scripts=('script', 'nunique'), spans=('span', 'size'), wall_s=('wall_s', 'sum'))
+        print(runs.to_string())
+        sys.exit(0)
+    table = summary(spans, args.run, args.top)
+    print(f"\n Run {args.run or spans['run_id'].iloc[-1]}: top {len(table)} spans by wall time")
+    print(table.to_string(index=False))
@@ -1,55 +1,34 @@
-import pandas as pd
-
-transactions = pd.read_csv('data/transactions_final.csv')
-commission = pd.read_csv('data/commission_final.csv')
-user_info = pd.read_csv('data/user_info_final.csv')
-
-# Remove duplicates on merge keys
-commission = commission.drop_duplicates(subset=['Merchant_id'])
-user_info = user_info.drop_duplicates(subset=['User_id'])
-
-# --- UPDATE THIS MERGE TO INCLUDE Merchant_name ---
-merged = pd.merge(
-    transactions,
-    commission[['Merchant_id', 'Rate_pct', 'Merchant_name']],  # <-- add 'Merchant_name'
-    how='left',
-    left_on='Merchant_id',
-    right_on='Merchant_id'
-)
-
-# Debug: Check uniqueness
-if user_info['User_id'].duplicated().any():
-    dupes = user_info[user_info['User_id'].duplicated(keep=False)]
-    print("Duplicate User_id in user_info:", dupes)
-    raise ValueError("Duplicates found in User_id after drop_duplicates!")
-
-if commission['Merchant_id'].duplicated().any():
-    dupes = commission[commission['Merchant_id'].duplicated(keep=False)]
-    print("Duplicate Merchant_id in commission:", dupes)
-    raise ValueError("Duplicates found in Merchant_id after drop_duplicates!")
-
-# Merge Transactions with Commission
-merged = pd.merge(
-    transactions,
-    commission,
-    how='left',
-    left_on='Merchant_id',
-    right_on='Merchant_id',
-    validate='many_to_one'
-)
-
-# Merge with User_Info
-merged = pd.merge(
-    merged,
-    user_info,
-    how='left',
-    left_on='user_id',
-    right_on='User_id',
-    validate='many_to_one'
-)
-
-if 'User_id' in merged.columns:
-    merged = merged.drop(columns=['User_id'])
-
-merged.to_csv('data/master_merged.csv', index=False)
-print(" Master merged dataset saved as data/master_merged.csv")
\ No newline at end of file
+from storage import load_table, save_table
+from dimension_index import DimensionIndex
+from instrumentation import span
+
+
+def merge_master(transactions, commission, user_info):
+    # Remove duplicates on merge keys
+    commission = commission.drop_duplicates(subset=['Merchant_id'])
+    user_info = user_info.drop_duplicates(subset=['User_id'])
+
+    # Dimension lookups (unique keys, so each transaction gets at most one match)
+    merchants = DimensionIndex.from_frame(commission, 'Merchant_id', ['Merchant_name', 'Rate_pct'])
+    users = DimensionIndex.from_frame(user_info, 'User_id')
+
+    # Attach commission and user attributes to the transactions
+    merged = merchants.enrich(transactions, on='Merchant_id')
+    return users.enrich(merged, on='user_id')
+
+
+if __name__ == '__main__':
+    with span('load_final') as s:
+        transactions = load_table('transactions_final')
+        commission = load_table('commission_final')
+        user_info = load_table('user_info_final')
+        s.rows_out = len(transactions)
+
+    with span('enrich', rows_in=len(transactions)) as s:
+        merged = merge_master(transactions, commission, user_info)
+        s.rows_out = len(merged)
+
+    # Stored by month of Date, so date-range reads only open the months they need
+    with span('save_master', rows_in=len(merged)):
+        save_table(merged, 'master_merged', csv_copy=True, partition_by='Date')
+    print(" Master merged dataset saved as data/master_merged/year=*/month=*/ (+ CSV copy)")
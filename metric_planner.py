@@ -0,0 +1,82 @@
+from collections import namedtuple
+
+from rollup_cube import DIMENSIONS, rollup
+
+# Declarative report metrics.
+# A MetricSpec names a measure aggregated over a dimension, e.g.
+#   MetricSpec('users_by_age', 'Age', 'user_id', 'nunique')
+# The planner groups specs that share a dimension (and filter) into one pass:
+# a single rollup of the cube when every measure in the pass is a cube
+# measure, otherwise one fused groupby(...).agg over the transaction rows.
+# Each pass scans its source once and the results are shared by name.
+
+MetricSpec = namedtuple('MetricSpec', ['name', 'dimension', 'measure', 'agg', 'where'], defaults=[None])
+
+# (measure, agg) pairs the rollup cube answers directly, and the rollup column holding them
+CUBE_MEASURES = {
+    ('user_id', 'nunique'): 'Users',
+    ('order_id', 'count'): 'Transactions',
+    ('Amount', 'sum'): 'Amount',
+    ('Revenue', 'sum'): 'Revenue',
+    ('Amount', 'mean'): 'Avg Amount',
+    ('Revenue', 'mean'): 'Avg Revenue',
+}
+
+Pass = namedtuple('Pass', ['source', 'dimensions', 'where', 'specs'])
+
+
+def _dimensions(spec):
+    return (spec.dimension,) if isinstance(spec.dimension, str) else tuple(spec.dimension)
+
+
+def _where_key(where):
+    return tuple(sorted((col, tuple(values)) for col, values in (where or {}).items()))
+
+
+def plan(specs):
+    # One pass per (dimensions, filter); cube when all its specs are cube measures
+    grouped = {}
+    for spec in specs:
+        grouped.setdefault((_dimensions(spec), _where_key(spec.where)), []).append(spec)
+
+    passes = []
+    for (dims, where), group in grouped.items():
+        on_cube = (
+            all(d in DIMENSIONS for d in dims + tuple(col for col, _ in where))
+            and all((s.measure, s.agg) in CUBE_MEASURES for s in group)
+        )
+        passes.append(Pass('cube' if on_cube else 'rows', dims, dict(where), group))
+    return passes
+
+
+def row_columns(passes):
+    # Columns the row passes need, for a projected load
+    columns = set()
+    for p in passes:
+        if p.source == 'rows':
+            columns.update(p.dimensions)
+            columns.update(p.where)
+            columns.update(s.measure for s in p.specs)
+    return sorted(columns)
+
+
+def execute(passes, cube=None, rows=None, users=None):
+    # name -> Series indexed by the spec's dimension(s); users: the
+    # user_bitmaps.UserIndex for exact distinct users on the cube
+    results = {}
+    for p in passes:
+        dims = list(p.dimensions)
+        if p.source == 'cube':
+            distinct = any(CUBE_MEASURES[(s.measure, s.agg)] == 'Users' for s in p.specs)
+            out = rollup(cube, dims, where=p.where or None, distinct_users=distinct, users=users).set_index(dims)
+            for s in p.specs:
+                results[s.name] = out[CUBE_MEASURES[(s.measure, s.agg)]]
+        else:
+            frame = rows
+            for col, values in p.where.items():
+                frame = frame[frame[col].isin(values)]
+            out = frame.groupby(dims, observed=True).agg(**{s.name: (s.measure, s.agg) for s in p.specs})
+            for s in p.specs:
+                results[s.name] = out[s.name]
+    return results
+
@@ -0,0 +1,70 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from storage import DATA_DIR, load_table
+
+# Persistent set of every order_id loaded so far.
+# The ids are kept as one sorted, unique int64 array in data/order_ids.npy
+# (8 bytes per order). A new batch is checked against it with a binary search
+# over the memory-mapped file, so a re-delivered or overlapping file is caught
+# without reading earlier months' transactions. data_cleaning.py writes the
+# index for a full load; incremental_update.py checks and extends it.
+
+INDEX_PATH = os.path.join(DATA_DIR, 'order_ids.npy')
+REASON_DUPLICATE_ORDER = 'duplicate_order_id'
+
+
+def load_index(path=INDEX_PATH, table=None):
+    # A missing index is built once from the order_id column of table, if given
+    if not os.path.exists(path):
+        if table is None:
+            return np.empty(0, dtype='int64')
+        save_index(load_table(table, columns=['order_id'])['order_id'], path)
+    return np.load(path, mmap_mode='r')
+
+
+def save_index(order_ids, path=INDEX_PATH):
+    # Written to a temp file first so a failed write never leaves a truncated index
+    ids = np.unique(np.asarray(order_ids, dtype='int64'))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.tmp.npy'
+    np.save(tmp, ids)
+    os.replace(tmp, path)
+    return path
+
+
+def duplicate_mask(order_ids, seen):
+    # True for ids already in seen and for repeats within the batch (the first
+    # occurrence is kept)
+    ids = np.asarray(order_ids, dtype='int64')
+    duplicate = pd.Series(ids).duplicated().to_numpy(copy=True)
+    if len(seen):
+        pos = np.minimum(np.searchsorted(seen, ids), len(seen) - 1)
+        duplicate |= seen[pos] == ids
+    return duplicate
+
+
+def add(seen, order_ids):
+    # Sorted union of the index and a batch of new ids
+    return np.union1d(seen, np.asarray(order_ids, dtype='int64'))
+
+
+def split_duplicates(df, seen, column='order_id'):
+    # (new rows, rejected rows tagged with a reject_reason)
+    duplicate = duplicate_mask(df[column], seen)
+    rejected = df[duplicate].assign(reject_reason=REASON_DUPLICATE_ORDER)
+    return df[~duplicate], rejected
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild or inspect the persisted order_id index.')
+    parser.add_argument('--rebuild', metavar='TABLE', help='rebuild the index from a stored transactions table')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        save_index(load_table(args.rebuild, columns=['order_id'])['order_id'])
+    seen = load_index()
+    print(f" {len(seen)} order ids in {INDEX_PATH} ({seen.nbytes / 1e6:.2f} MB)")
@@ -0,0 +1,154 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from storage import load_table, load_undated, month_bounds
+
+# Map-reduce execution of grouped aggregations over a stored transactions table.
+# Map: the table is split into month ranges and each worker process reads its
+# range straight from the Parquet files (projected, and filtered on the date
+# column by storage.load_table, which opens only the matching partitions of a
+# partitioned table), so no frame is pickled to the workers; only the small
+# partial aggregates come back. Reduce: partials are merged per aggregate:
+# sum, count and size add, a mean is carried as (sum, count), nunique as the
+# distinct (group, value) pairs. Partials are always merged in month order, so
+# the result is identical for any number of workers (workers=1 runs the same
+# map and merge in-process). Against a serial pandas groupby: counts, sizes,
+# nunique and groups keyed by month are exact, since a month's rows all land
+# in one partition in stored order; float sums (and means) of groups spanning
+# months add the same values in a different grouping, so they agree to a
+# relative 1e-12, not bit for bit (see --check and tests/test_parallel_aggregate.py).
+
+MERGEABLE = ['sum', 'count', 'size', 'mean', 'nunique']
+# Worker processes for the pipeline stages that aggregate in parallel (Part A,
+# the rollup cubes); run_pipeline.py --workers sets it for every stage
+WORKERS_ENV = 'PIPELINE_WORKERS'
+
+
+def configured_workers():
+    # $PIPELINE_WORKERS, 0 meaning one per CPU; serial when unset
+    return int(os.environ.get(WORKERS_ENV, 1)) or os.cpu_count() or 1
+
+
+def month_tasks(table, date_column='Date'):
+    # One task per month with rows, plus None for undated rows if there are any
+    dates = load_table(table, columns=[date_column])[date_column]
+    months = sorted(dates.dropna().dt.to_period('M').unique())
+    tasks = [tuple(month_bounds(month)) for month in months]
+    if dates.isna().any():
+        tasks.append(None)
+    return tasks
+
+
+def load_task(table, task, columns=None, date_column='Date'):
+    if task is not None:
+        start, end = task
+        return load_table(table, columns=columns, start=start, end=end, date_column=date_column)
+    # Undated rows cannot be selected by a date range
+    return load_undated(table, columns=columns, date_column=date_column)
+
+
+def _run_task(func, table, task, columns, date_column, kwargs):
+    return func(load_task(table, task, columns, date_column), **kwargs)
+
+
+def map_months(func, table, columns=None, workers=None, date_column='Date', **kwargs):
+    # [func(rows of one month, **kwargs) for each month], in month order.
+    # func must be a module-level function so worker processes can import it.
+    tasks = month_tasks(table, date_column)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        return [_run_task(func, table, task, columns, date_column, kwargs) for task in tasks]
+    # Forked where available: the pipeline stages are top-level scripts, which a
+    # spawned worker would re-run on start (run_pipeline's own pool spawns, so
+    # its stage processes would otherwise spawn too)
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context) as pool:
+        futures = [pool.submit(_run_task, func, table, task, columns, date_column, kwargs) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def partial_aggregate(df, by, aggs):
+    # Map step: mergeable partials for {name: (column, agg)}
+    grouped = df.groupby(by, observed=True, dropna=False)
+    sums = {}
+    for name, (column, agg) in aggs.items():
+        if agg == 'sum':
+            sums[name] = (column, 'sum')
+        elif agg == 'count':
+            sums[name] = (column, 'count')
+        elif agg == 'size':
+            sums[name] = (column, 'size')
+        elif agg == 'mean':
+            sums[f'{name}__sum'] = (column, 'sum')
+            sums[f'{name}__count'] = (column, 'count')
+    additive = grouped.agg(**sums) if sums else None
+    distinct = {
+        name: df[by + [column]].dropna(subset=[column]).drop_duplicates()
+        for name, (column, agg) in aggs.items() if agg == 'nunique'
+    }
+    return additive, distinct
+
+
+def merge_aggregates(partials, by, aggs):
+    # Reduce step: combines partials from disjoint row sets into the final frame
+    additive = [a for a, _ in partials if a is not None]
+    merged = pd.concat(additive).groupby(level=list(range(len(by))), dropna=False).sum() if additive else None
+    distinct = {}
+    for name, (column, agg) in aggs.items():
+        if agg == 'nunique':
+            pairs = pd.concat([d[name] for _, d in partials]).drop_duplicates()
+            distinct[name] = pairs.groupby(by, observed=True, dropna=False)[column].nunique()
+    index = merged.index if merged is not None else next(iter(distinct.values())).index
+    out = pd.DataFrame(index=index)
+    for name, (column, agg) in aggs.items():
+        if agg in ('sum', 'count', 'size'):
+            out[name] = merged[name]
+        elif agg == 'mean':
+            out[name] = merged[f'{name}__sum'] / merged[f'{name}__count']
+        else:
+            out[name] = distinct[name].reindex(index, fill_value=0)
+    return out.sort_index()
+
+
+def aggregate(table, by, aggs, workers=None, date_column='Date'):
+    # groupby(by).agg(**aggs) over a stored table, computed month by month in a process pool
+    by = [by] if isinstance(by, str) else list(by)
+    unsupported = {agg for _, agg in aggs.values()} - set(MERGEABLE)
+    if unsupported:
+        raise ValueError(f"Aggregations {sorted(unsupported)} have no merge rule; supported: {MERGEABLE}")
+    columns = sorted(set(by) | {column for column, _ in aggs.values()})
+    partials = map_months(partial_aggregate, table, columns, workers, date_column, by=by, aggs=aggs)
+    return merge_aggregates(partials, by, aggs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a grouped aggregation over a stored table in a process pool.')
+    parser.add_argument('--table', default='transactions_with_revenue_userinfo')
+    parser.add_argument('--by', nargs='+', default=['Age'])
+    parser.add_argument('--agg', nargs='+', default=['Revenue:sum', 'order_id:count', 'Amount:mean', 'user_id:nunique'],
+                        help='column:aggregation pairs')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--check', action='store_true', help='compare with a serial pandas groupby')
+    args = parser.parse_args()
+
+    aggs = {f"{column}_{agg}": (column, agg) for column, agg in (pair.split(':') for pair in args.agg)}
+    start = time.perf_counter()
+    result = aggregate(args.table, args.by, aggs, args.workers)
+    print(result.to_string())
+    print(f"\n {time.perf_counter() - start:.2f} s with {args.workers or os.cpu_count()} workers")
+
+    if args.check:
+        start = time.perf_counter()
+        df = load_table(args.table, columns=sorted(set(args.by) | {c for c, _ in aggs.values()}))
+        serial = df.groupby(args.by, observed=True, dropna=False).agg(**aggs).sort_index()
+        print(f" {time.perf_counter() - start:.2f} s serial")
+        exact = all(np.array_equal(result[c].to_numpy(), serial[c].to_numpy()) for c in aggs)
+        close = all(np.allclose(result[c].to_numpy('float64'), serial[c].to_numpy('float64'), equal_nan=True)
+                    for c in aggs)
+        print(f" Matches the serial groupby: {'exactly' if exact else 'within float rounding' if close else 'NO'}")
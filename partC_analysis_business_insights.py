@@ -1,178 +1,230 @@
 import pandas as pd
 
-# Load merged and enriched transaction data
-df = pd.read_csv('data/transactions_with_revenue_userinfo.csv')
-df['Date'] = pd.to_datetime(df['Date'])
-
-# ------------- Q6: User demographics & transaction behavior -------------
-print("\nQ6: User Demographics & Transaction Behavior\n")
-
-# Demographic breakdowns
-print("User count by Age group:")
-print(df.groupby('Age')['user_id'].nunique())
-
-print("\nUser count by Gender:")
-print(df.groupby('Gender')['user_id'].nunique())
-
-print("\nUser count by Location:")
-print(df.groupby('Location')['user_id'].nunique())
-
-# Transactional trends
-print("\nTransaction count by Age group:")
-print(df.groupby('Age')['order_id'].count())
-
-print("\nTransaction count by Gender:")
-print(df.groupby('Gender')['order_id'].count())
-
-print("\nTransaction count by Location:")
-print(df.groupby('Location')['order_id'].count())
-
-print("\nAverage transaction value by Age group:")
-print(df.groupby('Age')['Amount'].mean())
-
-print("\nAverage transaction value by Gender:")
-print(df.groupby('Gender')['Amount'].mean())
-
-print("\nAverage transaction value by Location:")
-print(df.groupby('Location')['Amount'].mean())
-
-print("\nMonthly trend: Transactions and revenue per month:")
-monthly = df.groupby(df['Date'].dt.to_period('M')).agg(
-    Transactions=('order_id', 'count'),
-    Revenue=('Revenue', 'sum'),
-    New_Users=('user_id', lambda x: (df.loc[x.index, 'Type_user'] == 'New').sum())
-)
-print(monthly)
-
-# ------------- Q7: Marketing advice metrics -------------
-print("\nQ7: Marketing Advice Metrics\n")
-
-# Most valuable user segments
-revenue_by_age = df.groupby('Age')['Revenue'].sum()
-revenue_by_gender = df.groupby('Gender')['Revenue'].sum()
-revenue_by_location = df.groupby('Location')['Revenue'].sum()
-
-print("Revenue by Age group:\n", revenue_by_age)
-print("\nRevenue by Gender:\n", revenue_by_gender)
-print("\nRevenue by Location:\n", revenue_by_location)
-
-# Frequency: top users
-user_freq = df.groupby('user_id')['order_id'].count().sort_values(ascending=False)
-print("\nTop 5 most active users (by transaction count):")
-print(user_freq.head())
-
-# ------------- Q8: Cashback proposal impact -------------
-
-print("\nQ8: Cashback Proposal Impact\n")
-
-# List of Telco merchants (as per cashback table)
-telco_merchants = {
-    'Viettel': 2,
-    'Mobifone': 2.5,
-    'Vinaphone': 3,
-    'Vietnamobile': 3,
-    'Gmobile': 3
-}
-if 'Merchant_name' not in df.columns:
-    # Add mapping from Merchant_id to name
-    merchant_id_map = {
-        12: 'Viettel',
-        13: 'Mobifone',
-        14: 'Vinaphone',
-        15: 'Vietnamobile',
-        16: 'Gmobile'
-    }
-    df['Merchant_name'] = df['Merchant_id'].map(merchant_id_map)
-
-# Mark telco transactions
-df['Is_telco'] = df['Merchant_name'].isin(telco_merchants.keys())
-
-# Current cashback (1% for all telco)
-df['Current_cashback'] = df.apply(
-    lambda row: 0.01 * row['Amount'] if row['Is_telco'] else 0, axis=1
-)
-# Proposed cashback (use table above)
-df['Proposed_cashback'] = df.apply(
-    lambda row: (telco_merchants[row['Merchant_name']] / 100) * row['Amount'] if row['Is_telco'] else 0, axis=1
-)
-
-# Compute costs
-current_cashback_total = df['Current_cashback'].sum()
-proposed_cashback_total = df['Proposed_cashback'].sum()
-additional_cost = proposed_cashback_total - current_cashback_total
-
-print(f"Current total cashback paid: {current_cashback_total:,.0f} VND")
-print(f"Proposed total cashback paid: {proposed_cashback_total:,.0f} VND")
-print(f"Additional cost to MoMo: {additional_cost:,.0f} VND")
-
-# Impact on revenue (for telco merchants)
-telco_revenue = df[df['Is_telco']]['Revenue'].sum()
-print(f"\nMoMo's revenue from Telco merchants: {telco_revenue:,.0f} VND")
-print(f"Under proposal, % of revenue used for cashback: {proposed_cashback_total / telco_revenue * 100:.2f}%")
-
-# ------------- Q9: User group ideas for development strategy -------------
-print("\nQ9: User Group Breakdown for Strategy Ideas\n")
-
-# Who are the top spenders?
-spender = df.groupby('user_id')['Amount'].sum().sort_values(ascending=False)
-print("Top 5 highest spenders (user_id):")
-print(spender.head())
-
-# Which user segments are less active?
-user_by_age = df.groupby('Age')['user_id'].nunique()
-transactions_by_age = df.groupby('Age')['order_id'].count()
-print("\nUser count by Age group:", user_by_age)
-print("Transaction count by Age group:", transactions_by_age)
-
-
-# ========== EXPORT PART C RESULTS TO EXCEL ==========
-output_path = 'data/hackathon_partC_summary.xlsx'
-
-with pd.ExcelWriter(output_path, engine='xlsxwriter') as writer:
-    # Q6: User Demographics & Behavior
-    df.groupby('Age')['user_id'].nunique().reset_index(name='User Count').to_excel(writer, sheet_name='Q6_Age_UserCount', index=False)
-    df.groupby('Gender')['user_id'].nunique().reset_index(name='User Count').to_excel(writer, sheet_name='Q6_Gender_UserCount', index=False)
-    df.groupby('Location')['user_id'].nunique().reset_index(name='User Count').to_excel(writer, sheet_name='Q6_Location_UserCount', index=False)
-
-    df.groupby('Age')['order_id'].count().reset_index(name='Transaction Count').to_excel(writer, sheet_name='Q6_Age_TransCount', index=False)
-    df.groupby('Gender')['order_id'].count().reset_index(name='Transaction Count').to_excel(writer, sheet_name='Q6_Gender_TransCount', index=False)
-    df.groupby('Location')['order_id'].count().reset_index(name='Transaction Count').to_excel(writer, sheet_name='Q6_Location_TransCount', index=False)
-
-    df.groupby('Age')['Amount'].mean().reset_index(name='Avg Amount').to_excel(writer, sheet_name='Q6_Age_AvgAmt', index=False)
-    df.groupby('Gender')['Amount'].mean().reset_index(name='Avg Amount').to_excel(writer, sheet_name='Q6_Gender_AvgAmt', index=False)
-    df.groupby('Location')['Amount'].mean().reset_index(name='Avg Amount').to_excel(writer, sheet_name='Q6_Location_AvgAmt', index=False)
-
-    monthly.to_timestamp().reset_index().to_excel(writer, sheet_name='Q6_Monthly_Trend', index=False)
-
-    # Q7: Marketing Advice Metrics
-    revenue_by_age.reset_index(name='Revenue').to_excel(writer, sheet_name='Q7_Revenue_By_Age', index=False)
-    revenue_by_gender.reset_index(name='Revenue').to_excel(writer, sheet_name='Q7_Revenue_By_Gender', index=False)
-    revenue_by_location.reset_index(name='Revenue').to_excel(writer, sheet_name='Q7_Revenue_By_Location', index=False)
-    user_freq.head(5).reset_index(name='Transaction Count').to_excel(writer, sheet_name='Q7_Top_Users', index=False)
-
-    # Q8: Cashback Proposal Impact
-    cashback_df = pd.DataFrame({
-        'Metric': [
-            'Current Cashback Total',
-            'Proposed Cashback Total',
-            'Additional Cost',
-            'Telco Revenue',
-            'Cashback % of Telco Revenue'
-        ],
-        'Value (VND)': [
-            round(current_cashback_total),
-            round(proposed_cashback_total),
-            round(additional_cost),
-            round(telco_revenue),
-            round(proposed_cashback_total / telco_revenue * 100, 2)
-        ]
+from storage import load_table
+from report_writer import ReportWriter
+from rollup_cube import load_cube
+from user_bitmaps import load_user_index
+from metric_planner import MetricSpec, plan, execute, row_columns
+from cashback_scenarios import amount_profile, current_scenario, flat_scenario, simulate
+from cohort_retention import load_cohorts, retention_matrix
+from instrumentation import span
+
+# Every grouped metric used by the console report and the Excel export.
+# The planner fuses specs sharing a dimension into one pass: segment and
+# monthly metrics roll up from the pre-aggregated cube, the user-level
+# rankings make one grouped pass over the transaction rows.
+METRICS = [
+    MetricSpec(f'{measure}_by_{dim.lower()}', dim, column, agg)
+    for dim in ['Age', 'Gender', 'Location']
+    for measure, column, agg in [
+        ('users', 'user_id', 'nunique'),
+        ('transactions', 'order_id', 'count'),
+        ('avg_amount', 'Amount', 'mean'),
+        ('revenue', 'Revenue', 'sum'),
+    ]
+] + [
+    MetricSpec('transactions_by_month', 'Month', 'order_id', 'count'),
+    MetricSpec('revenue_by_month', 'Month', 'Revenue', 'sum'),
+    MetricSpec('new_users_by_month', 'Month', 'order_id', 'count', where={'Type_user': ['New']}),
+    MetricSpec('transactions_by_user', 'user_id', 'order_id', 'count'),
+    MetricSpec('amount_by_user', 'user_id', 'Amount', 'sum'),
+]
+
+OUTPUT_PATH = 'data/hackathon_partC_summary.xlsx'
+
+
+def main(output_path=OUTPUT_PATH):
+    passes = plan(METRICS)
+    with span('load_inputs') as s:
+        cube = load_cube()
+        users = load_user_index()
+        # Merchant and revenue columns are also needed for the cashback simulation (Q8)
+        user_rows = load_table('transactions_with_revenue_userinfo',
+                               columns=sorted(set(row_columns(passes)) | {'Merchant_name', 'Revenue'}))
+        s.rows_out = len(user_rows)
+    with span('metrics', rows_in=len(user_rows)):
+        metrics = execute(passes, cube=cube, rows=user_rows, users=users)
+
+    # ------------- Q6: User demographics & transaction behavior -------------
+    print("\nQ6: User Demographics & Transaction Behavior\n")
+
+    # Demographic breakdowns
+    print("User count by Age group:")
+    print(metrics['users_by_age'])
+
+    print("\nUser count by Gender:")
+    print(metrics['users_by_gender'])
+
+    print("\nUser count by Location:")
+    print(metrics['users_by_location'])
+
+    # Transactional trends
+    print("\nTransaction count by Age group:")
+    print(metrics['transactions_by_age'])
+
+    print("\nTransaction count by Gender:")
+    print(metrics['transactions_by_gender'])
+
+    print("\nTransaction count by Location:")
+    print(metrics['transactions_by_location'])
+
+    print("\nAverage transaction value by Age group:")
+    print(metrics['avg_amount_by_age'])
+
+    print("\nAverage transaction value by Gender:")
+    print(metrics['avg_amount_by_gender'])
+
+    print("\nAverage transaction value by Location:")
+    print(metrics['avg_amount_by_location'])
+
+    print("\nMonthly trend: Transactions and revenue per month:")
+    monthly = pd.DataFrame({
+        'Transactions': metrics['transactions_by_month'],
+        'Revenue': metrics['revenue_by_month'],
+        'New_Users': metrics['new_users_by_month'].reindex(metrics['transactions_by_month'].index, fill_value=0),
     })
-    cashback_df.to_excel(writer, sheet_name='Q8_Cashback_Impact', index=False)
+    monthly.index = pd.PeriodIndex(monthly.index, freq='M', name='Date')
+    print(monthly)
+
+    # ------------- Q7: Marketing advice metrics -------------
+    print("\nQ7: Marketing Advice Metrics\n")
+
+    # Most valuable user segments
+    revenue_by_age = metrics['revenue_by_age']
+    revenue_by_gender = metrics['revenue_by_gender']
+    revenue_by_location = metrics['revenue_by_location']
+
+    print("Revenue by Age group:\n", revenue_by_age)
+    print("\nRevenue by Gender:\n", revenue_by_gender)
+    print("\nRevenue by Location:\n", revenue_by_location)
 
-    # Q9: Strategy Segmentations
-    spender.head(5).reset_index(name='Total Amount Spent').to_excel(writer, sheet_name='Q9_Top_Spenders', index=False)
-    user_by_age.reset_index(name='User Count').to_excel(writer, sheet_name='Q9_Users_By_Age', index=False)
-    transactions_by_age.reset_index(name='Transaction Count').to_excel(writer, sheet_name='Q9_Trans_By_Age', index=False)
+    # Frequency: top users
+    user_freq = metrics['transactions_by_user'].sort_values(ascending=False)
+    print("\nTop 5 most active users (by transaction count):")
+    print(user_freq.head())
 
-print(f"\n Part C answers exported to: {output_path}")
+    # ------------- Q8: Cashback proposal impact -------------
+
+    print("\nQ8: Cashback Proposal Impact\n")
+
+    # List of Telco merchants (as per cashback table)
+    telco_merchants = {
+        'Viettel': 2,
+        'Mobifone': 2.5,
+        'Vinaphone': 3,
+        'Vietnamobile': 3,
+        'Gmobile': 3
+    }
 
+    # Both schemes go through the vectorised scenario engine (see cashback_scenarios.py)
+    with span('Q8_cashback', rows_in=len(user_rows)):
+        profile, merchant_revenue = amount_profile(user_rows)
+        scenarios = pd.concat([current_scenario(), flat_scenario('proposed', telco_merchants)], ignore_index=True)
+        comparison, telco_revenue = simulate(scenarios, profile, merchant_revenue, telco_merchants=list(telco_merchants))
+    cashback_totals = comparison.set_index('scenario')['total_cashback']
+
+    # Current cashback (1% for all telco)
+    current_cashback_total = cashback_totals['current']
+    # Proposed cashback (use table above)
+    proposed_cashback_total = cashback_totals['proposed']
+    additional_cost = proposed_cashback_total - current_cashback_total
+
+    print(f"Current total cashback paid: {current_cashback_total:,.0f} VND")
+    print(f"Proposed total cashback paid: {proposed_cashback_total:,.0f} VND")
+    print(f"Additional cost to MoMo: {additional_cost:,.0f} VND")
+
+    # Impact on revenue (for telco merchants)
+    print(f"\nMoMo's revenue from Telco merchants: {telco_revenue:,.0f} VND")
+    print(f"Under proposal, % of revenue used for cashback: {proposed_cashback_total / telco_revenue * 100:.2f}%")
+
+    # ------------- Q9: User group ideas for development strategy -------------
+    print("\nQ9: User Group Breakdown for Strategy Ideas\n")
+
+    # Who are the top spenders?
+    spender = metrics['amount_by_user'].sort_values(ascending=False)
+    print("Top 5 highest spenders (user_id):")
+    print(spender.head())
+
+    # Which user segments are less active?
+    user_by_age = metrics['users_by_age']
+    transactions_by_age = metrics['transactions_by_age']
+    print("\nUser count by Age group:", user_by_age)
+    print("Transaction count by Age group:", transactions_by_age)
+
+    # ------------- Q10: Cohort retention -------------
+    print("\nQ10: Cohort Retention (first-transaction month x months since)\n")
+
+    with span('Q10_cohorts'):
+        cohort_cells, cohort_sizes = load_cohorts()
+        cohort_users = retention_matrix(cohort_cells, 'Users')
+        cohort_retention = retention_matrix(cohort_cells, 'Users', sizes=cohort_sizes)
+        cohort_transactions = retention_matrix(cohort_cells, 'Transactions')
+        cohort_revenue = retention_matrix(cohort_cells, 'Revenue')
+    cohort_breakdown = cohort_cells[cohort_cells['dimension'] != 'All']
+
+    print("Active users as % of cohort, 2020 cohorts:")
+    print(cohort_retention[cohort_retention.index >= '2020-01'].iloc[:, :12].round(1))
+
+
+    # ========== EXPORT PART C RESULTS TO EXCEL ==========
+    with span('export_excel'):
+        with ReportWriter(output_path) as writer:
+            # Q6: User Demographics & Behavior
+            writer.write_frame('Q6_Age_UserCount', metrics['users_by_age'].reset_index(name='User Count'))
+            writer.write_frame('Q6_Gender_UserCount', metrics['users_by_gender'].reset_index(name='User Count'))
+            writer.write_frame('Q6_Location_UserCount', metrics['users_by_location'].reset_index(name='User Count'))
+
+            writer.write_frame('Q6_Age_TransCount', metrics['transactions_by_age'].reset_index(name='Transaction Count'))
+            writer.write_frame('Q6_Gender_TransCount', metrics['transactions_by_gender'].reset_index(name='Transaction Count'))
+            writer.write_frame('Q6_Location_TransCount', metrics['transactions_by_location'].reset_index(name='Transaction Count'))
+
+            writer.write_frame('Q6_Age_AvgAmt', metrics['avg_amount_by_age'].reset_index(name='Avg Amount'))
+            writer.write_frame('Q6_Gender_AvgAmt', metrics['avg_amount_by_gender'].reset_index(name='Avg Amount'))
+            writer.write_frame('Q6_Location_AvgAmt', metrics['avg_amount_by_location'].reset_index(name='Avg Amount'))
+
+            writer.write_frame('Q6_Monthly_Trend', monthly.to_timestamp().reset_index())
+
+            # Q7: Marketing Advice Metrics
+            writer.write_frame('Q7_Revenue_By_Age', revenue_by_age.reset_index(name='Revenue'))
+            writer.write_frame('Q7_Revenue_By_Gender', revenue_by_gender.reset_index(name='Revenue'))
+            writer.write_frame('Q7_Revenue_By_Location', revenue_by_location.reset_index(name='Revenue'))
+            writer.write_frame('Q7_Top_Users', user_freq.head(5).reset_index(name='Transaction Count'))
+
+            # Q8: Cashback Proposal Impact
+            cashback_df = pd.DataFrame({
+                'Metric': [
+                    'Current Cashback Total',
+                    'Proposed Cashback Total',
+                    'Additional Cost',
+                    'Telco Revenue',
+                    'Cashback % of Telco Revenue'
+                ],
+                'Value (VND)': [
+                    round(current_cashback_total),
+                    round(proposed_cashback_total),
+                    round(additional_cost),
+                    round(telco_revenue),
+                    round(proposed_cashback_total / telco_revenue * 100, 2)
+                ]
+            })
+            writer.write_frame('Q8_Cashback_Impact', cashback_df)
+
+            # Q9: Strategy Segmentations
+            writer.write_frame('Q9_Top_Spenders', spender.head(5).reset_index(name='Total Amount Spent'))
+            writer.write_frame('Q9_Users_By_Age', user_by_age.reset_index(name='User Count'))
+            writer.write_frame('Q9_Trans_By_Age', transactions_by_age.reset_index(name='Transaction Count'))
+
+            # Q10: Cohort retention (rows: cohort month, columns: months since first transaction)
+            writer.write_frame('Q10_Cohort_Users', cohort_users, index=True)
+            writer.write_frame('Q10_Cohort_Retention_Pct', cohort_retention.round(2), index=True)
+            writer.write_frame('Q10_Cohort_Transactions', cohort_transactions, index=True)
+            writer.write_frame('Q10_Cohort_Revenue', cohort_revenue, index=True)
+            writer.write_frame('Q10_Cohort_By_Segment', cohort_breakdown)
+
+    print(f"\n Part C answers exported to: {output_path}")
+    return output_path
+
+
+if __name__ == '__main__':
+    with span('partC'):
+        main()
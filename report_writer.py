@@ -0,0 +1,120 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+# Streaming Excel report writer.
+# Workbooks are opened in xlsxwriter's constant_memory mode: each row is
+# flushed to a temp file as soon as the next one starts, so writing a sheet
+# costs one row of cells at a time instead of the whole sheet's cell objects.
+# Rows of a sheet must therefore be written top to bottom in one go (charts
+# can be added at any time). Sheets match pandas' to_excel output: a plain
+# header row, the index as the first column when asked for, and blanks for
+# missing values.
+
+CHUNK_ROWS = 10000
+
+
+def _cell_values(frame):
+    # Column-wise conversion to plain Python values, None for missing
+    columns = []
+    for _, col in frame.items():
+        if isinstance(col.dtype, pd.PeriodDtype):
+            col = col.astype(str)
+        elif pd.api.types.is_datetime64_any_dtype(col):
+            col = pd.Series(col.dt.to_pydatetime(), index=col.index, dtype=object)
+        values = col.astype(object).to_numpy(copy=True)
+        values[pd.isna(col).to_numpy()] = None
+        columns.append([v.item() if isinstance(v, np.generic) else v for v in values])
+    return zip(*columns)
+
+
+class ReportWriter:
+
+    def __init__(self, path):
+        self.path = path
+        self.workbook = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            'default_date_format': 'YYYY-MM-DD HH:MM:SS',
+            'nan_inf_to_errors': True,
+        })
+        self.sheets = {}
+        self.rows = {}
+
+    def write_frame(self, sheet_name, df, index=False):
+        # df may also be an iterable of DataFrame chunks sharing one set of columns
+        chunks = [df] if isinstance(df, pd.DataFrame) else df
+        worksheet = self.workbook.add_worksheet(sheet_name)
+        self.sheets[sheet_name] = worksheet
+        row = 0
+        for chunk in chunks:
+            labels = list(chunk.columns)
+            if index:
+                labels = [chunk.index.name or ''] + labels
+                chunk = chunk.reset_index()
+            if row == 0:
+                worksheet.write_row(0, 0, labels)
+                row = 1
+            for start in range(0, len(chunk), CHUNK_ROWS):
+                for values in _cell_values(chunk.iloc[start:start + CHUNK_ROWS]):
+                    worksheet.write_row(row, 0, values)
+                    row += 1
+        self.rows[sheet_name] = row - 1
+        return worksheet
+
+    def insert_chart(self, sheet_name, label_col, value_col, chart_title, x_axis_name, y_axis_name, cell='E2'):
+        # Column chart over one label column and one value column of a written sheet
+        data_len = self.rows[sheet_name]
+        chart = self.workbook.add_chart({'type': 'column'})
+        chart.add_series({
+            'name': [sheet_name, 0, value_col],
+            'categories': [sheet_name, 1, label_col, data_len, label_col],
+            'values': [sheet_name, 1, value_col, data_len, value_col],
+        })
+        chart.set_title({'name': chart_title})
+        chart.set_x_axis({'name': x_axis_name})
+        chart.set_y_axis({'name': y_axis_name})
+        self.sheets[sheet_name].insert_chart(cell, chart)
+
+    def insert_stacked_chart(self, df, sheet_name, category, stack_col, value_col, chart_title,
+                             y_axis_name='Revenue (VND)', cell='J2'):
+        # Writes the category x stack pivot of df as a new sheet with a stacked column chart
+        if df.empty:
+            return
+        pivot_df = df.pivot(index=category, columns=stack_col, values=value_col).fillna(0).reset_index()
+        pivot_df.columns = [str(c) for c in pivot_df.columns]
+        self.write_frame(sheet_name, pivot_df)
+
+        chart = self.workbook.add_chart({'type': 'column', 'subtype': 'stacked'})
+        for col_idx in range(1, len(pivot_df.columns)):
+            chart.add_series({
+                'name':       [sheet_name, 0, col_idx],
+                'categories': [sheet_name, 1, 0, len(pivot_df), 0],
+                'values':     [sheet_name, 1, col_idx, len(pivot_df), col_idx],
+            })
+        chart.set_title({'name': chart_title})
+        chart.set_x_axis({'name': category})
+        chart.set_y_axis({'name': y_axis_name})
+        self.sheets[sheet_name].insert_chart(cell, chart)
+
+    def close(self):
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_workbooks(builders, workers=None):
+    # Runs independent workbook builders (picklable callables returning the
+    # written path) in separate processes; returns the paths in order
+    workers = workers or min(len(builders), os.cpu_count() or 1)
+    if workers <= 1:
+        return [build() for build in builders]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(build) for build in builders]
+        return [f.result() for f in futures]
@@ -0,0 +1,238 @@
+import numpy as np
+import pandas as pd
+
+import argparse
+
+from storage import load_table, save_table
+import hll_sketch
+import date_dimension
+import parallel_aggregate
+from user_bitmaps import ALL, load_user_index, union_all
+
+# Materialised rollup cube shared by the reporting consumers (dashboard,
+# offline export, Part C). One row per cell at the finest reporting grain,
+# holding only additive measures, so any coarser combination of dimensions
+# can be rolled up from the cells instead of re-scanning transaction rows.
+# Weekday is reported per month only, so it has its own small Month x weekday
+# cube rather than multiplying the cells of the main one.
+# Distinct users are not additive: exact counts come from the per-month user
+# bitmaps (user_bitmaps.py), approximate ones from optional per-cell sketches.
+
+CUBE_TABLE = 'rollup_cube'
+WEEKDAY_TABLE = 'rollup_weekday'
+DIMENSIONS = ['Month', 'Merchant_name', 'Age', 'Gender', 'Location', 'Type_user']
+WEEKDAY_DIMENSIONS = ['Month', 'weekday']
+MEASURES = ['Amount', 'Revenue', 'Transactions', 'Amount_count', 'Revenue_count']
+
+# Fallback used when the enriched table has no merchant names
+MERCHANT_ID_MAP = {
+    12: 'Viettel',
+    13: 'Mobifone',
+    14: 'Vinaphone',
+    15: 'Vietnamobile',
+    16: 'Gmobile'
+}
+
+
+def build_cube(df, sketch_precision=None, dims=DIMENSIONS):
+    df = df.copy()
+    # The enriched table carries the date dimension's Month and weekday; other
+    # frames get them attached per distinct day
+    missing = [col for col in ['Month', 'weekday'] if col not in df.columns]
+    if missing:
+        df = date_dimension.attach(df, 'Date', missing)
+    if 'Merchant_name' not in df.columns:
+        df['Merchant_name'] = df['Merchant_id'].map(MERCHANT_ID_MAP)
+
+    # dropna=False keeps rows with unknown demographics; rollup() drops them
+    # per requested dimension, like a groupby over the raw rows would
+    grouped = df.groupby(dims, observed=True, dropna=False)
+    cube = grouped.agg(
+        Amount=('Amount', 'sum'),
+        Revenue=('Revenue', 'sum'),
+        Transactions=('user_id', 'count'),
+        Amount_count=('Amount', 'count'),
+        Revenue_count=('Revenue', 'count'),
+    )
+    if sketch_precision:
+        cells = grouped.ngroup().to_numpy()
+        known = df['user_id'].notna().to_numpy()
+        sketches = hll_sketch.build_sketches(
+            df['user_id'].to_numpy()[known].astype('int64'), cells[known], len(cube), sketch_precision
+        )
+        cube['hll'] = hll_sketch.to_bytes(sketches)
+    cube = cube.reset_index()
+    # Month periods are labelled per cell rather than per row
+    cube['Month'] = cube['Month'].astype(str)
+    return cube
+
+
+def build_cubes(df, sketch_precision=None):
+    # (main cube, Month x weekday cube) from one pass over the rows
+    return build_cube(df, sketch_precision), build_cube(df, dims=WEEKDAY_DIMENSIONS)
+
+
+def merge_cubes(partials, dims=DIMENSIONS):
+    # Combines cubes built from disjoint sets of rows: measures add and
+    # sketches take the register-wise maximum
+    cube = pd.concat(partials, ignore_index=True)
+    grouped = cube.groupby(dims, observed=True, dropna=False)
+    merged = grouped[MEASURES].sum()
+    if 'hll' in cube.columns:
+        merged['hll'] = hll_sketch.to_bytes(hll_sketch.merge(hll_sketch.from_bytes(cube['hll']), grouped.ngroup().to_numpy()))
+    return merged.reset_index()
+
+
+def build_cubes_parallel(table, workers=None, sketch_precision=None):
+    # Same cubes as build_cubes(load_table(table)), built month by month in a
+    # process pool (see parallel_aggregate.py). Every cell belongs to one month,
+    # so each cell is computed from the same rows, in the same order, as the
+    # serial build.
+    partials = parallel_aggregate.map_months(build_cubes, table, workers=workers, sketch_precision=sketch_precision)
+    return (merge_cubes([cube for cube, _ in partials]),
+            merge_cubes([weekday for _, weekday in partials], WEEKDAY_DIMENSIONS))
+
+
+def cube_layout(cube):
+    # build_cube options matching an existing cube, so appended cells stay mergeable
+    return {'sketch_precision': hll_sketch.sketch_precision(cube['hll']) if 'hll' in cube.columns else None}
+
+
+def users_exact(cube, max_error=None):
+    # Exact distinct users come from the user bitmaps. Sketches are used when
+    # the caller accepts an error bound they meet.
+    if max_error is None or 'hll' not in cube.columns:
+        return True
+    return hll_sketch.standard_error(hll_sketch.sketch_precision(cube['hll'])) > max_error
+
+
+def bitmap_users(cube, dims, where=None, users=None):
+    # Exact distinct users per rollup group, keyed like the groupby in rollup().
+    # A group's users in one month are the intersection of that month's
+    # bitmaps for its dimension values, and each `where` filter adds the union
+    # of its values' bitmaps. Intersecting per-dimension sets is exact here
+    # because Age, Gender and Location are fixed per user and Type_user per
+    # user and month, so Merchant_name is the only dimension that varies
+    # between one user's transactions in a month.
+    users = load_user_index() if users is None else users
+    segments = [d for d in dims if d != 'Month']
+    filters = [(col, values) for col, values in (where or {}).items() if col != 'Month']
+    pairs = cube[list(dict.fromkeys(dims + ['Month']))].dropna().drop_duplicates()
+    decoded = {}
+
+    def active(month, dim=ALL, value=ALL):
+        key = (month, dim, str(value))
+        if key not in decoded:
+            decoded[key] = users.active(month, None if dim == ALL else (dim, value))
+        return decoded[key]
+
+    groups = {}
+    for row in pairs.itertuples(index=False):
+        row = dict(zip(pairs.columns, row))
+        month = row['Month']
+        bitmap = active(month)
+        for dim in segments:
+            bitmap = bitmap & active(month, dim, row[dim])
+        for col, values in filters:
+            bitmap = bitmap & union_all(active(month, col, value) for value in values)
+        key = tuple(row[d] for d in dims)
+        groups[key] = groups[key] | bitmap if key in groups else bitmap
+    return {key: len(bitmap) for key, bitmap in groups.items()}
+
+
+def sketch_users(cube, dims):
+    # Merges the cell sketches per group; groups are numbered in sorted key order
+    # like the groupby in rollup()
+    keys = dims or [np.zeros(len(cube), dtype='int8')]
+    groups = cube.groupby(keys, observed=True).ngroup()
+    known = groups.notna().to_numpy() & (groups.to_numpy() >= 0)
+    groups = groups.to_numpy()[known].astype('int64')
+    if not len(groups):
+        return np.zeros(0, dtype='int64')
+    merged = hll_sketch.merge(hll_sketch.from_bytes(cube['hll'].to_numpy()[known]), groups)
+    return np.rint(hll_sketch.estimate(merged)).astype('int64')
+
+
+def rollup(cube, dims, where=None, distinct_users=True, max_error=None, users=None):
+    # Aggregates the cube to `dims` (any subset of DIMENSIONS, [] for a grand
+    # total). `where` optionally restricts cells: {dimension: allowed values};
+    # a cube that was already filtered must still pass its filters here for
+    # the distinct user counts. `max_error` accepts approximate distinct users
+    # within that relative standard error; the Users_exact column says which
+    # kind each row holds. `users` is a user_bitmaps.UserIndex, loaded when
+    # exact counts are needed and none is given.
+    dims = list(dims)
+    if where:
+        for col, values in where.items():
+            cube = cube[cube[col].isin(values)]
+    keys = dims or [np.zeros(len(cube), dtype='int8')]
+
+    out = cube.groupby(keys, observed=True)[MEASURES].sum()
+    if distinct_users:
+        exact = users_exact(cube, max_error)
+        if exact:
+            counts = bitmap_users(cube, dims, where, users)
+            groups = [key if len(dims) > 1 else (key,) if dims else () for key in out.index]
+            out['Users'] = np.array([counts.get(key, 0) for key in groups], dtype='int64')
+        else:
+            out['Users'] = sketch_users(cube, dims)
+        out['Users_exact'] = exact
+    out['Avg Amount'] = out['Amount'] / out['Amount_count']
+    out['Avg Revenue'] = out['Revenue'] / out['Revenue_count']
+    return out.reset_index(drop=not dims)
+
+
+def monthly_series(cube, max_error=None, where=None, users=None):
+    # Same frame as incremental_update.monthly_aggregates, rolled up from the
+    # cube, plus whether the user counts are exact
+    if users is None and users_exact(cube, max_error):
+        users = load_user_index()
+    monthly = rollup(cube, ['Month'], where=where, max_error=max_error, users=users).set_index('Month')
+    new_where = dict(where or {})
+    new_where['Type_user'] = [v for v in new_where.get('Type_user', ['New']) if v == 'New']
+    new_users = rollup(cube, ['Month'], where=new_where, max_error=max_error, users=users).set_index('Month')['Users']
+    return pd.DataFrame({
+        'Revenue': monthly['Revenue'],
+        'Transactions': monthly['Transactions'],
+        'Active Users': monthly['Users'],
+        'New Users': new_users.reindex(monthly.index, fill_value=0),
+        'Users_exact': monthly['Users_exact'],
+    }).reset_index()
+
+
+def load_cube():
+    try:
+        return load_table(CUBE_TABLE)
+    except FileNotFoundError:
+        # Older runs have no cube yet: build it from the enriched rows
+        return build_cube(load_table('transactions_with_revenue_userinfo'))
+
+
+def load_weekday_cube():
+    try:
+        return load_table(WEEKDAY_TABLE)
+    except FileNotFoundError:
+        return build_cube(load_table('transactions_with_revenue_userinfo'), dims=WEEKDAY_DIMENSIONS)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the rollup cubes from the enriched transactions.')
+    parser.add_argument('--sketch-error', type=float, default=None,
+                        help='also store per-cell user sketches with this relative standard error (e.g. 0.02)')
+    parser.add_argument('--workers', type=int, default=parallel_aggregate.configured_workers(),
+                        help=f'build the cubes month by month in this many processes '
+                             f'(0: one per CPU; default: ${parallel_aggregate.WORKERS_ENV} or 1)')
+    args = parser.parse_args()
+
+    precision = hll_sketch.precision_for_error(args.sketch_error) if args.sketch_error else None
+    if args.workers == 1:
+        cube, weekday = build_cubes(load_table('transactions_with_revenue_userinfo'), sketch_precision=precision)
+    else:
+        cube, weekday = build_cubes_parallel('transactions_with_revenue_userinfo', args.workers or None,
+                                             sketch_precision=precision)
+    save_table(cube, CUBE_TABLE)
+    save_table(weekday, WEEKDAY_TABLE)
+    print(f" Rollup cube saved: {int(cube['Transactions'].sum())} transactions -> {len(cube)} cells over {DIMENSIONS}")
+    print(f" Weekday cube saved: {len(weekday)} cells over {WEEKDAY_DIMENSIONS}")
+    if precision:
+        print(f" User sketches: precision {precision}, standard error {hll_sketch.standard_error(precision):.4f}")
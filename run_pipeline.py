@@ -0,0 +1,276 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import runpy
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from storage import DATA_DIR, table_path, table_dir
+from instrumentation import span, new_run_id
+from parallel_aggregate import WORKERS_ENV
+
+# Dependency-aware runner for the pipeline scripts.
+# Each stage declares the files it reads and writes; a stage is skipped when
+# the content hash of its inputs and code matches the last successful run and
+# its outputs still exist. Stages whose dependencies are done run concurrently.
+# The dashboard is a long-running server (Procfile), so it is not a stage here.
+
+STATE_PATH = os.path.join(DATA_DIR, '.pipeline_state.json')
+LOG_DIR = os.path.join(DATA_DIR, 'logs')
+WORKBOOK = 'mini-Hackathon-question.xlsx'
+SHARED_CODE = ['storage.py', 'schema.py', 'instrumentation.py']
+
+CLEANED = [table_path(n) for n in ['transactions_cleaned', 'commission_cleaned', 'user_info_cleaned']]
+# Transaction tables are stored partitioned by month (a directory, see storage.py)
+FINAL = [table_dir('transactions_final')] + [table_path(n) for n in ['commission_final', 'user_info_final']]
+ENRICHED = table_dir('transactions_with_revenue_userinfo')
+CUBE = table_path('rollup_cube')
+WEEKDAY_CUBE = table_path('rollup_weekday')
+BITMAPS = [table_path('user_codes'), table_path('user_bitmaps')]
+COHORTS = [table_path('cohort_retention'), table_path('cohort_sizes')]
+# Validation reports; listing one as an input gates a stage on its validation passing
+CLEANED_REPORT = os.path.join(DATA_DIR, 'validation', 'cleaned.json')
+MERGED_REPORT = os.path.join(DATA_DIR, 'validation', 'master_merged.json')
+
+STAGES = {
+    'clean': {
+        'script': 'data_cleaning.py',
+        'code': ['dimension_index.py', 'order_index.py', 'date_dimension.py', 'workbook_cache.py'],
+        'inputs': [WORKBOOK],
+        'outputs': CLEANED + [os.path.join(DATA_DIR, 'order_ids.npy')],
+    },
+    'validate_cleaned': {
+        'script': 'data_validation_checklist.py',
+        'code': ['validation.py', 'dimension_index.py'],
+        'inputs': CLEANED,
+        'outputs': [CLEANED_REPORT],
+    },
+    'adjust_to_schema': {
+        'script': 'adjust_to_schema.py',
+        'inputs': CLEANED + [CLEANED_REPORT],
+        'outputs': FINAL,
+    },
+    'merge_master': {
+        'script': 'merge_master_dataset.py',
+        'code': ['dimension_index.py'],
+        'inputs': FINAL,
+        'outputs': [table_dir('master_merged')],
+    },
+    'validate_merged': {
+        'script': 'validate_merged_csv.py',
+        'code': ['validation.py', 'dimension_index.py'],
+        'inputs': [table_dir('master_merged')],
+        'outputs': [MERGED_REPORT],
+    },
+    'partA': {
+        'script': 'hackathon_partA_answers.py',
+        'code': ['incremental_update.py', 'dimension_index.py', 'date_dimension.py', 'parallel_aggregate.py'],
+        'inputs': FINAL + [MERGED_REPORT],
+        'outputs': [ENRICHED, os.path.join(DATA_DIR, 'summary_results.csv'),
+                    table_path('monthly_aggregates'), table_path('user_first_month'), table_path('date_dimension')],
+    },
+    # Parity check of the SQL backend; fails the run when its answers drift from the pandas ones
+    'partA_sql_check': {
+        'script': 'hackathon_partA_sql.py',
+        'args': ['--check'],
+        'code': ['sql_backend.py', 'date_dimension.py'],
+        'inputs': FINAL + [os.path.join(DATA_DIR, 'summary_results.csv')],
+        'outputs': [os.path.join(DATA_DIR, 'validation', 'partA_sql.csv')],
+    },
+    'rollup_cube': {
+        'script': 'rollup_cube.py',
+        'code': ['hll_sketch.py', 'parallel_aggregate.py', 'user_bitmaps.py'],
+        'inputs': [ENRICHED],
+        'outputs': [CUBE, WEEKDAY_CUBE],
+    },
+    'user_bitmaps': {
+        'script': 'user_bitmaps.py',
+        'inputs': [ENRICHED],
+        'outputs': BITMAPS,
+    },
+    'cohort_retention': {
+        'script': 'cohort_retention.py',
+        'inputs': [ENRICHED, table_path('user_info_final')],
+        'outputs': COHORTS,
+    },
+    'dashboard_store': {
+        'script': 'dashboard_store.py',
+        'code': ['rollup_cube.py', 'user_bitmaps.py', 'cohort_retention.py'],
+        'inputs': [CUBE, WEEKDAY_CUBE, table_path('monthly_aggregates')] + BITMAPS + COHORTS,
+        'outputs': [os.path.join(DATA_DIR, 'dashboard_store', 'monthly.arrow')],
+    },
+    'partC': {
+        'script': 'partC_analysis_business_insights.py',
+        'code': ['rollup_cube.py', 'user_bitmaps.py', 'metric_planner.py', 'cashback_scenarios.py',
+                 'cohort_retention.py', 'report_writer.py'],
+        'inputs': [ENRICHED, CUBE] + BITMAPS + COHORTS,
+        'outputs': [os.path.join(DATA_DIR, 'hackathon_partC_summary.xlsx')],
+    },
+    'export_offline_charts': {
+        'script': 'export_offline_charts.py',
+        'code': ['incremental_update.py', 'rollup_cube.py', 'user_bitmaps.py', 'report_writer.py'],
+        'inputs': [CUBE, WEEKDAY_CUBE, table_path('monthly_aggregates')],
+        'outputs': [os.path.join(DATA_DIR, 'hackathon_dashboard_output.xlsx')],
+    },
+}
+
+
+def dependencies(stages):
+    # A stage depends on every stage that produces one of its inputs
+    producers = {out: name for name, stage in stages.items() for out in stage['outputs']}
+    return {
+        name: {producers[path] for path in stage['inputs'] if path in producers}
+        for name, stage in stages.items()
+    }
+
+
+def resolve(path):
+    # A table appended to since its last full write is a directory of part files
+    # (storage.append_table) until the next save_table turns it back into one file
+    directory = os.path.splitext(path)[0]
+    if path.endswith('.parquet') and os.path.isdir(directory):
+        return directory
+    return path
+
+
+def file_digest(path):
+    # A directory (a partitioned table) hashes as its files' relative paths and contents
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, _, files in sorted(os.walk(path)):
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(file_digest(file_path).encode())
+        return digest.hexdigest()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(stage):
+    digest = hashlib.sha256()
+    digest.update(' '.join(stage.get('args', [])).encode())
+    for path in [stage['script']] + SHARED_CODE + stage.get('code', []) + stage['inputs']:
+        digest.update(path.encode())
+        path = resolve(path)
+        digest.update(file_digest(path).encode() if os.path.exists(path) else b'missing')
+    return digest.hexdigest()
+
+
+def load_state():
+    if os.path.exists(STATE_PATH):
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state):
+    with open(STATE_PATH, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+
+def run_stage(name, script, args=()):
+    # Runs in a worker process; the script's console output goes to data/logs/<stage>.log
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_path = os.path.join(LOG_DIR, f'{name}.log')
+    start = time.perf_counter()
+    status = 0
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        sys.argv = [script] + list(args)
+        try:
+            with span(name):
+                runpy.run_path(script, run_name='__main__')
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            status = 1
+    return status, time.perf_counter() - start, log_path
+
+
+def run_pipeline(stages=STAGES, jobs=None, force=False, only=None):
+    deps = dependencies(stages)
+    state = load_state()
+    results = {}
+    pending = set(only) if only else set(stages)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=jobs, max_tasks_per_child=1) as pool:
+        while pending or running:
+            for name in sorted(pending):
+                upstream = deps[name]
+                in_flight = {n for n, _ in running.values()}
+                if any(results.get(dep, {}).get('status') in ('failed', 'blocked') for dep in upstream):
+                    results[name] = {'status': 'blocked', 'seconds': 0.0}
+                    pending.discard(name)
+                    continue
+                if any(dep in pending or dep in in_flight for dep in upstream):
+                    continue
+
+                stage = stages[name]
+                # Fingerprint once the upstream outputs are final
+                key = fingerprint(stage)
+                up_to_date = state.get(name) == key and all(os.path.exists(resolve(p)) for p in stage['outputs'])
+                if up_to_date and not force:
+                    results[name] = {'status': 'skipped', 'seconds': 0.0}
+                else:
+                    running[pool.submit(run_stage, name, stage['script'], stage.get('args', []))] = (name, key)
+                pending.discard(name)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key = running.pop(future)
+                status, seconds, log_path = future.result()
+                if status == 0:
+                    state[name] = key
+                    results[name] = {'status': 'ran', 'seconds': seconds}
+                else:
+                    state.pop(name, None)
+                    results[name] = {'status': 'failed', 'seconds': seconds, 'log': log_path}
+                save_state(state)
+    return results
+
+
+def print_report(results, total):
+    print(f"\n{'Stage':<24}{'Status':<10}{'Seconds':>10}")
+    for name in STAGES:
+        if name in results:
+            r = results[name]
+            print(f"{name:<24}{r['status']:<10}{r['seconds']:>10.2f}" + (f"  see {r['log']}" if 'log' in r else ''))
+    print(f"{'total (wall)':<34}{total:>10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the pipeline stages in dependency order, skipping unchanged ones.')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'processes per parallel stage (Part A, rollup cubes; 0: one per CPU; '
+                             f'default: ${WORKERS_ENV} or 1)')
+    parser.add_argument('--force', action='store_true', help='re-run every stage even if its inputs are unchanged')
+    parser.add_argument('--only', nargs='+', choices=list(STAGES), help='run only these stages')
+    parser.add_argument('--list', action='store_true', help='print the stage graph and exit')
+    args = parser.parse_args()
+
+    if args.list:
+        for name, upstream in dependencies(STAGES).items():
+            print(f"{name:<24}<- {', '.join(sorted(upstream)) or '(source)'}")
+        sys.exit(0)
+
+    if args.workers is not None:
+        # Stages read it through parallel_aggregate.configured_workers()
+        os.environ[WORKERS_ENV] = str(args.workers)
+
+    start = time.perf_counter()
+    # Every stage's spans are recorded under this run id (see instrumentation.py)
+    print(f" Run {new_run_id()}")
+    results = run_pipeline(jobs=args.jobs, force=args.force, only=args.only)
+    print_report(results, time.perf_counter() - start)
+    sys.exit(1 if any(r['status'] in ('failed', 'blocked') for r in results.values()) else 0)
@@ -0,0 +1,117 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Canonical in-memory types of the pipeline's columns, by column name.
+# storage.py applies them to every table it saves and loads, so consumers get
+# projected (load_table(name, columns=[...])) and typed frames without their
+# own conversions. Low-cardinality text becomes categorical, ids and small
+# measures use the narrowest integer type that holds them (a column whose
+# values do not fit keeps its wider type), and dates are datetime64.
+
+DATE = 'date'
+PERIOD = 'period'
+CATEGORY = 'category'
+
+COLUMNS = {
+    # ids
+    'user_id': 'int32', 'User_id': 'int32',
+    'order_id': 'int64',
+    'day_key': 'int32',
+    'merchant_id': 'int8', 'Merchant_id': 'int8',
+    # measures
+    'amount': 'Int32', 'Amount': 'Int32',
+    'rate_pct': 'Int8', 'Rate_pct': 'Int8',
+    # dates
+    'date': DATE, 'Date': DATE,
+    'first_tran_date': DATE, 'First_tran_date': DATE,
+    'tran_month': PERIOD, 'first_tran_month': PERIOD,
+    # categoricals
+    'purchase_status': CATEGORY, 'Purchase_status': CATEGORY,
+    'merchant_name': CATEGORY, 'Merchant_name': CATEGORY,
+    'age': CATEGORY, 'Age': CATEGORY,
+    'gender': CATEGORY, 'Gender': CATEGORY,
+    'location': CATEGORY, 'Location': CATEGORY,
+    'type_user': CATEGORY, 'Type_user': CATEGORY,
+    'weekday': CATEGORY,
+    'holiday': CATEGORY,
+}
+
+# Derivable columns the enriched transactions no longer carry:
+# User_id duplicates user_id, tran_month is Month, first_tran_month is
+# First_tran_date's month
+REDUNDANT_COLUMNS = ['User_id', 'tran_month', 'first_tran_month']
+
+
+def _narrow_int(col, dtype):
+    # Integer cast that keeps the column as-is when its values do not fit or
+    # are not whole numbers; NA forces the nullable variant
+    if not pd.api.types.is_numeric_dtype(col) or pd.api.types.is_bool_dtype(col):
+        return col
+    values = col.dropna()
+    if len(values):
+        info = np.iinfo(dtype.lower())
+        if values.min() < info.min or values.max() > info.max:
+            return col
+        if pd.api.types.is_float_dtype(values) and not (values == values.round()).all():
+            return col
+    nullable = dtype[0].upper() + dtype[1:]
+    return col.astype(nullable if dtype == nullable or col.hasnans else dtype)
+
+
+def apply_schema(df):
+    for col, kind in COLUMNS.items():
+        if col not in df.columns:
+            continue
+        if kind == DATE:
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif kind == PERIOD:
+            if not isinstance(df[col].dtype, pd.PeriodDtype):
+                df[col] = pd.to_datetime(df[col], errors='coerce').dt.to_period('M')
+        elif kind == CATEGORY:
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+        elif df[col].dtype != kind:
+            df[col] = _narrow_int(df[col], kind)
+    return df
+
+
+def footprint(df):
+    # In-memory bytes per column
+    usage = df.memory_usage(deep=True, index=False)
+    return pd.DataFrame({'dtype': df.dtypes.astype(str), 'MB': usage / 1e6})
+
+
+def memory_report(name):
+    # Default pandas read of the CSV hand-off vs. the typed, stored table
+    from storage import load_table, table_path
+
+    typed = load_table(name)
+    csv_path = table_path(name, 'csv')
+    raw = pd.read_csv(csv_path) if os.path.exists(csv_path) else None
+    report = footprint(typed).add_prefix('typed ')
+    if raw is not None:
+        report = footprint(raw).add_prefix('default ').join(report, how='outer')
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report the in-memory footprint of stored tables.')
+    parser.add_argument('tables', nargs='*', default=[
+        'transactions_final', 'commission_final', 'user_info_final',
+        'master_merged', 'transactions_with_revenue_userinfo',
+    ])
+    args = parser.parse_args()
+
+    for name in args.tables:
+        report = memory_report(name)
+        print(f"\n{name}")
+        print(report.round(3).to_string())
+        if 'default MB' in report.columns:
+            default, typed = report['default MB'].sum(), report['typed MB'].sum()
+            print(f" total: {default:.2f} MB default -> {typed:.2f} MB typed ({default / typed:.1f}x smaller)")
+        else:
+            print(f" total: {report['typed MB'].sum():.2f} MB typed")
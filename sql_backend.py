@@ -0,0 +1,44 @@
+from storage import table_files
+
+# Embedded SQL engine over the stored tables.
+# DuckDB reads the Parquet files in place: every stored table is exposed as a
+# view over read_parquet, so a query only decodes the columns it names, skips
+# row groups whose min/max statistics cannot match its filters, and runs on all
+# cores. Nothing is loaded into pandas except the (small) query results.
+# Each view also carries `filename` and `file_row_number`, which give the
+# stored row order (needed for "first row wins" de-duplication).
+# duckdb is optional: only the SQL code paths import it.
+
+
+def connect(threads=None):
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("The SQL backend needs the duckdb package (pip install duckdb)") from e
+    con = duckdb.connect()
+    if threads:
+        con.execute(f'SET threads = {int(threads)}')
+    return con
+
+
+def table_source(name):
+    # SQL list of the Parquet files behind a stored table, the same files
+    # storage.load_table reads
+    files = table_files(name)
+    if not files:
+        raise FileNotFoundError(f"Stored table '{name}' has no Parquet files")
+    return '[' + ', '.join("'" + path.replace("'", "''") + "'" for path in files) + ']'
+
+
+def register_tables(con, names):
+    for name in names:
+        con.execute(
+            f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM read_parquet({table_source(name)}, "
+            "filename = true, file_row_number = true, union_by_name = true)"
+        )
+    return con
+
+
+def explain(con, sql):
+    # Physical plan, showing the projected columns and pushed-down filters per scan
+    return con.execute(f'EXPLAIN {sql}').fetchall()[0][1]
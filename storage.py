@@ -0,0 +1,312 @@
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from schema import apply_schema
+
+# Shared storage layer for the hand-offs between pipeline stages.
+# Every stage writes its output as a compressed Parquet file, so dates, narrow
+# integers, periods and categoricals (see schema.py) come back already typed on
+# the next read.
+#
+# Transaction tables can also be stored partitioned by month of a date column:
+#   data/<name>/year=2020/month=01/part-00000.parquet
+# (rows without a date go to year=0000/month=00). load_table/iter_table with a
+# start/end date then open only the partitions of the months in range, and
+# replace_partitions rewrites the months present in a frame without touching
+# the others, so a one-month read or rewrite costs the same however much
+# history is stored.
+
+DATA_DIR = 'data'
+COMPRESSION = 'zstd'
+PARTITION_META = '_partitioning.json'
+
+def table_path(name, ext='parquet'):
+    return os.path.join(DATA_DIR, f'{name}.{ext}')
+
+
+def table_dir(name):
+    return os.path.join(DATA_DIR, name)
+
+
+def partition_column(name):
+    # Date column a stored table is partitioned by, None when it is not partitioned
+    path = os.path.join(table_dir(name), PARTITION_META)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)['column']
+
+
+def partition_dir(name, year, month):
+    return os.path.join(table_dir(name), f'year={year:04d}', f'month={month:02d}')
+
+
+def partitions(name):
+    # (year, month) -> partition directory, in month order
+    found = {}
+    directory = table_dir(name)
+    for year_dir in sorted(os.listdir(directory)):
+        if not (year_dir.startswith('year=') and year_dir[5:].isdigit()):
+            continue
+        for month_dir in sorted(os.listdir(os.path.join(directory, year_dir))):
+            # Skips a month=MM.old left by an interrupted replace_partitions
+            if month_dir.startswith('month=') and month_dir[6:].isdigit():
+                year, month = int(year_dir[5:]), int(month_dir[6:])
+                found[(year, month)] = partition_dir(name, year, month)
+    return found
+
+
+def _month_groups(df, column):
+    dates = pd.to_datetime(df[column], errors='coerce')
+    keys = (dates.dt.year * 100 + dates.dt.month).fillna(0).astype('int64')
+    for key, part in df.groupby(keys.to_numpy(), sort=True):
+        yield (int(key) // 100, int(key) % 100), part
+
+
+def replace_partitions(df, name, column=None):
+    # Rewrites the month partitions that df has rows for; other months are not touched.
+    # Each month is written next to the table and swapped in, so a failed write
+    # leaves the previous version of that month in place.
+    column = column or partition_column(name)
+    if column is None:
+        raise ValueError(f"Table '{name}' is not partitioned; pass the date column to partition it by")
+    directory = table_dir(name)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, PARTITION_META), 'w') as f:
+        json.dump({'column': column}, f)
+    df = apply_schema(df.copy())
+    written = []
+    for (year, month), part in _month_groups(df, column):
+        target = partition_dir(name, year, month)
+        tmp = os.path.join(directory, f'.tmp-{year:04d}{month:02d}')
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        part.to_parquet(os.path.join(tmp, 'part-00000.parquet'), compression=COMPRESSION, index=False)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        old = target + '.old'
+        if os.path.exists(target):
+            os.replace(target, old)
+        os.replace(tmp, target)
+        shutil.rmtree(old, ignore_errors=True)
+        written.append(target)
+    return written
+
+
+def save_table(df, name, csv_copy=False, partition_by=None):
+    # partition_by: date column to store the table partitioned by month
+    os.makedirs(DATA_DIR, exist_ok=True)
+    df = apply_schema(df.copy())
+    # A full rewrite replaces any parts appended since the last one
+    shutil.rmtree(table_dir(name), ignore_errors=True)
+    if partition_by:
+        drop_table(name)
+        replace_partitions(df, name, partition_by)
+    else:
+        df.to_parquet(table_path(name), compression=COMPRESSION, index=False)
+    # Human-readable copy for the deliverables that are submitted as CSV
+    if csv_copy:
+        df.to_csv(table_path(name, 'csv'), index=False, date_format='%Y-%m-%d')
+    return table_dir(name) if partition_by else table_path(name)
+
+
+def drop_table(name):
+    # Removes a stored table (file or directory) before it is rewritten piece by piece
+    shutil.rmtree(table_dir(name), ignore_errors=True)
+    if os.path.exists(table_path(name)):
+        os.remove(table_path(name))
+
+
+def append_table(df, name, csv_copy=False):
+    # Adds rows to a stored table without rewriting the existing ones: the table
+    # becomes a directory of part files (the original file is moved in as part 0).
+    # A partitioned table gets a new part file in each month df has rows for.
+    # csv_copy: also add the rows to the table's CSV copy, if it has one
+    if csv_copy and os.path.exists(table_path(name, 'csv')):
+        header = pd.read_csv(table_path(name, 'csv'), nrows=0).columns
+        apply_schema(df.copy()).reindex(columns=header).to_csv(
+            table_path(name, 'csv'), mode='a', header=False, index=False, date_format='%Y-%m-%d'
+        )
+    column = partition_column(name)
+    if column:
+        paths = []
+        for (year, month), part in _month_groups(apply_schema(df.copy()), column):
+            directory = partition_dir(name, year, month)
+            os.makedirs(directory, exist_ok=True)
+            paths.append(_write_part(part, directory))
+        return paths
+
+    directory = table_dir(name)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+        if os.path.exists(table_path(name)):
+            os.replace(table_path(name), os.path.join(directory, 'part-00000.parquet'))
+    return _write_part(apply_schema(df.copy()), directory)
+
+
+def _write_part(df, directory):
+    parts = sorted(f for f in os.listdir(directory) if f.startswith('part-') and f.endswith('.parquet'))
+    next_part = int(parts[-1][5:10]) + 1 if parts else 0
+    path = os.path.join(directory, f'part-{next_part:05d}.parquet')
+    df.to_parquet(path, compression=COMPRESSION, index=False)
+    return path
+
+
+def month_bounds(month):
+    # (start, end) of a month such as '2020-01', for load_table(..., start=, end=)
+    period = pd.Period(month, freq='M')
+    return period.start_time, (period + 1).start_time
+
+
+def _partition_files(name, start=None, end=None):
+    # Part files of the month partitions overlapping [start, end); the undated
+    # partition only belongs to an unbounded read
+    lo = pd.Timestamp(start) if start is not None else None
+    hi = pd.Timestamp(end) if end is not None else None
+    files = []
+    for (year, month), directory in partitions(name).items():
+        if (year, month) == (0, 0):
+            selected = lo is None and hi is None
+        else:
+            first = pd.Timestamp(year, month, 1)
+            selected = (lo is None or lo < first + pd.offsets.MonthBegin(1)) and (hi is None or first < hi)
+        if selected:
+            files += _part_files(directory)
+    return files
+
+
+def table_files(name):
+    # Every Parquet file that makes up a stored table: the month partitions
+    # (never the .tmp-* / month=MM.old directories of a replace in progress),
+    # the part files of an appended table, or the single table file
+    if partition_column(name):
+        return _partition_files(name)
+    if os.path.isdir(table_dir(name)):
+        return _part_files(table_dir(name))
+    if os.path.exists(table_path(name)):
+        return [table_path(name)]
+    raise FileNotFoundError(f"No stored table '{name}' in {DATA_DIR}/ (looked for {table_path(name)} and {table_dir(name)}/)")
+
+
+def _date_filter(column, start=None, end=None):
+    expression = None
+    for bound, upper in [(start, False), (end, True)]:
+        if bound is None:
+            continue
+        value = pa.scalar(pd.Timestamp(bound).to_pydatetime(), type=pa.timestamp('us'))
+        term = ds.field(column) < value if upper else ds.field(column) >= value
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def _dataset(name, start=None, end=None, date_column=None, undated=False):
+    # Arrow dataset over a stored table and the row filter for a [start, end)
+    # date range (or for the rows without a date); for a partitioned table only
+    # the partitions in range are opened
+    column = partition_column(name)
+    if (start is not None or end is not None or undated) and not (column or date_column):
+        raise ValueError(f"Table '{name}' is not partitioned; pass date_column to filter it by date")
+    expression = ds.field(column or date_column).is_null() if undated else _date_filter(column or date_column, start, end)
+    if column:
+        if undated:
+            files = _part_files(partitions(name)[(0, 0)]) if (0, 0) in partitions(name) else []
+        else:
+            files = _partition_files(name, start, end)
+        if not files:
+            # Nothing in range: an empty read that still has the table's columns
+            files, expression = _partition_files(name)[:1], ds.scalar(False)
+        schema = pa.unify_schemas([pq.read_schema(f) for f in files], promote_options='permissive')
+        return ds.dataset(files, schema=schema, format='parquet'), expression
+    return ds.dataset(table_files(name), format='parquet'), expression
+
+
+def _part_files(directory):
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith('.parquet')]
+
+
+def load_table(name, columns=None, start=None, end=None, date_column=None):
+    # start/end: optional [start, end) range on the partition column (or on
+    # date_column for an unpartitioned table)
+    if partition_column(name) or (start is not None or end is not None):
+        source, expression = _dataset(name, start, end, date_column)
+        return apply_schema(source.to_table(columns=columns, filter=expression).to_pandas())
+
+    if os.path.isdir(table_dir(name)):
+        return apply_schema(pd.read_parquet(table_dir(name), columns=columns))
+
+    path = table_path(name)
+    if not os.path.exists(path):
+        # CSV copies are deliverables, never read back: a stale one must not stand in for the table
+        raise FileNotFoundError(f"No stored table '{name}' in {DATA_DIR}/ (looked for {path} and {table_dir(name)}/)")
+    # No-op for tables written by save_table; re-types chunk-written ones
+    return apply_schema(pd.read_parquet(path, columns=columns))
+
+
+def load_undated(name, columns=None, date_column=None):
+    # Rows whose date is missing: only the year=0000/month=00 partition of a
+    # partitioned table is read, an unpartitioned one is filtered on date_column
+    source, expression = _dataset(name, date_column=date_column, undated=True)
+    return apply_schema(source.to_table(columns=columns, filter=expression).to_pandas())
+
+
+def iter_table(name, chunksize, columns=None, start=None, end=None, date_column=None):
+    # Yields a stored table as typed frames of at most chunksize rows
+    if not (os.path.isdir(table_dir(name)) or os.path.exists(table_path(name))):
+        raise FileNotFoundError(f"No stored table '{name}' in {DATA_DIR}/")
+    source, expression = _dataset(name, start, end, date_column)
+    for batch in source.to_batches(columns=columns, filter=expression, batch_size=chunksize):
+        yield apply_schema(batch.to_pandas())
+
+
+class TableWriter:
+    # Writes a table chunk by chunk so the full frame never has to be in memory.
+    # Chunks are spooled to part files first; close() unifies their schemas
+    # (a chunk whose column is all-null has no type of its own), optionally
+    # enriches each chunk via `transform`, and streams them into one Parquet file.
+
+    def __init__(self, name):
+        self.name = name
+        self.parts_dir = os.path.join(DATA_DIR, f'.{name}.parts')
+        self.parts = []
+        self.rows = 0
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        os.makedirs(self.parts_dir)
+
+    def write(self, df):
+        if df.empty:
+            return
+        part = os.path.join(self.parts_dir, f'part-{len(self.parts):05d}.parquet')
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), part)
+        self.parts.append(part)
+        self.rows += len(df)
+
+    def close(self, transform=None):
+        path = table_path(self.name)
+        shutil.rmtree(table_dir(self.name), ignore_errors=True)
+        writer = None
+        try:
+            if not self.parts:
+                raise ValueError(f"No rows were written to table '{self.name}'")
+            schema = pa.unify_schemas([pq.read_schema(p) for p in self.parts], promote_options='permissive')
+            for part in self.parts:
+                df = pq.read_table(part).cast(schema).to_pandas()
+                if transform is not None:
+                    df = transform(df)
+                if writer is None:
+                    # Columns added by the transform take their type from the first chunk
+                    out_schema = schema
+                    for field in pa.Table.from_pandas(df, preserve_index=False).schema:
+                        if field.name not in out_schema.names:
+                            out_schema = out_schema.append(field)
+                    writer = pq.ParquetWriter(path, out_schema, compression=COMPRESSION)
+                writer.write_table(pa.Table.from_pandas(df[out_schema.names], schema=out_schema, preserve_index=False))
+        finally:
+            if writer is not None:
+                writer.close()
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+        return path
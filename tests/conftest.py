@@ -0,0 +1,76 @@
+import os
+import runpy
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The pipeline modules live at the repository root and resolve data/ against
+# the working directory, so each test runs in its own temporary directory.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage import save_table  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('instrumentation._enabled', False)
+    os.makedirs('data')
+    return tmp_path
+
+
+def run_script(name, *args):
+    # Runs a pipeline script as `python <name> <args>` would, in the current directory
+    argv = sys.argv
+    sys.argv = [name, *args]
+    try:
+        runpy.run_path(os.path.join(ROOT, name), run_name='__main__')
+    finally:
+        sys.argv = argv
+
+
+def final_transactions(seed=0, rows=600):
+    # A small year of transactions in the transactions_final schema: five
+    # known merchants and one without a commission rate, a few undated rows
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 366, rows), unit='D')
+    transactions = pd.DataFrame({
+        'user_id': rng.integers(1000, 1080, rows).astype('int32'),
+        'order_id': np.arange(5_000_000, 5_000_000 + rows, dtype='int64'),
+        'Date': pd.Series(dates).where(rng.random(rows) > 0.01),
+        'Amount': rng.choice([10000, 20000, 50000, 100000, 123457], rows).astype('int32'),
+        'Merchant_id': rng.choice([12, 13, 14, 15, 16, 17], rows).astype('int8'),
+        'Purchase_status': pd.Series(np.where(rng.random(rows) < 0.1, 'Mua hộ', None), dtype=object),
+    })
+    return transactions
+
+
+def final_dimensions():
+    # Commission and user tables with a repeated key each (the first row wins)
+    commission = pd.DataFrame({
+        'Merchant_name': ['Viettel', 'Mobifone', 'Vinaphone', 'Vietnamobile', 'Gmobile', 'Viettel'],
+        'Merchant_id': np.array([12, 13, 14, 15, 16, 12], dtype='int8'),
+        'Rate_pct': [2, 3, 3, 5, 7, 9],
+    })
+    users = np.arange(1000, 1080)
+    rng = np.random.default_rng(1)
+    user_info = pd.DataFrame({
+        'User_id': np.append(users, 1000).astype('int32'),
+        'First_tran_date': pd.Timestamp('2019-11-01') + pd.to_timedelta(rng.integers(0, 420, len(users) + 1), unit='D'),
+        'Location': rng.choice(['HCMC', 'HN', 'Other'], len(users) + 1),
+        'Age': rng.choice(['18_to_22', '23_to_27', '>37'], len(users) + 1),
+        'Gender': rng.choice(['Female', 'Male'], len(users) + 1),
+    })
+    return commission, user_info
+
+
+def save_final_tables(transactions=None):
+    # Writes the *_final tables like adjust_to_schema.py does
+    commission, user_info = final_dimensions()
+    transactions = final_transactions() if transactions is None else transactions
+    save_table(transactions, 'transactions_final', csv_copy=True, partition_by='Date')
+    save_table(commission, 'commission_final', csv_copy=True)
+    save_table(user_info, 'user_info_final', csv_copy=True)
@@ -0,0 +1,51 @@
+import os
+
+import pandas as pd
+
+from conftest import final_transactions, run_script, save_final_tables
+from incremental_update import AGGREGATES_TABLE, ENRICHED_TABLE, append_month
+from rollup_cube import CUBE_TABLE, WEEKDAY_TABLE
+from storage import load_table
+
+TABLES = ['transactions_final', 'master_merged', ENRICHED_TABLE, AGGREGATES_TABLE, CUBE_TABLE, WEEKDAY_TABLE]
+
+
+def build(transactions):
+    # The full-pipeline stages an incremental append stands in for
+    save_final_tables(transactions)
+    run_script('merge_master_dataset.py')
+    run_script('hackathon_partA_answers.py')
+    run_script('rollup_cube.py', '--workers', '1')
+
+
+def canonical(df):
+    return df.astype(object).sort_values(list(df.columns), key=lambda c: c.astype(str), ignore_index=True)
+
+
+def snapshot():
+    # Every table (and the CSV copies of the final ones) as plain values in a canonical row order
+    tables = {name: canonical(load_table(name)) for name in TABLES}
+    for name in ['transactions_final', 'master_merged']:
+        tables[f'{name}.csv'] = canonical(pd.read_csv(f'data/{name}.csv', dtype=str))
+    return tables
+
+
+def test_appended_month_equals_full_rebuild(workdir, monkeypatch):
+    transactions = final_transactions()
+    held_out = transactions['Date'].dt.to_period('M') == pd.Period('2020-12')
+
+    os.makedirs(workdir / 'full' / 'data')
+    monkeypatch.chdir(workdir / 'full')
+    build(transactions)
+    full = snapshot()
+
+    os.makedirs(workdir / 'append' / 'data')
+    monkeypatch.chdir(workdir / 'append')
+    build(transactions[~held_out])
+    transactions[held_out].to_parquet('december.parquet', index=False)
+    month, rows = append_month('december.parquet')
+    assert (month, rows) == ('2020-12', held_out.sum())
+    appended = snapshot()
+
+    for name in full:
+        pd.testing.assert_frame_equal(appended[name], full[name], check_exact=False, rtol=1e-12, obj=name)
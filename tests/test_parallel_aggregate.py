@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from conftest import final_transactions
+from parallel_aggregate import aggregate, load_task, month_tasks
+from storage import load_table, save_table
+
+AGGS = {
+    'Amount_sum': ('Amount', 'sum'),
+    'Amount_mean': ('Amount', 'mean'),
+    'orders': ('order_id', 'count'),
+    'rows': ('order_id', 'size'),
+    'users': ('user_id', 'nunique'),
+}
+
+
+def stored_table(rng_seed=0):
+    # Float amounts so that sums depend on the order they are added in
+    df = final_transactions(rng_seed)
+    df['Amount'] = df['Amount'] * np.random.default_rng(2).random(len(df))
+    df['Month'] = df['Date'].dt.to_period('M')
+    save_table(df, 'transactions', partition_by='Date')
+    return load_table('transactions')
+
+
+def test_worker_count_does_not_change_the_result(workdir):
+    stored_table()
+    for by in [['Merchant_id'], ['Month'], ['Merchant_id', 'Purchase_status']]:
+        serial = aggregate('transactions', by, AGGS, workers=1)
+        pooled = aggregate('transactions', by, AGGS, workers=2)
+        pd.testing.assert_frame_equal(serial, pooled, check_exact=True)
+
+
+def test_matches_a_serial_groupby_within_rounding(workdir):
+    df = stored_table()
+    for by in [['Merchant_id'], ['Month']]:
+        expected = df.groupby(by, observed=True, dropna=False).agg(**AGGS).sort_index()
+        result = aggregate('transactions', by, AGGS, workers=2)
+        for name in ['orders', 'rows', 'users']:
+            assert np.array_equal(result[name].to_numpy(), expected[name].to_numpy())
+        for name in ['Amount_sum', 'Amount_mean']:
+            np.testing.assert_allclose(result[name].to_numpy(), expected[name].to_numpy(), rtol=1e-12)
+    # Groups keyed by month are summed in the serial order
+    monthly = aggregate('transactions', 'Month', AGGS, workers=2)
+    expected = df.groupby('Month', dropna=False).agg(**AGGS).sort_index()
+    assert np.array_equal(monthly['Amount_sum'].to_numpy(), expected['Amount_sum'].to_numpy())
+
+
+def test_undated_task_reads_only_undated_rows(workdir):
+    df = stored_table()
+    assert month_tasks('transactions')[-1] is None
+    undated = load_task('transactions', None, columns=['order_id'])
+    assert list(undated.columns) == ['order_id']
+    assert sorted(undated['order_id']) == sorted(df.loc[df['Date'].isna(), 'order_id'])
+
+    save_table(df, 'flat')
+    undated = load_task('flat', None, columns=['order_id', 'Date'])
+    assert sorted(undated['order_id']) == sorted(df.loc[df['Date'].isna(), 'order_id'])
+    assert undated['Date'].isna().all()
@@ -0,0 +1,29 @@
+import shutil
+
+import pandas as pd
+
+from conftest import run_script, save_final_tables
+from hackathon_partA_sql import SUMMARY_PATH, TABLES, answers, compare
+from sql_backend import connect, register_tables
+
+
+def test_sql_answers_match_pandas(workdir):
+    save_final_tables()
+    run_script('hackathon_partA_answers.py')
+
+    summary = answers(register_tables(connect(), TABLES))
+    diff = compare(summary)
+    assert diff['Match'].all(), diff.to_string()
+    assert len(pd.read_csv(SUMMARY_PATH)) == 5
+
+
+def test_sql_ignores_leftover_partition_directories(workdir):
+    # A replace interrupted between its renames leaves .tmp-* and month=MM.old
+    # directories; neither backend may read them
+    save_final_tables()
+    before = answers(register_tables(connect(), TABLES))
+    table = workdir / 'data' / 'transactions_final'
+    shutil.copytree(table / 'year=2020' / 'month=01', table / 'year=2020' / 'month=01.old')
+    shutil.copytree(table / 'year=2020' / 'month=12', table / '.tmp-202012')
+    after = answers(register_tables(connect(), TABLES))
+    pd.testing.assert_frame_equal(before, after)
@@ -0,0 +1,276 @@
+import argparse
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from storage import load_table, save_table, append_table
+
+# Exact per-month user sets as compressed bitmaps.
+# Users get dense integer codes (user_codes table): each load's new user ids
+# take the next free codes in ascending id order, and a code never changes
+# once assigned. Each (month, segment) set is split into 65536-code chunks like
+# a roaring bitmap: a sparse chunk is a sorted uint16 array, a dense one a
+# 1024-word bit set, so a month costs at most ~2 bytes per active user however
+# many transactions they made. Union, intersection and difference work chunk
+# by chunk, which turns returning / reactivated / churned users for any pair
+# of months into set algebra instead of joins over transaction rows.
+
+CODES_TABLE = 'user_codes'
+BITMAP_TABLE = 'user_bitmaps'
+SEGMENT_DIMENSIONS = ['Age', 'Gender', 'Location', 'Merchant_name', 'Type_user']
+ALL = 'All'
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+ARRAY_LIMIT = 4096  # above this many codes a chunk is smaller as a bit set
+ARRAY, BITSET = 0, 1
+
+
+def _to_bitset(low):
+    bits = np.zeros(CHUNK_SIZE, dtype=bool)
+    bits[low] = True
+    return np.packbits(bits, bitorder='little').view('uint64')
+
+
+def _to_array(words):
+    return np.flatnonzero(np.unpackbits(words.view('uint8'), bitorder='little')).astype('uint16')
+
+
+def _container(low):
+    # Smallest representation for a sorted array of chunk-local codes
+    if len(low) > ARRAY_LIMIT:
+        return BITSET, _to_bitset(low)
+    return ARRAY, low.astype('uint16')
+
+
+def _cardinality(kind, data):
+    if kind == BITSET:
+        return int(np.unpackbits(data.view('uint8')).sum())
+    return len(data)
+
+
+class UserBitmap:
+
+    def __init__(self, containers=None):
+        # high 16 bits of the code -> (kind, data)
+        self.containers = containers or {}
+
+    @classmethod
+    def from_codes(cls, codes):
+        codes = np.unique(np.asarray(codes, dtype='uint32'))
+        high = codes >> CHUNK_BITS
+        bounds = np.flatnonzero(np.diff(high)) + 1
+        containers = {}
+        for chunk in np.split(codes, bounds):
+            if len(chunk):
+                containers[int(chunk[0] >> CHUNK_BITS)] = _container(chunk & (CHUNK_SIZE - 1))
+        return cls(containers)
+
+    def to_codes(self):
+        parts = [
+            (np.uint32(high) << CHUNK_BITS) | (_to_array(data) if kind == BITSET else data).astype('uint32')
+            for high, (kind, data) in sorted(self.containers.items())
+        ]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype='uint32')
+
+    def __len__(self):
+        return sum(_cardinality(kind, data) for kind, data in self.containers.values())
+
+    def _combine(self, other, highs, array_op, bitset_op):
+        containers = {}
+        for high in highs:
+            a = self.containers.get(high)
+            b = other.containers.get(high)
+            if a is None or b is None:
+                # Only reachable for union / difference, where the present side is the result
+                kind, data = a if a is not None else b
+            elif a[0] == ARRAY and b[0] == ARRAY:
+                kind, data = _container(array_op(a[1], b[1]))
+            else:
+                words = bitset_op(*(d if k == BITSET else _to_bitset(d) for k, d in (a, b)))
+                kind, data = _container(_to_array(words))
+            if _cardinality(kind, data):
+                containers[high] = (kind, data)
+        return UserBitmap(containers)
+
+    def __or__(self, other):
+        return self._combine(
+            other, self.containers.keys() | other.containers.keys(),
+            lambda a, b: np.union1d(a, b), np.bitwise_or
+        )
+
+    def __and__(self, other):
+        return self._combine(
+            other, self.containers.keys() & other.containers.keys(),
+            lambda a, b: np.intersect1d(a, b, assume_unique=True), np.bitwise_and
+        )
+
+    def __sub__(self, other):
+        # Chunks only in `other` cannot remove anything
+        highs = self.containers.keys()
+        result = {}
+        for high in highs:
+            if high not in other.containers:
+                result[high] = self.containers[high]
+        rest = self._combine(
+            other, highs & other.containers.keys(),
+            lambda a, b: np.setdiff1d(a, b, assume_unique=True), lambda a, b: a & ~b
+        )
+        result.update(rest.containers)
+        return UserBitmap(result)
+
+    def to_bytes(self):
+        # [high, kind, length] uint32 header then the payload, per container
+        out = []
+        for high, (kind, data) in sorted(self.containers.items()):
+            out.append(np.array([high, kind, len(data)], dtype='uint32').tobytes())
+            out.append(data.tobytes())
+        return b''.join(out)
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        containers = {}
+        pos = 0
+        while pos < len(buffer):
+            high, kind, length = np.frombuffer(buffer, dtype='uint32', count=3, offset=pos)
+            pos += 12
+            dtype = 'uint64' if kind == BITSET else 'uint16'
+            data = np.frombuffer(buffer, dtype=dtype, count=int(length), offset=pos)
+            pos += data.nbytes
+            containers[int(high)] = (int(kind), data)
+        return cls(containers)
+
+
+def union_all(bitmaps):
+    return reduce(lambda a, b: a | b, bitmaps, UserBitmap())
+
+
+def extend_codes(codes, user_ids):
+    # Appends the user ids not seen before, sorted, so they take the next free codes
+    new = pd.Index(pd.unique(user_ids)).difference(pd.Index(codes['user_id']))
+    if len(new):
+        codes = pd.concat([codes, pd.DataFrame({'user_id': np.asarray(new, dtype='int64')})], ignore_index=True)
+    return codes
+
+
+def build_bitmaps(df, codes):
+    # One row per (Month, dimension, value): the whole month plus each segment
+    df = df.dropna(subset=['user_id'])
+    user_code = pd.Series(np.arange(len(codes), dtype='uint32'), index=codes['user_id'].to_numpy())
+    frame = pd.DataFrame({
+        'Month': df['Date'].dt.to_period('M').astype(str).to_numpy(),
+        'code': user_code.reindex(df['user_id'].to_numpy('int64')).to_numpy(),
+    })
+    rows = []
+    for month, codes_in_month in frame.groupby('Month')['code']:
+        rows.append((month, ALL, ALL, UserBitmap.from_codes(codes_in_month.to_numpy())))
+    for dim in SEGMENT_DIMENSIONS:
+        if dim not in df.columns:
+            continue
+        frame['value'] = df[dim].astype(object).to_numpy()
+        for (month, value), group in frame.dropna(subset=['value']).groupby(['Month', 'value'])['code']:
+            rows.append((month, dim, str(value), UserBitmap.from_codes(group.to_numpy())))
+    return pd.DataFrame({
+        'Month': [r[0] for r in rows],
+        'dimension': [r[1] for r in rows],
+        'value': [r[2] for r in rows],
+        'users': [len(r[3]) for r in rows],
+        'bitmap': [r[3].to_bytes() for r in rows],
+    })
+
+
+def build_index(df):
+    codes = extend_codes(pd.DataFrame({'user_id': pd.Series(dtype='int64')}), df['user_id'].dropna().astype('int64'))
+    bitmaps = build_bitmaps(df, codes)
+    save_table(codes, CODES_TABLE)
+    save_table(bitmaps, BITMAP_TABLE)
+    return bitmaps
+
+
+def append_index(df):
+    # Incremental month append: existing users keep their codes
+    codes = extend_codes(load_table(CODES_TABLE), df['user_id'].dropna().astype('int64'))
+    bitmaps = build_bitmaps(df, codes)
+    save_table(codes, CODES_TABLE)
+    append_table(bitmaps, BITMAP_TABLE)
+    return bitmaps
+
+
+def load_user_index():
+    try:
+        return UserIndex()
+    except FileNotFoundError:
+        # Older runs have no bitmaps yet: build them in memory from the enriched rows
+        df = load_table('transactions_with_revenue_userinfo', columns=['user_id', 'Date'] + SEGMENT_DIMENSIONS)
+        codes = extend_codes(pd.DataFrame({'user_id': pd.Series(dtype='int64')}), df['user_id'].dropna().astype('int64'))
+        return UserIndex(build_bitmaps(df, codes))
+
+
+class UserIndex:
+    # Query side of the stored bitmaps; segment is None or a (dimension, value) pair
+
+    def __init__(self, bitmaps=None):
+        self.bitmaps = load_table(BITMAP_TABLE) if bitmaps is None else bitmaps
+        self._sets = {
+            (month, dim, value): blob
+            for month, dim, value, blob in zip(
+                self.bitmaps['Month'], self.bitmaps['dimension'], self.bitmaps['value'], self.bitmaps['bitmap']
+            )
+        }
+        self.months = sorted(self.bitmaps['Month'].unique())
+
+    def active(self, month, segment=None):
+        dim, value = segment or (ALL, ALL)
+        blob = self._sets.get((month, dim, str(value)))
+        return UserBitmap() if blob is None else UserBitmap.from_bytes(blob)
+
+    def active_between(self, first, last, segment=None):
+        return union_all(self.active(m, segment) for m in self.months if first <= m <= last)
+
+    def new(self, month, segment=None):
+        # Users whose first transaction ever falls in this month (Type_user == 'New')
+        new = self.active(month, ('Type_user', 'New'))
+        return new if segment is None else new & self.active(month, segment)
+
+    def returning(self, previous, month, segment=None):
+        return self.active(month, segment) & self.active(previous, segment)
+
+    def churned(self, previous, month, segment=None):
+        return self.active(previous, segment) - self.active(month, segment)
+
+    def reactivated(self, previous, month, segment=None):
+        # Active now, absent in `previous`, but active at some point before it
+        earlier = [m for m in self.months if m < previous]
+        if not earlier:
+            return UserBitmap()
+        lapsed = self.active(month, segment) - self.active(previous, segment)
+        return lapsed & self.active_between(earlier[0], earlier[-1], segment)
+
+    def month_flow(self, segment=None):
+        # Consecutive-month movement of the user base
+        rows = []
+        for previous, month in zip([None] + self.months[:-1], self.months):
+            row = {'Month': month, 'Active': len(self.active(month, segment)), 'New': len(self.new(month, segment))}
+            if previous is None:
+                row.update(Returning=0, Reactivated=0, Churned=0)
+            else:
+                row.update(
+                    Returning=len(self.returning(previous, month, segment)),
+                    Reactivated=len(self.reactivated(previous, month, segment)),
+                    Churned=len(self.churned(previous, month, segment)),
+                )
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the per-month user bitmaps and print the monthly user flow.')
+    parser.add_argument('--segment', nargs=2, metavar=('DIMENSION', 'VALUE'), help='e.g. --segment Age 23_to_27')
+    args = parser.parse_args()
+
+    df = load_table('transactions_with_revenue_userinfo', columns=['user_id', 'Date'] + SEGMENT_DIMENSIONS)
+    bitmaps = build_index(df)
+    size = bitmaps['bitmap'].map(len).sum()
+    print(f" User bitmaps saved: {len(bitmaps)} month/segment sets, {size / 1024:.1f} KiB")
+    print(UserIndex(bitmaps).month_flow(tuple(args.segment) if args.segment else None).to_string(index=False))
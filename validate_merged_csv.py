@@ -1,62 +1,44 @@
-import pandas as pd
+import argparse
 import sys
 
-CSV_PATH = 'data/master_merged.csv'
-
-CRITICAL_COLUMNS = ['transaction_id', 'user_id', 'Merchant_id']  # adjust as needed
-
-
-def main():
-    try:
-        df = pd.read_csv(CSV_PATH)
-    except Exception as e:
-        print(f"Failed to load CSV: {e}")
-        sys.exit(1)
-
-    print(f" Loaded {len(df)} rows, {len(df.columns)} columns.")
-
-    # 1. Check for missing values in critical columns
-    for col in CRITICAL_COLUMNS:
-        if col not in df.columns:
-            print(f" Critical column missing: {col}")
-        else:
-            missing = df[col].isna().sum()
-            if missing > 0:
-                print(f" {missing} missing values in critical column '{col}'")
-            else:
-                print(f" No missing values in '{col}'")
-
-    # 2. Check for duplicate rows on keys
-    if all(col in df.columns for col in CRITICAL_COLUMNS):
-        dups = df.duplicated(subset=CRITICAL_COLUMNS).sum()
-        if dups > 0:
-            print(f" {dups} duplicate rows found on {CRITICAL_COLUMNS}")
-        else:
-            print(f"No duplicate rows on {CRITICAL_COLUMNS}")
-
-    # 3. Check for all-null or constant columns
-    for col in df.columns:
-        if df[col].isnull().all():
-            print(f"  Column '{col}' is all nulls.")
-        elif df[col].nunique(dropna=True) == 1:
-            print(f" Column '{col}' is constant: {df[col].iloc[0]}")
-
-    # 4. Check for correct data types
-    for col in CRITICAL_COLUMNS:
-        if col in df.columns:
-            if df[col].dtype == object and df[col].str.strip().eq('').any():
-                print(f"Empty strings in column '{col}'")
-
-    # 5. Sanity check: row count > 0
-    if len(df) == 0:
-        print(" CSV has zero rows!")
-    else:
-        print(" CSV has data rows.")
-
-    # 6. Print sample for manual inspection
-    print("\nSample data:")
-    print(df.head(5).to_string())
+from validation import (
+    validate, write_report, print_report,
+    not_null, in_range, allowed_values, unique, foreign_key, date_not_before,
+)
+
+TABLE_NAME = 'master_merged'
+
+CRITICAL_COLUMNS = ['order_id', 'user_id', 'Merchant_id']
+
+RULES = [not_null(col) for col in CRITICAL_COLUMNS] + [
+    not_null('Date'),
+    not_null('Amount'),
+    unique('order_id', severity='warning'),
+    in_range('Amount', min=1),
+    in_range('Rate_pct', min=0, max=100),
+    foreign_key('Merchant_id', 'commission_final', 'Merchant_id'),
+    foreign_key('user_id', 'user_info_final', 'User_id'),
+    allowed_values('Purchase_status', ['Mua hộ']),
+    allowed_values('Gender', ['Male', 'Female']),
+    allowed_values('Location', ['HCMC', 'HN', 'Other', 'Unknown']),
+    allowed_values('Age', ['18_to_22', '23_to_27', '28_to_32', '33_to_37', '>37', 'unknown']),
+    date_not_before('Date', 'First_tran_date', severity='warning'),
+]
+
+
+def main(chunksize=None):
+    results = {TABLE_NAME: validate(TABLE_NAME, RULES, chunksize=chunksize)}
+    report, ok = write_report(TABLE_NAME, results)
+    print_report(report)
+    if results[TABLE_NAME].rows == 0:
+        print(f" {TABLE_NAME} has zero rows!")
+        ok = False
+    print(f"\n Validation {'passed' if ok else 'FAILED'}; report in data/validation/{TABLE_NAME}.json")
+    return ok
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=f'Validate {TABLE_NAME}.')
+    parser.add_argument('--chunksize', type=int, default=None, help='validate in chunks of this many rows')
+    args = parser.parse_args()
+    sys.exit(0 if main(args.chunksize) else 1)
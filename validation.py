@@ -0,0 +1,207 @@
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from storage import DATA_DIR, load_table, iter_table
+from dimension_index import DimensionIndex
+from instrumentation import span, iter_spans
+
+# Rule-based table validation.
+# A table's rules are declared once (see data_validation_checklist.py and
+# validate_merged_csv.py) and evaluated together: each rule is a vectorised
+# mask over the rows, reference tables are loaded once, and uniqueness keeps
+# the row hashes seen so far, so the same rules run over the whole table or
+# chunk by chunk for files that do not fit in memory. Results go to
+# data/validation/<name>.json and .csv; failed 'error' rules make the
+# validation scripts exit non-zero, which blocks their downstream stages in
+# run_pipeline.py. 'warning' rules are reported only.
+
+REPORT_DIR = os.path.join(DATA_DIR, 'validation')
+SAMPLE_SIZE = 5
+
+Rule = namedtuple('Rule', ['name', 'kind', 'columns', 'params', 'severity'])
+
+
+def not_null(column, severity='error'):
+    return Rule(f'not_null:{column}', 'not_null', (column,), {}, severity)
+
+
+def in_range(column, min=None, max=None, severity='error'):
+    return Rule(f'range:{column}', 'range', (column,), {'min': min, 'max': max}, severity)
+
+
+def allowed_values(column, values, severity='error'):
+    return Rule(f'allowed:{column}', 'allowed', (column,), {'values': list(values)}, severity)
+
+
+def unique(columns, severity='error'):
+    columns = (columns,) if isinstance(columns, str) else tuple(columns)
+    return Rule(f"unique:{'+'.join(columns)}", 'unique', columns, {}, severity)
+
+
+def foreign_key(column, ref_table, ref_column, severity='error'):
+    return Rule(f'fk:{column}->{ref_table}.{ref_column}', 'foreign_key', (column,),
+                {'table': ref_table, 'column': ref_column}, severity)
+
+
+def date_not_before(column, first_column, key=None, ref_table=None, ref_key=None, severity='error'):
+    # column >= first_column; first_column is read from ref_table (joined on
+    # key -> ref_key) when the frame itself does not carry it
+    return Rule(f'date_order:{column}>={first_column}', 'date_order', (column,),
+                {'first': first_column, 'key': key, 'table': ref_table, 'ref_key': ref_key}, severity)
+
+
+class Validator:
+
+    def __init__(self, rules, references=None):
+        # references: optional {table name: DataFrame} to use instead of loading
+        self.rules = rules
+        self.references = references or {}
+        self.rows = 0
+        self.failed = {rule.name: 0 for rule in rules}
+        self.checked = {rule.name: 0 for rule in rules}
+        self.samples = {rule.name: [] for rule in rules}
+        self._seen = {rule.name: np.zeros(0, dtype='uint64') for rule in rules if rule.kind == 'unique'}
+        self._lookups = {}
+
+    def _reference(self, table, columns):
+        ref = self.references.get(table)
+        if ref is None or any(c not in ref.columns for c in columns):
+            ref = load_table(table, columns=columns)
+            if table in self.references:
+                ref = self.references[table].join(ref.drop(columns=self.references[table].columns, errors='ignore'))
+            self.references[table] = ref
+        return ref
+
+    def _keys(self, rule):
+        # Index over the distinct keys of the referenced column, built once
+        if rule.name not in self._lookups:
+            column = rule.params['column']
+            ref = self._reference(rule.params['table'], [column])
+            self._lookups[rule.name] = DimensionIndex(ref[column].dropna().unique(), {}, name=column)
+        return self._lookups[rule.name]
+
+    def _first_dates(self, rule):
+        if rule.name not in self._lookups:
+            p = rule.params
+            ref = self._reference(p['table'], [p['ref_key'], p['first']])
+            ref = ref.drop_duplicates(subset=[p['ref_key']])
+            self._lookups[rule.name] = pd.Series(ref[p['first']].to_numpy(), index=ref[p['ref_key']].to_numpy())
+        return self._lookups[rule.name]
+
+    def _mask(self, rule, df):
+        # (rows checked, failing rows) for one rule over one chunk
+        col = df[rule.columns[0]] if rule.kind != 'unique' else None
+        if rule.kind == 'not_null':
+            return np.ones(len(df), bool), col.isna().to_numpy()
+        if rule.kind == 'unique':
+            subset = df[list(rule.columns)]
+            present = subset.notna().all(axis=1).to_numpy()
+            hashes = pd.util.hash_pandas_object(subset[present], index=False).to_numpy()
+            repeated = pd.Series(hashes).duplicated().to_numpy()
+            seen = self._seen[rule.name]
+            if len(seen):
+                pos = np.minimum(np.searchsorted(seen, hashes), len(seen) - 1)
+                repeated = repeated | (seen[pos] == hashes)
+            self._seen[rule.name] = np.union1d(seen, hashes)
+            failed = np.zeros(len(df), bool)
+            failed[np.flatnonzero(present)[repeated]] = True
+            return present, failed
+
+        present = col.notna().to_numpy()
+        if rule.kind == 'range':
+            values = col.to_numpy(dtype='float64', na_value=np.nan) if not pd.api.types.is_datetime64_any_dtype(col) else col
+            failed = np.zeros(len(df), bool)
+            if rule.params['min'] is not None:
+                failed |= np.asarray(values < rule.params['min'], dtype=bool)
+            if rule.params['max'] is not None:
+                failed |= np.asarray(values > rule.params['max'], dtype=bool)
+            return present, failed & present
+        if rule.kind == 'allowed':
+            return present, ~col.isin(rule.params['values']).to_numpy() & present
+        if rule.kind == 'foreign_key':
+            return present, (self._keys(rule).codes(col) < 0) & present
+        if rule.kind == 'date_order':
+            p = rule.params
+            if p['first'] in df.columns:
+                first = df[p['first']]
+            else:
+                first = self._first_dates(rule).reindex(df[p['key']].to_numpy())
+            first = pd.to_datetime(pd.Series(np.asarray(first), index=df.index), errors='coerce')
+            present = present & first.notna().to_numpy()
+            return present, (col < first).to_numpy() & present
+        raise ValueError(f"Unknown rule kind '{rule.kind}'")
+
+    def check(self, df):
+        for rule in self.rules:
+            missing = [c for c in rule.columns if c not in df.columns]
+            if missing:
+                raise KeyError(f"Rule {rule.name}: column(s) {missing} not in the table")
+            checked, failed = self._mask(rule, df)
+            self.checked[rule.name] += int(checked.sum())
+            self.failed[rule.name] += int(failed.sum())
+            room = SAMPLE_SIZE - len(self.samples[rule.name])
+            if room > 0 and failed.any():
+                rows = df.loc[failed, list(rule.columns)].head(room)
+                self.samples[rule.name] += [
+                    {'row': int(self.rows + i), **{c: str(v) for c, v in zip(rule.columns, values)}}
+                    for i, values in zip(np.flatnonzero(failed)[:room], rows.itertuples(index=False))
+                ]
+        self.rows += len(df)
+
+    def report(self):
+        return pd.DataFrame([
+            {
+                'rule': rule.name,
+                'kind': rule.kind,
+                'columns': ', '.join(rule.columns),
+                'severity': rule.severity,
+                'checked': self.checked[rule.name],
+                'failed': self.failed[rule.name],
+                'passed': self.failed[rule.name] == 0,
+            }
+            for rule in self.rules
+        ])
+
+
+def validate(table, rules, chunksize=None, references=None):
+    # Whole-table pass, or chunk by chunk when chunksize is given
+    validator = Validator(rules, references)
+    columns = sorted({c for rule in rules for c in rule.columns}
+                     | {rule.params['first'] for rule in rules if rule.kind == 'date_order' and rule.params['key'] is None}
+                     | {rule.params['key'] for rule in rules if rule.kind == 'date_order' and rule.params['key']})
+    with span(f'validate {table}') as s:
+        chunks = iter_table(table, chunksize, columns=columns) if chunksize else [load_table(table, columns=columns)]
+        for chunk in iter_spans(chunks, f'load {table}'):
+            with span(f'check {table}', rows_in=len(chunk)):
+                validator.check(chunk)
+        s.rows_in = validator.rows
+    return validator
+
+
+def write_report(name, results):
+    # results: {table: Validator}; returns True when no error rule failed
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    frames = [v.report().assign(table=table) for table, v in results.items()]
+    report = pd.concat(frames, ignore_index=True)[['table', 'rule', 'kind', 'columns', 'severity', 'checked', 'failed', 'passed']]
+    ok = not ((report['severity'] == 'error') & ~report['passed']).any()
+    report.to_csv(os.path.join(REPORT_DIR, f'{name}.csv'), index=False)
+    with open(os.path.join(REPORT_DIR, f'{name}.json'), 'w') as f:
+        json.dump({
+            'passed': bool(ok),
+            'tables': {table: {'rows': v.rows} for table, v in results.items()},
+            'rules': [
+                dict(row, samples=results[row['table']].samples[row['rule']])
+                for row in json.loads(report.to_json(orient='records'))
+            ],
+        }, f, indent=2)
+    return report, ok
+
+
+def print_report(report):
+    for row in report.itertuples(index=False):
+        mark = 'ok  ' if row.passed else ('FAIL' if row.severity == 'error' else 'warn')
+        print(f" {mark} {row.table:22} {row.rule:55} {row.failed:>7} / {row.checked}")
@@ -0,0 +1,102 @@
+import argparse
+import hashlib
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# One-pass, cached ingestion of the source workbook.
+# Parsing xlsx is the slowest step of a cleaning run, so the sheets are parsed
+# once per workbook version: the converted sheets are kept under
+# data/workbook_cache/<sha256 of the workbook>/ and a re-run against an
+# unchanged workbook reads them back without touching Excel at all.
+# On a miss the workbook is opened once (openpyxl read-only/streaming mode,
+# through pd.ExcelFile) and the sheets are parsed from that handle, or, with
+# several workers, one sheet per process. Sheets are cached as pickles: the raw
+# sheets have mixed-type columns (numbers and text in `amount`, for instance)
+# that the cleaning step must see exactly as read_excel returns them, which a
+# columnar format would coerce.
+
+CACHE_DIR = os.path.join('data', 'workbook_cache')
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sheet_path(key, sheet_name):
+    return os.path.join(CACHE_DIR, key, sheet_name.replace(' ', '_') + '.pkl')
+
+
+def _parse_sheet(path, sheet_name):
+    return pd.read_excel(path, sheet_name=sheet_name, engine='openpyxl')
+
+
+def parse_sheets(path, sheet_names, workers=1):
+    # {sheet: DataFrame} exactly as pd.read_excel returns them
+    if workers > 1 and len(sheet_names) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(sheet_names))) as pool:
+            frames = pool.map(_parse_sheet, [path] * len(sheet_names), sheet_names)
+            return dict(zip(sheet_names, frames))
+    with pd.ExcelFile(path, engine='openpyxl') as workbook:
+        return {name: workbook.parse(name) for name in sheet_names}
+
+
+def _store(frame, path):
+    # Written to a temp file first so an interrupted run never leaves a partial sheet
+    tmp = path + '.tmp'
+    frame.to_pickle(tmp)
+    os.replace(tmp, path)
+
+
+def _prune(keep):
+    # Only the current workbook version is kept
+    for entry in os.listdir(CACHE_DIR):
+        if entry != keep:
+            shutil.rmtree(os.path.join(CACHE_DIR, entry), ignore_errors=True)
+
+
+def cached_sheet(path, sheet_name):
+    # The cached parse of one sheet of this workbook version, None on a miss
+    cached = sheet_path(content_hash(path), sheet_name)
+    return pd.read_pickle(cached) if os.path.exists(cached) else None
+
+
+def read_sheets(path, sheet_names, workers=None, use_cache=True):
+    # {sheet: DataFrame}; Excel is only parsed for sheets not cached for this workbook version
+    workers = workers or min(len(sheet_names), os.cpu_count() or 1)
+    key = content_hash(path)
+    frames = {}
+    if use_cache:
+        for name in sheet_names:
+            if os.path.exists(sheet_path(key, name)):
+                frames[name] = pd.read_pickle(sheet_path(key, name))
+    missing = [name for name in sheet_names if name not in frames]
+    if missing:
+        frames.update(parse_sheets(path, missing, workers))
+        if use_cache:
+            os.makedirs(os.path.join(CACHE_DIR, key), exist_ok=True)
+            _prune(key)
+            for name in missing:
+                _store(frames[name], sheet_path(key, name))
+    return {name: frames[name] for name in sheet_names}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show or clear the parsed-workbook cache.')
+    parser.add_argument('--workbook', default='mini-Hackathon-question.xlsx')
+    parser.add_argument('--clear', action='store_true', help='remove every cached sheet')
+    args = parser.parse_args()
+
+    if args.clear:
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        print(f" Cleared {CACHE_DIR}")
+    key = content_hash(args.workbook)
+    directory = os.path.join(CACHE_DIR, key)
+    cached = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    print(f" {args.workbook}: sha256 {key[:12]}..., cached sheets: {cached or 'none'}")